@@ -0,0 +1,204 @@
+import hashlib
+import marshal
+import os
+import sys
+import time
+
+import parser
+import tokenizer
+from tokenizer import tokenize_stream
+from parser import parse
+
+# On-disk cache of parsed programs.
+#
+# The AST of a script is marshalled into __pycache__ next to the script, the
+# same place Python keeps .pyc files. A cache file holds
+#   the length of the header, as 4 little-endian bytes
+#   the marshalled header (version stamp, source path, mtime, size, sha256 of the source)
+#   the marshalled AST
+# so a stale entry is rejected without decoding the AST. load_compiled() caches
+# other compiled forms of a script the same way, under their own extension
+# (vm.py keeps its bytecode in <script>.<cache tag>.vm).
+
+
+def source_digest(modules):
+    digest = hashlib.sha256(f"{sys.implementation.cache_tag} {marshal.version}".encode())
+    for module in modules:
+        with open(module.__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+# changes whenever the tokenizer or parser (and so the shape of the AST) changes
+version_stamp = source_digest([tokenizer, parser])
+
+# a source modified this close to when its cache entry was written could have
+# been changed again without its mtime or size changing; check its content
+racy_seconds = 2
+
+
+class HashingReader:
+    """A binary file that keeps a sha256 of everything read from it."""
+
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.sha256.update(data)
+        return data
+
+    def hexdigest(self, chunk_size=65536):
+        """the digest of the whole file, reading whatever is left of it"""
+        while self.read(chunk_size):
+            pass
+        return self.sha256.hexdigest()
+
+
+def cache_path(path, kind="ast"):
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, "__pycache__", f"{name}.{sys.implementation.cache_tag}.{kind}")
+
+
+def read_cache(path, stat, kind="ast", expected_stamp=version_stamp):
+    """
+    Return the cached AST (or other kind of compiled form) for the source at
+    path, or None if there isn't a usable one.
+    """
+    try:
+        with open(cache_path(path, kind), "rb") as f:
+            written = os.fstat(f.fileno()).st_mtime_ns
+            data = memoryview(f.read())
+        header_end = 4 + int.from_bytes(data[:4], "little")
+        stamp, source_path, mtime_ns, size, digest = marshal.loads(data[4:header_end])
+        if stamp != expected_stamp or source_path != os.path.abspath(path):
+            return None
+        if (mtime_ns, size) != (stat.st_mtime_ns, stat.st_size) or (
+            written - mtime_ns < racy_seconds * 1_000_000_000
+        ):
+            with open(path, "rb") as source:
+                if HashingReader(source).hexdigest() != digest:
+                    return None
+        return marshal.loads(data[header_end:])
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def cache_data(header, ast):
+    header = marshal.dumps(header)
+    return len(header).to_bytes(4, "little") + header + marshal.dumps(ast)
+
+
+def write_cache(path, stat, digest, ast, kind="ast", stamp=version_stamp):
+    """Cache ast for the source at path, given the sha256 hex digest of the source."""
+    target = cache_path(path, kind)
+    header = (stamp, os.path.abspath(path), stat.st_mtime_ns, stat.st_size, digest)
+    # like .pyc files, a cache that can't be written is not an error
+    try:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temporary = f"{target}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(cache_data(header, ast))
+        os.replace(temporary, target)
+    except (OSError, ValueError):
+        pass
+
+
+def load_compiled(path, kind, stamp, compile):
+    """
+    Return compile(ast) for the script at path, from the cache when the
+    script hasn't changed since it was last compiled. The result must be
+    something marshal can store; stamp identifies the compiler that made it.
+    """
+    stat = os.stat(path)
+    compiled = read_cache(path, stat, kind, stamp)
+    if compiled is not None:
+        return compiled
+    # hash the source as the tokenizer streams it, rather than reading it whole
+    with open(path, "rb") as f:
+        source = HashingReader(f)
+        compiled = compile(parse(tokenize_stream(source)))
+        digest = source.hexdigest()
+    write_cache(path, stat, digest, compiled, kind, stamp)
+    return compiled
+
+
+def load_ast(path):
+    """
+    Parse the script at path, or load its AST from the cache when the script
+    hasn't changed since it was last parsed.
+    """
+    return load_compiled(path, "ast", version_stamp, lambda ast: ast)
+
+
+def test_load_ast():
+    print("testing load_ast...")
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "script.t")
+        with open(path, "w") as f:
+            f.write("x = 1; print x + 2")
+        expected = parse(tokenize_stream("x = 1; print x + 2"))
+        assert load_ast(path) == expected
+        assert os.path.exists(cache_path(path))
+        assert read_cache(path, os.stat(path)) == expected
+        # a changed script is parsed again, even with the same size and mtime
+        stat = os.stat(path)
+        with open(path, "w") as f:
+            f.write("y = 1; print y + 2")
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert read_cache(path, os.stat(path)) is None
+        assert load_ast(path) == parse(tokenize_stream("y = 1; print y + 2"))
+
+
+def test_cache_is_trusted_when_unchanged():
+    print("testing cache hits...")
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "script.t")
+        with open(path, "w") as f:
+            f.write("print 1")
+        old = time.time_ns() - 60 * 1_000_000_000
+        os.utime(path, ns=(old, old))
+        load_ast(path)
+        # with a settled mtime the content isn't read again: swap in a marker AST
+        stat = os.stat(path)
+        write_cache(path, stat, hashlib.sha256(b"print 1").hexdigest(), {"tag": "program", "statements": []})
+        assert load_ast(path) == {"tag": "program", "statements": []}
+        # an entry from another version of the parser is ignored
+        with open(cache_path(path), "rb") as f:
+            data = f.read()
+        header = marshal.loads(data[4:])
+        with open(cache_path(path), "wb") as f:
+            f.write(cache_data(("old",) + header[1:], {"tag": "program", "statements": []}))
+        assert load_ast(path) == parse(tokenize_stream("print 1"))
+
+
+def test_streamed_digest():
+    print("testing the digest of a streamed source...")
+    import io
+
+    source = ("x = 1; " * 50000).encode()
+    reader = HashingReader(io.BytesIO(source))
+    assert reader.read(10) == source[:10]
+    assert reader.hexdigest(chunk_size=1000) == hashlib.sha256(source).hexdigest()
+
+
+def test_missing_file():
+    print("testing a missing file...")
+    try:
+        load_ast("no such file.t")
+        assert False, "Expected FileNotFoundError"
+    except FileNotFoundError:
+        pass
+
+
+if __name__ == "__main__":
+    test_load_ast()
+    test_cache_is_trusted_when_unchanged()
+    test_streamed_digest()
+    test_missing_file()
+    print("done.")
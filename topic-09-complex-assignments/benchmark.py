@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+# Time the evaluation engines on a program (test-suite.t by default).
+#
+#   python benchmark.py [filename] [--repeat N]
+#
+# The cost per node is the run time divided by the number of nodes the tree
+# evaluator visits, so the engines are compared on the same amount of work.
+
+import argparse
+import contextlib
+import io
+import time
+from collections import Counter
+
+from astcache import load_ast
+
+import evaluator
+import runner
+
+
+def count_nodes(ast):
+    """
+    Evaluate ast with the tree evaluator, counting the nodes it visits by tag.
+    """
+    counts = Counter()
+    evaluate_node = evaluator.evaluate_node
+
+    def counting_evaluate(ast, environment):
+        counts[ast["tag"]] += 1
+        return evaluate_node(ast, environment)
+
+    # evaluate_node() calls itself through the module global, so this sees every
+    # node, as long as no node is quickened into reading its operands directly
+    quicken_after = evaluator.quicken_after
+    evaluator.evaluate_node = counting_evaluate
+    evaluator.quicken_after = float("inf")
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            evaluator.evaluate(ast, {})
+    finally:
+        evaluator.evaluate_node = evaluate_node
+        evaluator.quicken_after = quicken_after
+    return counts
+
+
+def best_time(evaluate, ast, repeat):
+    best = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            evaluate(ast, {})
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description="Time the evaluation engines on a program.")
+    argument_parser.add_argument("filename", nargs="?", default="test-suite.t")
+    argument_parser.add_argument("--repeat", type=int, default=20)
+    arguments = argument_parser.parse_args()
+
+    ast = load_ast(arguments.filename)
+    counts = count_nodes(ast)
+    nodes = sum(counts.values())
+    print(f"{arguments.filename}: {nodes} nodes evaluated")
+    for tag, count in counts.most_common():
+        print(f"    {tag:16} {count}")
+    for name, evaluate in runner.engines.items():
+        seconds = best_time(evaluate, ast, arguments.repeat)
+        print(f"{name:8} {seconds * 1000:8.2f} ms  {seconds * 1e9 / nodes:6.0f} ns/node")
+    print(f"tree engine: {evaluator.specializations.total()} nodes quickened, {evaluator.despecializations.total()} de-quickened")
+    for variant, count in evaluator.specializations.most_common():
+        print(f"    {variant:16} {count} (de-quickened {evaluator.despecializations[variant]})")
+
+
+if __name__ == "__main__":
+    main()
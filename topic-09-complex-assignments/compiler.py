@@ -0,0 +1,870 @@
+from tokenizer import tokenize
+from parser import parse
+from astcache import load_ast
+from evaluator import type_of, ast_to_string, evaluate_builtin_function, array_types, object_types, owned_item, Function, number_types, binary_operation
+from resolver import Frame, unbound, function_scope, program_scope, lookup, find
+import copy
+import operator
+
+# Compile an AST once into nested Python closures.
+#
+# compile_node(ast, scope) returns a function code(environment) -> value
+# that behaves like evaluator.evaluate(ast, environment). Each kind of node has
+# its own compile_<kind> function, which compiles the node's children up front,
+# so running the code never looks at a tag or an AST key again.
+#
+# Unlike evaluate(), code returns a plain value, not (value, status), so an
+# expression does no status bookkeeping at all. The statements that leave a
+# block early instead return a signal (a Return, or break_signal or
+# continue_signal) in place of their value, which only the statement lists,
+# loops and calls that can receive one check for. exit raises Exit, which
+# evaluate() turns back into (value, "exit").
+#
+# scope says what environment the code will run in (see resolver.py): the
+# program's dict, or the Frame of a function call, whose variables are read
+# and written by slot.
+
+# operators whose number-number case is the Python operator itself
+number_operators = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "<": operator.lt,
+    ">": operator.gt,
+    "<=": operator.le,
+    ">=": operator.ge,
+}
+
+# the same, where a zero right-hand side is left to binary_operation to report
+division_operators = {
+    "/": operator.truediv,
+    "%": operator.mod,
+}
+
+
+class Return:
+    """the signal of a return statement, carrying its value up to the call"""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class LoopSignal:
+    """the signal of a break or continue statement"""
+
+    __slots__ = ("tag",)
+
+    def __init__(self, tag):
+        self.tag = tag
+
+
+break_signal = LoopSignal("break")
+continue_signal = LoopSignal("continue")
+return_null = Return(None)
+signal_types = {Return, LoopSignal}
+
+
+class Exit(BaseException):
+    """
+    Raised by exit, and caught by evaluate(). It isn't an Exception, so an
+    import passes it on like the tree evaluator passes on the status.
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+
+def signals(ast):
+    """the tags of the statements whose signal can come out of ast"""
+    tag = ast["tag"]
+    if tag in ["return", "break", "continue"]:
+        return {tag}
+    if tag == "statement_list":
+        return set().union(*[signals(statement) for statement in ast["statements"]])
+    if tag == "if":
+        return signals(ast["then"]) | (signals(ast["else"]) if "else" in ast else set())
+    if tag == "while":
+        return signals(ast["do"]) - {"break", "continue"}
+    return set()
+
+
+def compiled_body(function, parent=None):
+    """
+    (code, scope) for the body of a function (a function value or AST),
+    defined in the scope parent when that is known.
+    """
+    scope = function_scope(function["parameters"], function["body"], parent)
+    return compile_node(function["body"], scope), scope
+
+
+def body_code(function):
+    """
+    (code, scope) for the body of a function value: the one its function
+    literal was compiled with, or, for a value another engine made, compiled
+    the first time it is called.
+    """
+    if type(function) is not Function:
+        return compiled_body(function)
+    if function.compiled is None:
+        function.compiled = {}
+    entry = function.compiled.get("compiler")
+    if entry is None:
+        entry = function.compiled["compiler"] = compiled_body(function)
+    return entry
+
+
+def compile_literal(ast, scope):
+    value = ast["value"]
+
+    def code(environment):
+        return value
+
+    return code
+
+
+def compile_null(ast, scope):
+    def code(environment):
+        return None
+
+    return code
+
+
+def outer_environment(environment, hops):
+    """
+    The environment len(hops) levels out from a Frame, or the first dict
+    environment on the way (a function value made by another engine has one).
+    """
+    for _ in hops:
+        environment = environment.parent
+        if type(environment) is not Frame:
+            break
+    return environment
+
+
+def compile_identifier(ast, scope):
+    identifier = ast["value"]
+    depth, slot = scope.address(identifier)
+    hops = range(depth)
+
+    if slot is None and depth == 0:
+        # a dict environment
+        def code(environment):
+            if identifier in environment:
+                return environment[identifier]
+            return lookup(identifier, environment)
+
+        return code
+
+    if slot is None:
+        # not a local of an enclosing function: search from the first dict environment out
+        def code(environment):
+            environment = outer_environment(environment, hops)
+            if type(environment) is dict and identifier in environment:
+                return environment[identifier]
+            return lookup(identifier, environment)
+
+        return code
+
+    if depth == 0:
+        def code(environment):
+            value = environment.slots[slot]
+            if value is unbound:
+                return lookup(identifier, environment.parent)
+            return value
+
+        return code
+
+    def code(environment):
+        environment = outer_environment(environment, hops)
+        if type(environment) is not Frame:
+            return lookup(identifier, environment)
+        value = environment.slots[slot]
+        if value is unbound:
+            return lookup(identifier, environment.parent)
+        return value
+
+    return code
+
+
+def compile_list(ast, scope):
+    items = [compile_node(item, scope) for item in ast["items"]]
+
+    def code(environment):
+        return [item(environment) for item in items]
+
+    return code
+
+
+def compile_object(ast, scope):
+    items = [(compile_node(item["key"], scope), compile_node(item["value"], scope)) for item in ast["items"]]
+
+    def code(environment):
+        object = {}
+        for key_code, value_code in items:
+            key = key_code(environment)
+            assert type(key) is str, "Object key must be a string"
+            object[key] = value_code(environment)
+        return object
+
+    return code
+
+
+def compile_binary(ast, scope):
+    tag = ast["tag"]
+    left = compile_node(ast["left"], scope)
+    right = compile_node(ast["right"], scope)
+    number_operator = number_operators.get(tag)
+
+    if number_operator:
+        def code(environment):
+            left_value = left(environment)
+            right_value = right(environment)
+            if type(left_value) in number_types and type(right_value) in number_types:
+                return number_operator(left_value, right_value)
+            return binary_operation(tag, left_value, right_value)
+
+        return code
+
+    division_operator = division_operators.get(tag)
+
+    if division_operator:
+        def code(environment):
+            left_value = left(environment)
+            right_value = right(environment)
+            if type(left_value) in number_types and type(right_value) in number_types and right_value != 0:
+                return division_operator(left_value, right_value)
+            return binary_operation(tag, left_value, right_value)
+
+        return code
+
+    def code(environment):
+        left_value = left(environment)
+        return binary_operation(tag, left_value, right(environment))
+
+    return code
+
+
+# is_truthy(value) is bool(value) for every value a program can make, so
+# conditions below are tested by Python directly
+
+
+def compile_and(ast, scope):
+    left = compile_node(ast["left"], scope)
+    right = compile_node(ast["right"], scope)
+
+    def code(environment):
+        left_value = left(environment)
+        if not left_value:
+            return left_value
+        return bool(right(environment))
+
+    return code
+
+
+def compile_or(ast, scope):
+    left = compile_node(ast["left"], scope)
+    right = compile_node(ast["right"], scope)
+
+    def code(environment):
+        left_value = left(environment)
+        if left_value:
+            return left_value
+        return bool(right(environment))
+
+    return code
+
+
+def compile_negation(ast, scope):
+    operand = compile_node(ast["value"], scope)
+
+    def code(environment):
+        value = operand(environment)
+        types = type_of(value)
+        if types == "number":
+            return -value
+        raise Exception(f"Illegal type for negate:{types}")
+
+    return code
+
+
+def compile_not(ast, scope):
+    operand = compile_node(ast["value"], scope)
+
+    def code(environment):
+        return not operand(environment)
+
+    return code
+
+
+def compile_print(ast, scope):
+    if not ast["value"]:
+        def code(environment):
+            print()
+            return None
+
+        return code
+
+    operand = compile_node(ast["value"], scope)
+
+    def code(environment):
+        value = operand(environment)
+        if type(value) is bool:
+            value = "true" if value else "false"
+        print(str(value))
+        return str(value)
+
+    return code
+
+
+def compile_assert(ast, scope):
+    if not ast["condition"]:
+        return compile_null(ast, scope)
+    condition_ast = ast["condition"]
+    condition = compile_node(condition_ast, scope)
+    explanation = None
+    if "explanation" in ast and ast["explanation"]:
+        explanation = compile_node(ast["explanation"], scope)
+
+    def code(environment):
+        if not condition(environment):
+            error_msg = f"Assertion failed: {ast_to_string(condition_ast)}"
+            if explanation is None:
+                raise Exception(error_msg)
+            raise Exception(f"{error_msg} ({explanation(environment)})")
+        return None
+
+    return code
+
+
+def compile_if(ast, scope):
+    condition = compile_node(ast["condition"], scope)
+    then = compile_node(ast["then"], scope)
+    otherwise = compile_node(ast["else"], scope) if "else" in ast else compile_null(ast, scope)
+
+    if not signals(ast):
+        def code(environment):
+            if condition(environment):
+                then(environment)
+            else:
+                otherwise(environment)
+            return None
+
+        return code
+
+    def code(environment):
+        if condition(environment):
+            value = then(environment)
+        else:
+            value = otherwise(environment)
+        if type(value) in signal_types:
+            return value
+        return None
+
+    return code
+
+
+def compile_while(ast, scope):
+    condition = compile_node(ast["condition"], scope)
+    body = compile_node(ast["do"], scope)
+
+    if not signals(ast["do"]):
+        def code(environment):
+            while condition(environment):
+                body(environment)
+            return None
+
+        return code
+
+    def code(environment):
+        while condition(environment):
+            value = body(environment)
+            if type(value) in signal_types:
+                if value is break_signal:
+                    break
+                if value is not continue_signal:
+                    return value
+        return None
+
+    return code
+
+
+def compile_statement_list(ast, scope):
+    """code for a block, which returns a signal or None (the value of a block isn't used)"""
+    statements = [compile_node(statement, scope) for statement in ast["statements"]]
+
+    if not signals(ast):
+        def code(environment):
+            for statement in statements:
+                statement(environment)
+            return None
+
+        return code
+
+    def code(environment):
+        for statement in statements:
+            value = statement(environment)
+            if type(value) in signal_types:
+                return value
+        return None
+
+    return code
+
+
+def compile_program(ast, scope):
+    statements = [compile_node(statement, scope) for statement in ast["statements"]]
+
+    def code(environment):
+        value = None
+        for statement in statements:
+            value = statement(environment)
+            if type(value) in signal_types:
+                if type(value) is Return:
+                    raise Exception("'return' statement outside of function.")
+                raise Exception(f"'{value.tag}' statement outside of loop.")
+        return value
+
+    return code
+
+
+def compile_function(ast, scope):
+    parameters = ast["parameters"]
+    body = ast["body"]
+    compiled = {"compiler": compiled_body(ast, scope)}
+
+    def code(environment):
+        return Function(parameters, body, environment, compiled)
+
+    return code
+
+
+def compile_call(ast, scope):
+    function_code = compile_node(ast["function"], scope)
+    arguments = [compile_node(argument, scope) for argument in ast["arguments"]]
+
+    def code(environment):
+        function = function_code(environment)
+        argument_values = [argument(environment) for argument in arguments]
+        if function.get("tag") == "builtin":
+            return evaluate_builtin_function(function["name"], argument_values)[0]
+        body, body_scope = body_code(function)
+        if body_scope.resolved:
+            slots = [unbound] * len(body_scope.names)
+            for slot, value in zip(body_scope.parameters, argument_values):
+                slots[slot] = value
+            local_environment = Frame(slots, function["environment"], body_scope)
+        else:
+            local_environment = {
+                name["value"]: value
+                for name, value in zip(function["parameters"], argument_values)
+            }
+            local_environment["$parent"] = function["environment"]
+        signal = body(local_environment)
+        if signal is None:
+            return None
+        if type(signal) is Return:
+            return signal.value
+        raise Exception(f"'{signal.tag}' statement propagated out of function call.")
+
+    return code
+
+
+def compile_complex(ast, scope):
+    base_code = compile_node(ast["base"], scope)
+    index_code = compile_node(ast["index"], scope)
+    index_ast = ast["index"]
+
+    def code(environment):
+        base = base_code(environment)
+        index = index_code(environment)
+        if index is None:
+            raise Exception(f"TypeError: Cannot index with 'null'. Base: {base}, Index AST: {ast_to_string(index_ast)}")
+        if type(index) in [int, float]:
+            assert int(index) == index
+            assert type(base) in array_types
+            if not (0 <= index < len(base)): raise IndexError("List index out of range")
+            return owned_item(base, index)
+        if type(index) == str:
+            assert type(base) in object_types
+            if index not in base: raise KeyError(f"Key '{index}' not found in object")
+            return owned_item(base, index)
+        assert False, f"Unknown index type [{index}]"
+
+    return code
+
+
+def compile_assign(ast, scope):
+    target = ast["target"]
+    value_code = compile_node(ast["value"], scope)
+
+    if target["tag"] == "identifier":
+        name = target["value"]
+        if not target.get("extern") and scope.resolved:
+            slot = scope.names[name]
+
+            def code(environment):
+                value = environment.slots[slot] = value_code(environment)
+                return value
+
+            return code
+
+        if not target.get("extern"):
+            def code(environment):
+                value = environment[name] = value_code(environment)
+                return value
+
+            return code
+
+        depth, slot = scope.address(name)
+        hops = range(depth)
+
+        def code(environment):
+            if slot is None:
+                container, key = find(name, outer_environment(environment, hops))
+            else:
+                frame = outer_environment(environment, hops)
+                if type(frame) is Frame and frame.slots[slot] is not unbound:
+                    container, key = frame.slots, slot
+                else:
+                    container, key = find(name, frame if type(frame) is not Frame else frame.parent)
+            value = container[key] = value_code(environment)
+            return value
+
+        return code
+
+    assert target["tag"] == "complex", f"Cannot assign to [{target['tag']}]"
+    base_code = compile_node(target["base"], scope)
+    index_ast = target["index"]
+    index_code = compile_node(index_ast, scope)
+
+    def code(environment):
+        base = base_code(environment)
+        index = index_code(environment)
+        if index is None: raise Exception("Cannot use 'null' as index for assignment.")
+        assert type(index) in [int, float, str], f"Unknown index type [{index}]"
+        if isinstance(base, array_types):
+            assert isinstance(index, int), "List index must be integer"
+            assert 0 <= index < len(base), "List index out of range"
+        elif not isinstance(base, dict):
+            assert False, f"Cannot assign to base of type {type(base)}"
+        value = base[index] = value_code(environment)
+        return value
+
+    return code
+
+
+def compile_return(ast, scope):
+    if "value" not in ast or ast["value"] is None:
+        def code(environment):
+            return return_null
+
+        return code
+
+    value_code = compile_node(ast["value"], scope)
+
+    def code(environment):
+        return Return(value_code(environment))
+
+    return code
+
+
+def compile_exit(ast, scope):
+    if "value" not in ast or ast["value"] is None:
+        def code(environment):
+            raise Exit(0)
+
+        return code
+
+    value_code = compile_node(ast["value"], scope)
+
+    def code(environment):
+        value = value_code(environment)
+        assert isinstance(value, int), "Exit code must be an integer."
+        raise Exit(value)
+
+    return code
+
+
+def compile_break(ast, scope):
+    def code(environment):
+        return break_signal
+
+    return code
+
+
+def compile_continue(ast, scope):
+    def code(environment):
+        return continue_signal
+
+    return code
+
+
+def compile_forget(ast, scope):
+    names = ast["names"]
+    if scope.resolved:
+        slots = [scope.names[name] for name in names if name in scope.names]
+
+        def code(environment):
+            for slot in slots:
+                environment.slots[slot] = unbound
+
+        return code
+
+    def code(environment):
+        for name in names:
+            environment.pop(name, None)
+
+    return code
+
+
+def compile_import(ast, scope):
+    filename_code = compile_node(ast["value"], scope)
+
+    def code(environment):
+        filename_val = filename_code(environment)
+        assert isinstance(filename_val, str), "Import path must be a string."
+        try:
+            imported_ast = load_ast(filename_val)
+            # a function that imports has a dict environment too
+            return compile_node(imported_ast, program_scope)(environment)
+        except FileNotFoundError:
+            raise Exception(f"ImportError: File not found '{filename_val}'")
+        except Exception as e:
+            raise Exception(f"Error during import of '{filename_val}': {e}")
+
+    return code
+
+
+compilers = {
+    "number": compile_literal,
+    "boolean": compile_literal,
+    "string": compile_literal,
+    "null": compile_null,
+    "list": compile_list,
+    "object": compile_object,
+    "identifier": compile_identifier,
+    "negate": compile_negation,
+    "&&": compile_and,
+    "and": compile_and,
+    "||": compile_or,
+    "or": compile_or,
+    "!": compile_not,
+    "not": compile_not,
+    "print": compile_print,
+    "assert": compile_assert,
+    "if": compile_if,
+    "while": compile_while,
+    "statement_list": compile_statement_list,
+    "program": compile_program,
+    "function": compile_function,
+    "call": compile_call,
+    "complex": compile_complex,
+    "assign": compile_assign,
+    "return": compile_return,
+    "exit": compile_exit,
+    "break": compile_break,
+    "continue": compile_continue,
+    "import": compile_import,
+    "forget": compile_forget,
+}
+for tag in ["+", "-", "*", "/", "%", "<", ">", "<=", ">=", "==", "!="]:
+    compilers[tag] = compile_binary
+
+
+def compile_node(ast, scope):
+    compiler = compilers.get(ast["tag"])
+    assert compiler, f"Unknown tag [{ast['tag']}] in AST"
+    return compiler(ast, scope)
+
+
+def evaluate(ast, environment):
+    """
+    Compile ast and run it in environment, returning (value, status) like evaluator.evaluate.
+    """
+    code = compile_node(ast, program_scope)
+    try:
+        return code(environment), None
+    except Exit as e:
+        return e.value, "exit"
+
+
+def same_as_evaluator(code, environment=None):
+    import evaluator
+
+    expected_environment = {} if environment is None else copy.deepcopy(environment)
+    environment = {} if environment is None else environment
+    expected = evaluator.evaluate(parse(tokenize(code)), expected_environment)
+    result = evaluate(parse(tokenize(code)), environment)
+    assert result == expected, f"{code}: got {result}, expected {expected}"
+    return result
+
+
+def test_expressions():
+    print("testing expressions...")
+    for code in [
+        "4", "4.2", '"x"', "null", "true", "1+2*3", "(3+2)*2", "8/4/2", "7%3", "--3",
+        '"a"+"b"', '"ab"*2', "[1,2]+[3]", '{"a":1}+{"b":2}', "1<2", "2>=3", "1==1", "1!=1",
+        "1 < 2.5", "!0", "0 && x", "1 || x", "1 && 2", "0 || 0",
+        "[1,[2,3]][1][0]", '{"a":{"b":4}}.a.b',
+        "head([1,2,3])", "tail([1,2,3])", "length(\"hello\")", 'keys({"a":1})',
+    ]:
+        same_as_evaluator(code)
+    assert evaluate(parse(tokenize("x + y")), {"x": 1, "$parent": {"y": 2}}) == (3, None)
+
+
+def test_statements():
+    print("testing statements...")
+    for code in [
+        "x=1; while(x<5) {x=x+1}; y=3",
+        "if(0) {x=1} else {x=2}",
+        "if(1) {x=1}",
+        "x=0; while(1) {x=x+1; if(x>3){break}}; x",
+        "x=0; y=0; while(x<5) {x=x+1; if(x%2){continue}; y=y+x}; y",
+        "a=[1,2,3]; a[1]=5; a",
+        'o={"a":1}; o.b=2; o["c"]=3; o',
+        "a=b=4",
+        "print 1+1",
+        "print",
+        "assert 1",
+        "exit 12",
+        "exit",
+        "if(1){exit 3}; print 4",
+    ]:
+        same_as_evaluator(code)
+
+
+def test_functions():
+    print("testing functions...")
+    for code in [
+        "function f(x) { if (x > 1) { return 123 }; return 2+2 }; f(7) + f(0)",
+        "function f() { return }; f()",
+        "function f() { 1 }; f()",
+        "x = 1; function f() { extern x = 2 }; f(); x",
+        "x = 1; foo = function() { return x }; bar = function() { x = 2; return foo() }; bar()",
+        """
+        function makeCounter() {
+            count = 0;
+            return function() { extern count = count + 1; return count }
+        };
+        c1 = makeCounter(); c2 = makeCounter();
+        [c1(), c1(), c2(), c1()]
+        """,
+        "function f() { while(1) { return 5 } }; f()",
+        "function f() { exit 7 }; f(); print 1",
+        "function fib(n) { if (n < 2) { return n }; return fib(n-1) + fib(n-2) }; fib(15)",
+    ]:
+        same_as_evaluator(code)
+    # a function value is the same dict the tree evaluator makes
+    environment = {}
+    evaluate(parse(tokenize("function f(x) { 1 }")), environment)
+    assert environment["f"]["body"] == {"tag": "statement_list", "statements": [{"tag": "number", "value": 1}]}
+    assert environment["f"]["environment"] is environment
+    # its code comes with it, shared by the values made from one literal
+    evaluate(parse(tokenize("function g() { return function() { 1 } }; h = g(); k = g()")), environment)
+    assert environment["h"].compiled is environment["k"].compiled
+    assert environment["h"].compiled["compiler"][1].resolved
+    # a value made by another engine keeps the code it is compiled to when called
+    import evaluator
+
+    evaluator.evaluate(parse(tokenize("function twice(x) { return x * 2 }")), environment)
+    assert evaluate(parse(tokenize("twice(4) + twice(5)")), environment) == (18, None)
+    assert list(environment["twice"].compiled) == ["compiler"]
+    # and a closure made in a compiled function can be called by every other engine
+    import machine
+    import vm
+    import transpiler
+
+    environment = {}
+    evaluate(parse(tokenize("function mk(a) { return function() { extern a = a + 1; return a } }; g = mk(5)")), environment)
+    for count, engine in enumerate([evaluator, machine, vm, transpiler]):
+        assert engine.evaluate(parse(tokenize("g()")), environment) == (6 + count, None), engine.__name__
+
+
+def test_signals():
+    print("testing signals...")
+    for code in [
+        "function f() { i = 0; while (1) { i = i + 1; if (i > 3) { return i } } }; f()",
+        "function f() { i = 0; while (i < 9) { i = i + 1; if (i % 2) { continue } else { if (i > 5) { break } } }; return i }; f()",
+        "function f(n) { while (1) { while (1) { return n } } }; f(8)",
+        "function f() { if (0) { return 1 } else if (1) { return 2 } }; f()",
+        "function f() { if (0) { return 1 } }; f()",
+        "function f() { return 1; print 2 }; f()",
+        "function f(x) { return x * 2 }; f(1) + f(2) * f(3)",
+        "function f() { exit 5 }; x = [1, f()]; print x",
+        "i = 0; while (1) { i = i + 1; if (i == 2) { break } }; i",
+        "if (1) { 5 }",
+        "x = 1",
+    ]:
+        same_as_evaluator(code)
+    assert signals(parse(tokenize("while (1) { break; continue; if (1) { return } }"))["statements"][0]) == {"return"}
+
+
+def test_lexical_addressing():
+    print("testing lexical addressing...")
+    import os
+    import tempfile
+
+    for code in [
+        # a local's slot is unbound until it is assigned
+        "x = 1; function f() { a = x; x = 2; return [a, x] }; [f(), x]",
+        "x = 1; function f(c) { if (c) { x = 2 }; return x }; [f(0), f(1)]",
+        # missing arguments are found outside, like in the tree evaluator
+        "x = 5; function f(x) { return x }; f()",
+        "function f(a, a) { return a }; f(1, 2)",
+        # several levels out, through closures
+        """
+        function outer(a) {
+            b = a + 1;
+            return function(c) { return function() { extern b = b + 1; return [a, b, c] } }
+        };
+        g = outer(1)(3); [g(), g()]
+        """,
+        "function f() { function g() { return y }; y = 4; return g() }; f()",
+        "y = 1; function f() { function g() { return y }; z = g(); y = 4; return [z, g()] }; f()",
+    ]:
+        same_as_evaluator(code)
+    # functions made by the tree evaluator have dict environments
+    import evaluator
+    environment = {}
+    evaluator.evaluate(parse(tokenize("x = 2; function f(a) { return function() { return a * x } }")), environment)
+    assert evaluate(parse(tokenize("f(21)()")), environment) == (42, None)
+    # a function that imports keeps a dict environment, which the import fills in
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "library.t")
+        with open(path, "w") as f:
+            f.write("z = 7")
+        same_as_evaluator(f'function f() {{ import "{path}"; return function() {{ return z }} }}; f()()')
+
+
+def test_errors():
+    print("testing errors...")
+    for code, message in [
+        ("return 1", "'return' statement outside of function"),
+        ("break", "'break' statement outside of loop"),
+        ("function f() { break }; f()", "'break' statement propagated out of function call"),
+        ("y", "Unknown identifier: 'y'"),
+        ("1 - \"a\"", "Illegal types for -:number-string"),
+        ("1 / 0", "Division by zero"),
+        ("1 % 0", "Modulo using zero"),
+        ("true + 1", "Illegal types for +: boolean-number"),
+        ("-\"a\"", "Illegal type for negate:string"),
+        ("assert 1 == 2, \"nope\"", "Assertion failed: (1==2) (nope)"),
+        ("extern z = 1", "Extern assignment: 'z' not found in any outer scope"),
+        ('import "no such file.t"', "ImportError: File not found 'no such file.t'"),
+    ]:
+        try:
+            evaluate(parse(tokenize(code)), {})
+            assert False, f"{code} should fail"
+        except Exception as e:
+            assert message in str(e), f"{code}: {e}"
+
+
+if __name__ == "__main__":
+    test_expressions()
+    test_statements()
+    test_functions()
+    test_signals()
+    test_lexical_addressing()
+    test_errors()
+    print("done.")
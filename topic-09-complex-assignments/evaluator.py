@@ -1,7 +1,253 @@
 from tokenizer import tokenize
 from parser import parse
+from astcache import load_ast
+from validator import trust, validate
 from pprint import pprint
-import copy
+from collections import Counter
+import operator
+
+class ListView:
+    """
+    An array made by tail() or +: the items of buffer from start up to stop.
+
+    Views share buffers instead of copying them. Once a buffer is shared the
+    items it holds never change: assigning an item of a shared view first
+    copies the part it covers into a buffer of its own. The only change is
+    appending past the end, which views that stop earlier don't see, so
+    x + [item] extends x's buffer in place when x ends where the buffer does.
+    That needs the items themselves to be frozen (see frozen() below), which
+    items_frozen records.
+    """
+
+    __slots__ = ("buffer", "start", "stop", "shared", "items_frozen")
+
+    def __init__(self, buffer, start, stop, shared, items_frozen=False):
+        self.buffer = buffer
+        self.start = start
+        self.stop = stop
+        self.shared = shared
+        self.items_frozen = items_frozen
+
+    def tail(self):
+        self.shared = True
+        return ListView(self.buffer, min(self.start + 1, self.stop), self.stop, True, self.items_frozen)
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if type(index) is slice:
+            return list(self)[index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("list index out of range")
+        return self.buffer[self.start + index]
+
+    def __setitem__(self, index, value):
+        if self.shared:
+            self.buffer = self.buffer[self.start:self.stop]
+            self.start, self.stop, self.shared = 0, len(self.buffer), False
+        self.buffer[self.start + index] = value
+        if type(value) in mutable_types:
+            self.items_frozen = False
+
+    def __iter__(self):
+        buffer = self.buffer
+        for index in range(self.start, self.stop):
+            yield buffer[index]
+
+    def __eq__(self, other):
+        if isinstance(other, array_types):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+# + doesn't copy the arrays and objects inside its operands either: the new
+# value holds frozen copies of them, which nothing ever assigns to. Freezing
+# an array or object that is frozen already (or a view whose items are) is
+# free, so each value is copied at most once however often it is added to.
+# Reading a frozen item out of an array or object that isn't frozen thaws it:
+# the container gets a copy of its own that may be assigned to, stored in
+# place of the frozen one so that every later read sees the same value. A
+# program therefore only ever holds values that aren't frozen, and + gives
+# them value semantics as if both operands had been deep-copied.
+
+class FrozenList(ListView):
+    """
+    An array inside the result of +, whose items are frozen too.
+    """
+
+    __slots__ = ()
+
+
+class FrozenObject(dict):
+    """
+    An object inside the result of +, whose values are frozen too.
+    """
+
+    __slots__ = ()
+
+
+class Function(dict):
+    """
+    A function value: {"tag": "function", "parameters", "body", "environment"}.
+    compiled holds what engines have compiled the body to, by engine, outside
+    the value itself, so it is neither printed nor compared and goes away with
+    the value. The values made from one function literal share it.
+    """
+
+    __slots__ = ("compiled",)
+
+    def __init__(self, parameters, body, environment, compiled=None):
+        super().__init__(tag="function", parameters=parameters, body=body, environment=environment)
+        self.compiled = compiled
+
+
+# the Python types of arrays and objects
+array_types = (list, ListView, FrozenList)
+object_types = (dict, FrozenObject, Function)
+
+# the types of the values that frozen() copies
+mutable_types = (list, ListView, dict)
+
+def frozen(value):
+    """
+    value, or a frozen copy of it if it is an array or object that isn't frozen.
+    """
+    value_type = type(value)
+    if value_type is dict:
+        if value.get("tag") in ["function", "builtin"]:
+            return value
+        return FrozenObject({key: frozen(item) for key, item in value.items()})
+    if value_type is ListView and value.items_frozen:
+        value.shared = True
+        return FrozenList(value.buffer, value.start, value.stop, True, True)
+    if value_type is list or value_type is ListView:
+        buffer = [frozen(item) for item in value]
+        return FrozenList(buffer, 0, len(buffer), False, True)
+    return value
+
+def thawed(value):
+    """
+    A copy of a frozen array or object that may be assigned to.
+    """
+    if type(value) is FrozenObject:
+        return dict(value)
+    return ListView(value.buffer, value.start, value.stop, True, True)
+
+def owned_item(container, key):
+    """
+    container[key], thawing it in place first if it is frozen.
+    """
+    value = container[key]
+    if type(value) is FrozenList or type(value) is FrozenObject:
+        value = container[key] = thawed(value)
+    return value
+
+def concatenate(left, right):
+    """
+    left + right for arrays: a view that shares left's buffer if it can.
+    """
+    if type(left) is ListView and left.items_frozen and left.stop == len(left.buffer):
+        left.buffer.extend([frozen(item) for item in right])
+        left.shared = True
+        return ListView(left.buffer, left.start, len(left.buffer), True, True)
+    left_items = left if type(left) is ListView and left.items_frozen else map(frozen, left)
+    buffer = [*left_items, *map(frozen, right)]
+    return ListView(buffer, 0, len(buffer), False, True)
+
+def merge(left, right):
+    """
+    left + right for objects: a new object, with frozen copies of the values of both.
+    """
+    return {**{key: frozen(value) for key, value in left.items()}, **{key: frozen(value) for key, value in right.items()}}
+
+
+# Binary operators dispatch on (type(left), type(right)): the table of each
+# operator maps the pairs of Python types it accepts to the function that
+# computes it, so checking the types costs one dict lookup.
+
+number_types = {int, float}
+
+# the Python types of each type a program sees, as type_of names them
+python_types = {
+    "boolean": [bool],
+    "number": [int, float],
+    "string": [str],
+    "array": list(array_types),
+    "object": list(object_types),
+    "null": [type(None)],
+}
+
+def operation_table(operations):
+    """
+    the dispatch table for {"left_type-right_type": function}
+    """
+    table = {}
+    for types, function in operations.items():
+        left, right = types.split("-")
+        for left_type in python_types[left]:
+            for right_type in python_types[right]:
+                table[left_type, right_type] = function
+    return table
+
+def divide(left_value, right_value):
+    assert right_value != 0, "Division by zero"
+    return left_value / right_value
+
+def modulo(left_value, right_value):
+    assert right_value != 0, "Modulo using zero"
+    return left_value % right_value
+
+def comparison_table(function):
+    return operation_table({"number-number": function, "string-string": function})
+
+binary_operations = {
+    "+": operation_table({
+        "number-number": operator.add,
+        "string-string": operator.add,
+        "object-object": merge,
+        "array-array": concatenate,
+    }),
+    "-": operation_table({"number-number": operator.sub}),
+    "*": operation_table({
+        "number-number": operator.mul,
+        "string-number": lambda left_value, right_value: left_value * int(right_value),
+        "number-string": lambda left_value, right_value: int(left_value) * right_value,
+    }),
+    "/": operation_table({"number-number": divide}),
+    "%": operation_table({"number-number": modulo}),
+    "<": comparison_table(operator.lt),
+    ">": comparison_table(operator.gt),
+    "<=": comparison_table(operator.le),
+    ">=": comparison_table(operator.ge),
+}
+
+def illegal_types(tag, left_value, right_value):
+    # + and the comparisons have always put a space after the colon
+    separator = ": " if tag in ["+", "<", ">", "<=", ">="] else ":"
+    return Exception(f"Illegal types for {tag}{separator}{type_of(left_value, right_value)}")
+
+def binary_operation(tag, left_value, right_value):
+    """
+    the value of left_value <tag> right_value, for tags that always evaluate both sides
+    """
+    if tag == "==":
+        return left_value == right_value
+    if tag == "!=":
+        return left_value != right_value
+    operations = binary_operations.get(tag)
+    assert operations is not None, f"Unknown binary operator [{tag}]"
+    operation = operations.get((type(left_value), type(right_value)))
+    if operation is None:
+        raise illegal_types(tag, left_value, right_value)
+    return operation(left_value, right_value)
 
 def type_of(*args):
     def single_type(x):
@@ -11,7 +257,7 @@ def type_of(*args):
             return "number"
         if isinstance(x, str):
             return "string"
-        if isinstance(x, list):
+        if isinstance(x, array_types):
             return "array"
         if isinstance(x, dict):
             return "object"
@@ -23,7 +269,7 @@ def type_of(*args):
 def is_truthy(x):
     if x in [None, False, 0, 0.0, ""]:
         return False
-    if isinstance(x, (list, dict)) and len(x) == 0:
+    if isinstance(x, (list, ListView, dict)) and len(x) == 0:
         return False
     return True
 
@@ -52,7 +298,7 @@ def ast_to_string(ast):
         return "{" + ",".join(items) + "}"
     if ast["tag"] == "identifier":
         return str(ast["value"])
-    if ast["tag"] in ["+","-","/","*","&&","||","and","or","<",">","<=",">=","==","!="]:
+    if ast["tag"] in ["+","-","/","*","%","&&","||","and","or","<",">","<=",">=","==","!="]:
         return  "(" + ast_to_string(ast["left"]) + ast["tag"] + ast_to_string(ast["right"]) + ")"
     if ast["tag"] in ["negate"]:
         return  "(-" + ast_to_string(ast["value"]) + ")"
@@ -78,6 +324,7 @@ def ast_to_string(ast):
 
     if ast["tag"] == "while":
         s = "while (" + ast_to_string(ast["condition"]) + ") {" + ast_to_string(ast["do"]) + "}"
+        return s
 
     if ast["tag"] == "statement_list":
         items = []
@@ -130,6 +377,8 @@ def ast_to_string(ast):
         return "continue"
     if ast["tag"] == "import":
         return "import " + ast_to_string(ast["value"])
+    if ast["tag"] == "forget":
+        return "forget " + ",".join(ast["names"])
 
     assert False, f"Unknown tag [{ast['tag']}] in AST"
 
@@ -139,15 +388,18 @@ __builtin_functions = [
 
 def evaluate_builtin_function(function_name, args):
     if function_name == "head":
-        assert len(args) == 1 and isinstance(args[0], list), "head() requires a single list argument"
-        return (args[0][0] if args[0] else None), None
+        assert len(args) == 1 and isinstance(args[0], array_types), "head() requires a single list argument"
+        return (owned_item(args[0], 0) if args[0] else None), None
 
     if function_name == "tail":
-        assert len(args) == 1 and isinstance(args[0], list), "tail() requires a single list argument"
-        return args[0][1:], None
+        assert len(args) == 1 and isinstance(args[0], array_types), "tail() requires a single list argument"
+        if type(args[0]) is ListView:
+            return args[0].tail(), None
+        # the one copy of a walk over the list: the tails of this view are views too
+        return ListView(list(args[0]), min(1, len(args[0])), len(args[0]), False), None
 
     if function_name == "length":
-        assert len(args) == 1 and isinstance(args[0], (list, dict, str)), "length() requires list, object, or string"
+        assert len(args) == 1 and isinstance(args[0], (list, ListView, dict, str)), "length() requires list, object, or string"
         return len(args[0]), None
 
     if function_name == "keys":
@@ -160,294 +412,415 @@ def evaluate_builtin_function(function_name, args):
 
     assert False, f"Unknown builtin function '{function_name}'"
 
-def evaluate(ast, environment):
-    if ast["tag"] == "number":
-        assert type(ast["value"]) in [
-            float,
-            int,
-        ], f"unexpected type {type(ast["value"])}"
-        return ast["value"], None
-    if ast["tag"] == "boolean":
-        assert ast["value"] in [
-            True,
-            False,
-        ], f"unexpected type {type(ast["value"])}"
-        return ast["value"], None
-    if ast["tag"] == "string":
-        assert type(ast["value"]) == str, f"unexpected type {type(ast["value"])}"
-        return ast["value"], None
-    if ast["tag"] == "null":
-        return None, None
-    if ast["tag"] == "list":
-        items = []
-        for item in ast["items"]:
-            result, item_status = evaluate(item, environment)
-            if item_status == "exit": # Propagate exit if an item evaluation causes it
-                return result, "exit"
-            items.append(result)
-        return items, None        
-    if ast["tag"] == "object":
-        object = {}
-        for item in ast["items"]:
-            key, key_status = evaluate(item["key"], environment)
-            if key_status == "exit": return key, "exit"
-            assert type(key) is str, "Object key must be a string"
-            value, value_status = evaluate(item["value"], environment)
-            if value_status == "exit": return value, "exit"
-            object[key] = value
-        return object, None        
+def builtin_function(identifier):
+    if identifier in __builtin_functions:
+        return {"tag": "builtin", "name": identifier}
+    raise Exception(f"Unknown identifier: '{identifier}'")
+
+
+class Environment:
+    """
+    A scope: the variables assigned in it, and the environment it is in.
+    """
+
+    __slots__ = ("variables", "parent")
+
+    def __init__(self, variables, parent=None):
+        self.variables = variables
+        self.parent = parent
+
+    @staticmethod
+    def of(environment):
+        """
+        An Environment for a dict environment with an optional "$parent" key,
+        as passed to evaluate(). Assignments go to the dicts themselves.
+        """
+        if type(environment) is Environment:
+            return environment
+        parent = environment.get("$parent")
+        return Environment(environment, None if parent is None else Environment.of(parent))
+
+    def lookup(self, identifier):
+        environment = self
+        while environment is not None:
+            variables = environment.variables
+            if identifier in variables:
+                return variables[identifier]
+            environment = environment.parent
+        return builtin_function(identifier)
+
+    def extern_scope(self, identifier):
+        """the nearest environment that has identifier, for extern assignment"""
+        environment = self
+        while environment is not None and identifier not in environment.variables:
+            environment = environment.parent
+        assert environment is not None, f"Extern assignment: '{identifier}' not found in any outer scope"
+        return environment
+
+    # the dict environment protocol, for the other engines calling functions defined here
+
+    def __contains__(self, identifier):
+        return identifier in self.variables or (identifier == "$parent" and self.parent is not None)
+
+    def __getitem__(self, identifier):
+        if identifier == "$parent" and identifier not in self.variables:
+            return self.parent
+        return self.variables[identifier]
+
+    def __setitem__(self, identifier, value):
+        self.variables[identifier] = value
+
+    def get(self, identifier, default=None):
+        return self[identifier] if identifier in self else default
+
+    def __repr__(self):
+        if self.parent is None or "$parent" in self.variables:
+            return repr(self.variables)
+        return repr({**self.variables, "$parent": self.parent})
+
+
+def evaluate_literal(ast, environment):
+    # the tree is trusted, so the type of the value has been checked
+    return ast["value"], None
+
+
+def evaluate_null(ast, environment):
+    return None, None
+
+
+def evaluate_list(ast, environment):
+    items = []
+    for item in ast["items"]:
+        result, item_status = evaluate_node(item, environment)
+        if item_status == "exit": # Propagate exit if an item evaluation causes it
+            return result, "exit"
+        items.append(result)
+    return items, None        
+
+
+def evaluate_object(ast, environment):
+    object = {}
+    for item in ast["items"]:
+        key, key_status = evaluate_node(item["key"], environment)
+        if key_status == "exit": return key, "exit"
+        assert type(key) is str, "Object key must be a string"
+        value, value_status = evaluate_node(item["value"], environment)
+        if value_status == "exit": return value, "exit"
+        object[key] = value
+    return object, None        
+
+
+def evaluate_identifier(ast, environment):
+    identifier = ast["value"]
+    variables = environment.variables
+    if identifier in variables:
+        return variables[identifier], None
+    return environment.lookup(identifier), None
+
+
+# Quickening: a binary operator node that sees the same pair of operand types
+# quicken_after times in a row is specialized: it gets a handler of its own
+# that applies the operation for that pair (int-add for + on two ints, say)
+# behind a check of the two types, and reads operands that are variables or
+# literals directly instead of going through evaluate_node. When the check
+# fails the node goes back to the general path and starts counting again.
+# The state of the nodes is kept by id, with the node itself so its id isn't
+# reused, in a table that lasts for one run of evaluate(): the AST stays as
+# other engines (and a printed function value) show it, and nothing outlives
+# the run.
 
+quicken_after = 8
+
+# by id: [node, left type, right type, times seen in a row, specialized
+# handler], for the current run of evaluate(); None outside of one
+inline_caches = None
+
+# the trees validated in the current run of evaluate(), by id; None outside of one
+trusted_trees = None
+
+# nodes specialized and de-specialized, by operator and types ("+ int-int")
+specializations = Counter()
+despecializations = Counter()
+
+
+def operand_reader(ast):
+    """
+    a function of the environment giving the value of a variable or literal
+    operand, or None for other nodes
+    """
+    if ast["tag"] in ["number", "string"]:
+        value = ast["value"]
+        return lambda environment: value
     if ast["tag"] == "identifier":
-        identifier = ast["value"]
-        if identifier in environment:
-            return environment[identifier], None
-        if "$parent" in environment:
-            return evaluate(ast, environment["$parent"])
-        if identifier in __builtin_functions:
-            return {"tag": "builtin", "name": identifier}, None
-        raise Exception(f"Unknown identifier: '{identifier}'")
-    
-    if ast["tag"] == "+":
-        left_value, l_status = evaluate(ast["left"], environment)
-        if l_status == "exit": return left_value, "exit"
-        right_value, r_status = evaluate(ast["right"], environment)
-        if r_status == "exit": return right_value, "exit"
-        types = type_of(left_value, right_value)
-        if types == "number-number":
-            return left_value + right_value, None
-        if types == "string-string":
-            return left_value + right_value, None
-        if types == "object-object":
-            # Ensure no deepcopy issues if objects contain shared mutable structures from environment
-            return {**copy.deepcopy(left_value), **copy.deepcopy(right_value)}, None
-        if types == "array-array":
-            return copy.deepcopy(left_value) + copy.deepcopy(right_value), None
-        raise Exception(f"Illegal types for {ast['tag']}: {types}")
-    if ast["tag"] == "-":
-        left_value, l_status = evaluate(ast["left"], environment)
-        if l_status == "exit": return left_value, "exit"
-        right_value, r_status = evaluate(ast["right"], environment)
-        if r_status == "exit": return right_value, "exit"
-        types = type_of(left_value, right_value)
-        if types == "number-number":
-            return left_value - right_value, None
-        raise Exception(f"Illegal types for {ast["tag"]}:{types}")
-
-    if ast["tag"] == "*":
-        left_value, l_status = evaluate(ast["left"], environment)
-        if l_status == "exit": return left_value, "exit"
-        right_value, r_status = evaluate(ast["right"], environment)
-        if r_status == "exit": return right_value, "exit"
-        types = type_of(left_value, right_value)
-        if types == "number-number":
-            return left_value * right_value, None
-        if types == "string-number":
-            return left_value * int(right_value), None
-        if types == "number-string":
-            return int(left_value) * right_value, None # Corrected order
-        raise Exception(f"Illegal types for {ast['tag']}:{types}")
-
-    if ast["tag"] == "/":
-        left_value, l_status = evaluate(ast["left"], environment)
-        if l_status == "exit": return left_value, "exit"
-        right_value, r_status = evaluate(ast["right"], environment)
-        if r_status == "exit": return right_value, "exit"
-        types = type_of(left_value, right_value)
-        if types == "number-number":
-            assert right_value != 0, "Division by zero"
-            return left_value / right_value, None
-        raise Exception(f"Illegal types for {ast['tag']}:{types}")
-    
-    if ast["tag"] == "%":
-        left_value, l_status = evaluate(ast["left"], environment)
-        if l_status == "exit": return left_value, "exit"
-        right_value, r_status = evaluate(ast["right"], environment)
-        if r_status == "exit": return right_value, "exit"
-        types = type_of(left_value, right_value)
-        if types == "number-number":
-            assert right_value != 0, "Modulo using zero"
-            return left_value % right_value, None
-        raise Exception(f"Illegal types for {ast['tag']}:{types}")
-
-    if ast["tag"] == "negate":
-        value, status = evaluate(ast["value"], environment)
-        if status == "exit": return value, "exit"
-        types = type_of(value)
-        if types == "number":
-            return -value, None
-        raise Exception(f"Illegal type for {ast['tag']}:{types}")
-
-    if ast["tag"] in ["&&", "and"]:
-        left_value, l_status = evaluate(ast["left"], environment)
-        if l_status == "exit": return left_value, "exit"
-        # Short-circuit evaluation for 'and'
-        if not is_truthy(left_value):
-            return left_value, None # Or False, depending on desired semantics for 'and'
-        right_value, r_status = evaluate(ast["right"], environment)
-        if r_status == "exit": return right_value, "exit"
-        return is_truthy(left_value) and is_truthy(right_value), None
-
-    if ast["tag"] in ["||", "or"]:
-        left_value, l_status = evaluate(ast["left"], environment)
-        if l_status == "exit": return left_value, "exit"
-        # Short-circuit evaluation for 'or'
-        if is_truthy(left_value):
-            return left_value, None # Or True, depending on desired semantics for 'or'
-        right_value, r_status = evaluate(ast["right"], environment)
-        if r_status == "exit": return right_value, "exit"
-        return is_truthy(left_value) or is_truthy(right_value), None
-
-    if ast["tag"] in ["!", "not"]:
-        value, status = evaluate(ast["value"], environment)
-        if status == "exit": return value, "exit"
-        return not is_truthy(value), None
-
-    if ast["tag"] in ["<", ">", "<=", ">="]:
-        left_value, l_status = evaluate(ast["left"], environment)
-        if l_status == "exit": return left_value, "exit"
-        right_value, r_status = evaluate(ast["right"], environment)
-        if r_status == "exit": return right_value, "exit"
-        types = type_of(left_value, right_value)
-        if types not in ["number-number", "string-string"]:
-            raise Exception(f"Illegal types for {ast['tag']}: {types}")
-        if ast["tag"] == "<":
-            return left_value < right_value, None
-        if ast["tag"] == ">":
-            return left_value > right_value, None
-        if ast["tag"] == "<=":
-            return left_value <= right_value, None
-        if ast["tag"] == ">=":
-            return left_value >= right_value, None
-
-    if ast["tag"] == "==":
-        left_value, l_status = evaluate(ast["left"], environment)
-        if l_status == "exit": return left_value, "exit"
-        right_value, r_status = evaluate(ast["right"], environment)
-        if r_status == "exit": return right_value, "exit"
-        return left_value == right_value, None
-    
-    if ast["tag"] == "!=":
-        left_value, l_status = evaluate(ast["left"], environment)
-        if l_status == "exit": return left_value, "exit"
-        right_value, r_status = evaluate(ast["right"], environment)
-        if r_status == "exit": return right_value, "exit"
-        return left_value != right_value, None
+        name = ast["value"]
 
-    if ast["tag"] == "print":
-        if ast["value"]:
-            value, status = evaluate(ast["value"], environment)
-            if status == "exit": return value, "exit"
-            if type(value) is bool:
-                if value == True:
-                    value = "true"
-                if value == False:
-                    value = "false"
-            print(str(value))
-            return str(value), None # Return the printed value, not with newline
-        else:
-            print()
-        return None, None # Print with no args returns None
+        def read(environment):
+            variables = environment.variables
+            if name in variables:
+                return variables[name]
+            return environment.lookup(name)
 
-    if ast["tag"] == "assert":
-        if ast["condition"]:
-            condition_value, cond_status = evaluate(ast["condition"], environment)
-            if cond_status == "exit": return condition_value, "exit"
-            if not is_truthy(condition_value):
-                error_msg = f"Assertion failed: {ast_to_string(ast['condition'])}"
-                if "explanation" in ast and ast["explanation"]:
-                    explanation_val, expl_status = evaluate(ast["explanation"], environment)
-                    if expl_status == "exit": return explanation_val, "exit"
-                    error_msg += f" ({explanation_val})"
-                raise Exception(error_msg)
-        return None, None # Assert statement itself doesn't produce a value
+        return read
+    return None
 
-    if ast["tag"] == "if":
-        condition_value, cond_status = evaluate(ast["condition"], environment)
-        if cond_status == "exit": return condition_value, "exit"
 
-        if is_truthy(condition_value):
-            val, status = evaluate(ast["then"], environment)
-            if status: # Propagate "return", "exit", "break", "continue"
-                return val, status
+def specialize(ast, left_type, right_type, operation):
+    left_ast, right_ast = ast["left"], ast["right"]
+    read_left, read_right = operand_reader(left_ast), operand_reader(right_ast)
+
+    def evaluate_specialized(environment):
+        if read_left:
+            left_value = read_left(environment)
+        else:
+            left_value, l_status = evaluate_node(left_ast, environment)
+            if l_status == "exit": return left_value, "exit"
+        if read_right:
+            right_value = read_right(environment)
         else:
-            if "else" in ast:
-                val, status = evaluate(ast["else"], environment)
-                if status: # Propagate "return", "exit", "break", "continue"
-                    return val, status
-        return None, None # Normal completion of if/else
+            right_value, r_status = evaluate_node(right_ast, environment)
+            if r_status == "exit": return right_value, "exit"
+        if type(left_value) is left_type and type(right_value) is right_type:
+            return operation(left_value, right_value), None
+        return apply_binary(ast, left_value, right_value)
 
-    if ast["tag"] == "while":
-        # Condition is evaluated in the current environment
-        condition_value, cond_status = evaluate(ast["condition"], environment)
-        if cond_status == "exit": return condition_value, "exit"
+    return evaluate_specialized
 
-        while is_truthy(condition_value):
-            val, body_status = evaluate(ast["do"], environment)
-
-            if body_status == "return" or body_status == "exit":
-                return val, body_status # Propagate critical exits
-            if body_status == "break":
-                break # Exit the while loop, loop completes normally
-            if body_status == "continue":
-                # Re-evaluate condition and continue to next iteration
-                condition_value, cond_status = evaluate(ast["condition"], environment)
-                if cond_status == "exit": return condition_value, "exit"
-                continue # Continue to next iteration of while
-            
-            # If body completed normally (status is None), re-evaluate condition
-            condition_value, cond_status = evaluate(ast["condition"], environment)
-            if cond_status == "exit": return condition_value, "exit"
-        return None, None # Normal loop termination (condition false or break occurred)
 
-    if ast["tag"] == "statement_list":
-        last_value = None
-        for statement in ast["statements"]:
-            last_value, status = evaluate(statement, environment)
-            if status: # "return", "exit", "break", "continue"
-                return last_value, status
-        return last_value, None # All statements completed normally
+def apply_binary(ast, left_value, right_value):
+    """
+    the general path of a binary operator node, counting towards quickening it
+    """
+    tag = ast["tag"]
+    left_type = type(left_value)
+    right_type = type(right_value)
+    operation = binary_operations[tag].get((left_type, right_type))
+    cache = inline_caches.get(id(ast))
+    if cache is None or cache[0] is not ast:
+        inline_caches[id(ast)] = [ast, left_type, right_type, 1, None]
+    elif cache[1] is left_type and cache[2] is right_type:
+        cache[3] += 1
+        # (a node can already be specialized here, by a recursive call made while
+        # evaluating its operands on the general path)
+        if cache[4] is None and cache[3] >= quicken_after and operation is not None:
+            cache[4] = specialize(ast, left_type, right_type, operation)
+            specializations[f"{tag} {left_type.__name__}-{right_type.__name__}"] += 1
+    else:
+        if cache[4] is not None:
+            despecializations[f"{tag} {cache[1].__name__}-{cache[2].__name__}"] += 1
+        cache[1:] = [left_type, right_type, 1, None]
+    if operation is None:
+        raise illegal_types(tag, left_value, right_value)
+    return operation(left_value, right_value), None
+
+
+def evaluate_binary(ast, environment):
+    cache = inline_caches.get(id(ast))
+    if cache is not None and cache[4] is not None and cache[0] is ast:
+        return cache[4](environment)
+    left_value, l_status = evaluate_node(ast["left"], environment)
+    if l_status == "exit": return left_value, "exit"
+    right_value, r_status = evaluate_node(ast["right"], environment)
+    if r_status == "exit": return right_value, "exit"
+    return apply_binary(ast, left_value, right_value)
+
+
+def evaluate_negation(ast, environment):
+    value, status = evaluate_node(ast["value"], environment)
+    if status == "exit": return value, "exit"
+    types = type_of(value)
+    if types == "number":
+        return -value, None
+    raise Exception(f"Illegal type for {ast['tag']}:{types}")
+
+
+def evaluate_and(ast, environment):
+    left_value, l_status = evaluate_node(ast["left"], environment)
+    if l_status == "exit": return left_value, "exit"
+    # Short-circuit evaluation for 'and'
+    if not is_truthy(left_value):
+        return left_value, None # Or False, depending on desired semantics for 'and'
+    right_value, r_status = evaluate_node(ast["right"], environment)
+    if r_status == "exit": return right_value, "exit"
+    return is_truthy(left_value) and is_truthy(right_value), None
+
+
+def evaluate_or(ast, environment):
+    left_value, l_status = evaluate_node(ast["left"], environment)
+    if l_status == "exit": return left_value, "exit"
+    # Short-circuit evaluation for 'or'
+    if is_truthy(left_value):
+        return left_value, None # Or True, depending on desired semantics for 'or'
+    right_value, r_status = evaluate_node(ast["right"], environment)
+    if r_status == "exit": return right_value, "exit"
+    return is_truthy(left_value) or is_truthy(right_value), None
+
+
+def evaluate_not(ast, environment):
+    value, status = evaluate_node(ast["value"], environment)
+    if status == "exit": return value, "exit"
+    return not is_truthy(value), None
+
+
+def evaluate_equal(ast, environment):
+    left_value, l_status = evaluate_node(ast["left"], environment)
+    if l_status == "exit": return left_value, "exit"
+    right_value, r_status = evaluate_node(ast["right"], environment)
+    if r_status == "exit": return right_value, "exit"
+    return left_value == right_value, None
+
+
+def evaluate_not_equal(ast, environment):
+    left_value, l_status = evaluate_node(ast["left"], environment)
+    if l_status == "exit": return left_value, "exit"
+    right_value, r_status = evaluate_node(ast["right"], environment)
+    if r_status == "exit": return right_value, "exit"
+    return left_value != right_value, None
+
+
+def evaluate_print(ast, environment):
+    if ast["value"]:
+        value, status = evaluate_node(ast["value"], environment)
+        if status == "exit": return value, "exit"
+        if type(value) is bool:
+            if value == True:
+                value = "true"
+            if value == False:
+                value = "false"
+        print(str(value))
+        return str(value), None # Return the printed value, not with newline
+    else:
+        print()
+    return None, None # Print with no args returns None
 
-    if ast["tag"] == "program":
-        last_value = None
-        for statement in ast["statements"]:
-            val, status = evaluate(statement, environment)
-            if status:
-                if status == "return":
-                    raise Exception("'return' statement outside of function.")
-                if status in ["break", "continue"]:
-                    raise Exception(f"'{status}' statement outside of loop.")
-                return val, status # Propagate "exit"
-            last_value = val
-        return last_value, None # Program completed normally
 
-    if ast["tag"] == "function":
-        return {
-            "tag": "function",
-            "parameters": ast["parameters"],
-            "body": ast["body"],
-            "environment": environment
-        }, None # Function definition itself is a normal evaluation
+def evaluate_assert(ast, environment):
+    if ast["condition"]:
+        condition_value, cond_status = evaluate_node(ast["condition"], environment)
+        if cond_status == "exit": return condition_value, "exit"
+        if not is_truthy(condition_value):
+            error_msg = f"Assertion failed: {ast_to_string(ast['condition'])}"
+            if "explanation" in ast and ast["explanation"]:
+                explanation_val, expl_status = evaluate_node(ast["explanation"], environment)
+                if expl_status == "exit": return explanation_val, "exit"
+                error_msg += f" ({explanation_val})"
+            raise Exception(error_msg)
+    return None, None # Assert statement itself doesn't produce a value
+
+
+def evaluate_if(ast, environment):
+    condition_value, cond_status = evaluate_node(ast["condition"], environment)
+    if cond_status == "exit": return condition_value, "exit"
+
+    if is_truthy(condition_value):
+        val, status = evaluate_node(ast["then"], environment)
+        if status: # Propagate "return", "exit", "break", "continue"
+            return val, status
+    else:
+        if "else" in ast:
+            val, status = evaluate_node(ast["else"], environment)
+            if status: # Propagate "return", "exit", "break", "continue"
+                return val, status
+    return None, None # Normal completion of if/else
 
-    if ast["tag"] == "call":
-        function, func_status = evaluate(ast["function"], environment)
-        if func_status == "exit": return function, "exit"
-        argument_values = []
-        for arg in ast["arguments"]:
-            arg_val, arg_status = evaluate(arg, environment)
-            if arg_status == "exit": return arg_val, "exit"
-            argument_values.append(arg_val)
+
+def evaluate_while(ast, environment):
+    # Condition is evaluated in the current environment
+    condition_value, cond_status = evaluate_node(ast["condition"], environment)
+    if cond_status == "exit": return condition_value, "exit"
+
+    while is_truthy(condition_value):
+        val, body_status = evaluate_node(ast["do"], environment)
+
+        if body_status in ["return", "tail_call", "exit"]:
+            return val, body_status # Propagate critical exits
+        if body_status == "break":
+            break # Exit the while loop, loop completes normally
+        if body_status == "continue":
+            # Re-evaluate condition and continue to next iteration
+            condition_value, cond_status = evaluate_node(ast["condition"], environment)
+            if cond_status == "exit": return condition_value, "exit"
+            continue # Continue to next iteration of while
+        
+        # If body completed normally (status is None), re-evaluate condition
+        condition_value, cond_status = evaluate_node(ast["condition"], environment)
+        if cond_status == "exit": return condition_value, "exit"
+    return None, None # Normal loop termination (condition false or break occurred)
+
+
+def evaluate_statement_list(ast, environment):
+    last_value = None
+    for statement in ast["statements"]:
+        last_value, status = evaluate_node(statement, environment)
+        if status: # "return", "exit", "break", "continue"
+            return last_value, status
+    return last_value, None # All statements completed normally
+
+
+def evaluate_program(ast, environment):
+    last_value = None
+    for statement in ast["statements"]:
+        val, status = evaluate_node(statement, environment)
+        if status == "tail_call":
+            # the value of the return is still computed, for its effects
+            val, status = call_function(*val)
+            if status == "exit": return val, "exit"
+            status = "return"
+        if status:
+            if status == "return":
+                raise Exception("'return' statement outside of function.")
+            if status in ["break", "continue"]:
+                raise Exception(f"'{status}' statement outside of loop.")
+            return val, status # Propagate "exit"
+        last_value = val
+    return last_value, None # Program completed normally
+
+
+def evaluate_function(ast, environment):
+    return Function(ast["parameters"], ast["body"], environment), None # Function definition itself is a normal evaluation
+
+
+def evaluate_call_target(ast, environment):
+    """
+    The function and argument values of a call ast, as ((function, arguments), None),
+    or (value, "exit") if evaluating one of them exits.
+    """
+    function, func_status = evaluate_node(ast["function"], environment)
+    if func_status == "exit": return function, "exit"
+    argument_values = []
+    for arg in ast["arguments"]:
+        arg_val, arg_status = evaluate_node(arg, environment)
+        if arg_status == "exit": return arg_val, "exit"
+        argument_values.append(arg_val)
+    return (function, argument_values), None
+
+
+def evaluate_call(ast, environment):
+    target, status = evaluate_call_target(ast, environment)
+    if status == "exit": return target, "exit"
+    return call_function(*target)
+
+
+def call_function(function, argument_values):
+    # a body ending in "return g(...)" hands back g and its arguments with the
+    # status "tail_call", and the loop calls g in place of returning, so a chain
+    # of tail calls uses one Python frame and keeps no environment alive
+    while True:
         if function.get("tag") == "builtin":
             return evaluate_builtin_function(function["name"], argument_values)
-        
-        # regular function call:
-        local_environment = {
+
+        variables = {
             name["value"]: val
             for name, val in zip(function["parameters"], argument_values)
         }
-        local_environment["$parent"] = function["environment"]
-        val, status = evaluate(function["body"], local_environment)
-
-        if status == "return":
+        parent = Environment.of(function["environment"])
+        # after the parameters, where printing the environment has always shown it
+        variables["$parent"] = parent
+        local_environment = Environment(variables, parent)
+        val, status = evaluate_node(function["body"], local_environment)
+
+        if status == "tail_call":
+            function, argument_values = val
+        elif status == "return":
             return val, None # Consume "return" status, call evaluates to the value
         elif status == "exit":
             return val, "exit" # Propagate "exit"
@@ -456,121 +829,202 @@ def evaluate(ast, environment):
         else: # Normal function completion without explicit return (status is None)
             return None, None
 
-    if ast["tag"] == "complex":
-        base, base_status = evaluate(ast["base"], environment)
+
+def evaluate_complex(ast, environment):
+    base, base_status = evaluate_node(ast["base"], environment)
+    if base_status == "exit": return base, "exit"
+    index, index_status = evaluate_node(ast["index"], environment)
+    if index_status == "exit": return index, "exit"
+
+    if index is None: # index evaluated to null
+        raise Exception(f"TypeError: Cannot index with 'null'. Base: {base}, Index AST: {ast_to_string(ast['index'])}")
+    if type(index) in [int, float]:
+        assert int(index) == index
+        assert type(base) in array_types
+        if not (0 <= index < len(base)): raise IndexError("List index out of range")
+        return owned_item(base, index), None
+    if type(index) == str:
+        assert type(base) in object_types
+        if index not in base: raise KeyError(f"Key '{index}' not found in object")
+        return owned_item(base, index), None
+    assert False, f"Unknown index type [{index}]"
+
+
+def evaluate_assign(ast, environment):
+    target = ast["target"]
+
+    if target["tag"] == "identifier":
+        name = target["value"]
+
+        if target.get("extern"):
+            target_base = environment.extern_scope(name).variables
+        else:
+            # Always assign to local scope
+            target_base = environment.variables
+
+        target_index = name
+
+    elif target["tag"] == "complex":
+        base, base_status = evaluate_node(target["base"], environment)
         if base_status == "exit": return base, "exit"
-        index, index_status = evaluate(ast["index"], environment)
-        if index_status == "exit": return index, "exit"
-
-        if index is None: # index evaluated to null
-            raise Exception(f"TypeError: Cannot index with 'null'. Base: {base}, Index AST: {ast_to_string(ast['index'])}")
-        if type(index) in [int, float]:
-            assert int(index) == index
-            assert type(base) == list
-            if not (0 <= index < len(base)): raise IndexError("List index out of range")
-            return base[index], None
-        if type(index) == str:
-            assert type(base) == dict
-            if index not in base: raise KeyError(f"Key '{index}' not found in object")
-            return base[index], None
-        assert False, f"Unknown index type [{index}]"
+        index_ast = target["index"]
 
-    if ast["tag"] == "assign":
-        assert "target" in ast
-        target = ast["target"]
-
-        if target["tag"] == "identifier":
-            name = target["value"]
-
-            if target.get("extern"):
-                scope = environment
-                while scope is not None and name not in scope:
-                    scope = scope.get("$parent")
-                assert scope is not None, f"Extern assignment: '{name}' not found in any outer scope"
-                target_base = scope
-            else:
-                # Always assign to local scope
-                target_base = environment
-
-            target_index = name
-
-        elif target["tag"] == "complex":
-            base, base_status = evaluate(target["base"], environment)
-            if base_status == "exit": return base, "exit"
-            index_ast = target["index"]
-
-            if index_ast["tag"] == "string":
-                index = index_ast["value"]
-            else:
-                index, index_status = evaluate(index_ast, environment)
-                if index_status == "exit": return index, "exit"
-
-            if index is None: raise Exception("Cannot use 'null' as index for assignment.")
-            assert type(index) in [int, float, str], f"Unknown index type [{index}]"
-
-            if isinstance(base, list):
-                assert isinstance(index, int), "List index must be integer"
-                assert 0 <= index < len(base), "List index out of range"
-                target_base = base
-                target_index = index
-            elif isinstance(base, dict):
-                target_base = base
-                target_index = index
-            else:
-                assert False, f"Cannot assign to base of type {type(base)}"
-
-        value, value_status = evaluate(ast["value"], environment)
-        if value_status == "exit": return value, "exit"
+        if index_ast["tag"] == "string":
+            index = index_ast["value"]
+        else:
+            index, index_status = evaluate_node(index_ast, environment)
+            if index_status == "exit": return index, "exit"
+
+        if index is None: raise Exception("Cannot use 'null' as index for assignment.")
+        assert type(index) in [int, float, str], f"Unknown index type [{index}]"
+
+        if isinstance(base, array_types):
+            assert isinstance(index, int), "List index must be integer"
+            assert 0 <= index < len(base), "List index out of range"
+            target_base = base
+            target_index = index
+        elif isinstance(base, dict):
+            target_base = base
+            target_index = index
+        else:
+            assert False, f"Cannot assign to base of type {type(base)}"
 
-        target_base[target_index] = value
-        return value, None
+    value, value_status = evaluate_node(ast["value"], environment)
+    if value_status == "exit": return value, "exit"
 
-    if ast["tag"] == "return":
-        if "value" in ast and ast["value"] is not None: # Checks if 'return' has an expression
-            evaluated_value, expression_status = evaluate(ast["value"], environment)
-            if expression_status == "exit": # If the expression itself caused an exit
-                return evaluated_value, "exit" # Propagate the exit status and its value
-            # Otherwise, the expression evaluated normally or had another status.
-            # The 'return' statement now imposes its "return" status.
-            return evaluated_value, "return"
-        return None, "return"
+    target_base[target_index] = value
+    return value, None
 
-    if ast["tag"] == "exit":
-        exit_code = 0 # Default exit code
-        if "value" in ast and ast["value"] is not None:
-            exit_code_val, status = evaluate(ast["value"], environment)
-            if status == "exit": return exit_code_val, "exit" # if expr itself exits
-            assert isinstance(exit_code_val, int), "Exit code must be an integer."
-            return exit_code_val, "exit"
-        return exit_code, "exit"
 
-    if ast["tag"] == "break":
-        return None, "break"
+def evaluate_return(ast, environment):
+    if "value" in ast and ast["value"] is not None and ast["value"]["tag"] == "call":
+        # a call in tail position: call_function makes it in place of the current call
+        target, status = evaluate_call_target(ast["value"], environment)
+        if status == "exit": return target, "exit"
+        return target, "tail_call"
+    if "value" in ast and ast["value"] is not None: # Checks if 'return' has an expression
+        evaluated_value, expression_status = evaluate_node(ast["value"], environment)
+        if expression_status == "exit": # If the expression itself caused an exit
+            return evaluated_value, "exit" # Propagate the exit status and its value
+        # Otherwise, the expression evaluated normally or had another status.
+        # The 'return' statement now imposes its "return" status.
+        return evaluated_value, "return"
+    return None, "return"
 
-    if ast["tag"] == "continue":
-        return None, "continue"
 
-    if ast["tag"] == "import":
-        filename_val, status = evaluate(ast["value"], environment)
-        if status == "exit": return filename_val, "exit"
-        assert isinstance(filename_val, str), "Import path must be a string."
-        # Basic import logic (can be expanded for caching, namespaces, etc.)
-        try:
-            with open(filename_val, 'r') as f:
-                source_code = f.read()
-            imported_tokens = tokenize(source_code)
-            imported_ast = parse(imported_tokens)
-            # Evaluate in the current environment.
-            return evaluate(imported_ast, environment) # Propagates value and status from imported code
-        except FileNotFoundError:
-            raise Exception(f"ImportError: File not found '{filename_val}'")
-        except Exception as e:
-            raise Exception(f"Error during import of '{filename_val}': {e}")
+def evaluate_exit(ast, environment):
+    exit_code = 0 # Default exit code
+    if "value" in ast and ast["value"] is not None:
+        exit_code_val, status = evaluate_node(ast["value"], environment)
+        if status == "exit": return exit_code_val, "exit" # if expr itself exits
+        assert isinstance(exit_code_val, int), "Exit code must be an integer."
+        return exit_code_val, "exit"
+    return exit_code, "exit"
+
+
+def evaluate_break(ast, environment):
+    return None, "break"
+
+
+def evaluate_continue(ast, environment):
+    return None, "continue"
+
+
+def evaluate_forget(ast, environment):
+    for name in ast["names"]:
+        environment.variables.pop(name, None)
+    return None, None
 
-    assert False, f"Unknown tag [{ast['tag']}] in AST"
+
+def evaluate_import(ast, environment):
+    filename_val, status = evaluate_node(ast["value"], environment)
+    if status == "exit": return filename_val, "exit"
+    assert isinstance(filename_val, str), "Import path must be a string."
+    # Basic import logic (can be expanded for namespaces, etc.)
+    try:
+        imported_ast = trust(load_ast(filename_val), trusted_trees)
+        # Evaluate in the current environment.
+        return evaluate_node(imported_ast, environment) # Propagates value and status from imported code
+    except FileNotFoundError:
+        raise Exception(f"ImportError: File not found '{filename_val}'")
+    except Exception as e:
+        raise Exception(f"Error during import of '{filename_val}': {e}")
+
+
+# one handler per tag, so every node costs the same dict lookup to dispatch
+handlers = {
+    "number": evaluate_literal,
+    "boolean": evaluate_literal,
+    "string": evaluate_literal,
+    "null": evaluate_null,
+    "list": evaluate_list,
+    "object": evaluate_object,
+    "identifier": evaluate_identifier,
+    "+": evaluate_binary,
+    "-": evaluate_binary,
+    "*": evaluate_binary,
+    "/": evaluate_binary,
+    "%": evaluate_binary,
+    "negate": evaluate_negation,
+    "&&": evaluate_and,
+    "and": evaluate_and,
+    "||": evaluate_or,
+    "or": evaluate_or,
+    "!": evaluate_not,
+    "not": evaluate_not,
+    "<": evaluate_binary,
+    ">": evaluate_binary,
+    "<=": evaluate_binary,
+    ">=": evaluate_binary,
+    "==": evaluate_equal,
+    "!=": evaluate_not_equal,
+    "print": evaluate_print,
+    "assert": evaluate_assert,
+    "if": evaluate_if,
+    "while": evaluate_while,
+    "statement_list": evaluate_statement_list,
+    "program": evaluate_program,
+    "function": evaluate_function,
+    "call": evaluate_call,
+    "complex": evaluate_complex,
+    "assign": evaluate_assign,
+    "return": evaluate_return,
+    "exit": evaluate_exit,
+    "break": evaluate_break,
+    "continue": evaluate_continue,
+    "import": evaluate_import,
+    "forget": evaluate_forget,
+}
+
+
+def evaluate_node(ast, environment):
+    # the tree is trusted, so every tag has a handler
+    return handlers[ast["tag"]](ast, environment)
+
+
+def evaluate(ast, environment, validated=False):
+    """
+    Evaluate ast in environment, a dict (with the enclosing one under "$parent")
+    or an Environment, returning (value, status). The tree is validated first,
+    unless validated says the caller has done that already or it was validated
+    earlier in the same run.
+    """
+    global inline_caches, trusted_trees
+    if inline_caches is not None:
+        # in a run already, by a function value called from another engine
+        if not validated:
+            trust(ast, trusted_trees)
+        return evaluate_node(ast, Environment.of(environment))
+    inline_caches, trusted_trees = {}, {}
+    try:
+        if not validated:
+            trust(ast, trusted_trees)
+        return evaluate_node(ast, Environment.of(environment))
+    finally:
+        inline_caches = trusted_trees = None
 
 def clean(e):
-    if type(e) is dict:
+    if isinstance(e, dict):
         return {k: clean(v) for k, v in e.items() if k != "environment"}
     if type(e) is list:
         return [clean(v) for v in e]
@@ -992,6 +1446,214 @@ def test_closures():
     equals("c2()", env, 1)
     equals("c1()", env, 3)
 
+def test_environment():
+    print("test environment")
+
+    # a dict environment is used in place, including the ones under "$parent"
+    outer = {"x": 1}
+    env = {"y": 2, "$parent": outer}
+    evaluate(parse(tokenize("function f() { extern x = x + y }; f()")), env)
+    assert outer == {"x": 3}
+    assert "f" in env
+
+    # lookups walk the chain iteratively, so deep nesting is fine
+    environment = Environment({"g": 1})
+    for _ in range(5000):
+        environment = Environment({}, environment)
+    assert environment.lookup("g") == 1
+    assert environment.lookup("head") == {"tag": "builtin", "name": "head"}
+    assert environment.extern_scope("g").variables == {"g": 1}
+    try:
+        environment.lookup("nothing")
+        assert False, "lookup should fail"
+    except Exception as e:
+        assert str(e) == "Unknown identifier: 'nothing'"
+
+    # other engines see a function's Environment like a dict environment
+    env = {}
+    evaluate(parse(tokenize("function f() { y = 1; return function() { return y } }; g = f()")), env)
+    closure_environment = env["g"]["environment"]
+    assert "y" in closure_environment and closure_environment["y"] == 1
+    assert closure_environment.get("$parent").variables is env
+
+    # printed with its parameters, then "$parent", then its other variables
+    value, _ = evaluate(parse(tokenize("function f(a) { b = 2; return function() { 1 } }; f(1)")), {})
+    text = repr(value["environment"])
+    assert text.startswith("{'a': 1, '$parent': {") and text.endswith("'b': 2}"), text
+
+
+def test_tail_calls():
+    print("test tail calls")
+
+    # far deeper than the Python stack allows for ordinary calls
+    equals("function count(n, total) { if (n == 0) { return total }; return count(n - 1, total + 1) }; count(100000, 0)", {}, 100000)
+    equals("""
+        function is_even(n) { if (n == 0) { return true }; return is_odd(n - 1) };
+        function is_odd(n) { if (n == 0) { return false }; return is_even(n - 1) };
+        [is_even(20001), is_odd(20001)]
+    """, {}, [False, True])
+    equals("""
+        function last(list) { if (length(list) == 1) { return head(list) }; return last(tail(list)) };
+        function upto(n, list) { while (n > 0) { return upto(n - 1, [n] + list) }; return list };
+        last(upto(3000, []))
+    """, {}, 3000)
+    # a tail call to a builtin, and a tail call's exit
+    equals("function f(x) { return length(x) }; f([1, 2, 3])", {}, 3)
+    equals("function g() { exit 4 }; function f() { return g() }; f(); 5", {}, 4)
+
+    # a top-level return still evaluates its call before failing
+    env = {}
+    try:
+        evaluate(parse(tokenize("x = 0; function f() { extern x = 1 }; return f()")), env)
+        assert False, "Top-level return should fail"
+    except Exception as e:
+        assert "'return' statement outside of function" in str(e)
+        assert env["x"] == 1
+
+
+def test_list_views():
+    print("test list views")
+
+    view = evaluate_builtin_function("tail", [[1, 2, 3]])[0]
+    assert type(view) is ListView and view.buffer == [1, 2, 3]
+    tail_of_view = evaluate_builtin_function("tail", [view])[0]
+    assert tail_of_view.buffer is view.buffer and tail_of_view.start == 2
+    assert str(view) == "[2, 3]" and view == [2, 3] and [2, 3] == view and view != [2]
+
+    # views behave like the lists they stand for
+    equals("x = tail([1, 2, 3]); [x[0], x[1], length(x), head(x)]", {}, [2, 3, 2, 2])
+    equals("tail(tail(tail([1])))", {}, [])
+    equals("x = tail([1, 2]); y = 1; if (tail(x)) { y = 2 }; if (x) { y = y + 2 }; y", {}, 3)
+    equals("tail([1, 2, 3]) + tail([4, 5])", {}, [2, 3, 5])
+    equals("[1] + tail([1, 2])", {}, [1, 2])
+    equals("tail([1, [2]]) == [[2]]", {}, True)
+    equals("[tail([1, 2])] == [[2]]", {}, True)
+
+    # assigning an item changes only that array
+    equals("x = [1, 2, 3]; y = tail(x); z = tail(y); y[1] = 9; x[1] = 8; [x, y, z]", {}, [[1, 8, 3], [2, 9], [3]])
+    equals("x = tail([1, 2, 3]); y = x; y[0] = 7; z = tail(x); x[1] = 6; [x, z]", {}, [[7, 6], [3]])
+    try:
+        evaluate(parse(tokenize("x = tail([1, 2]); x[1] = 0")), {})
+        assert False, "Assigning past the end should fail"
+    except AssertionError as e:
+        assert str(e).startswith("List index out of range")
+
+
+def test_copy_on_write():
+    print("test copy on write")
+
+    # accumulating appends to one buffer, and earlier values keep their items
+    env = {}
+    equals("x = []; i = 0; while (i < 5) { x = x + [i]; if (i == 2) { y = x }; i = i + 1 }; x", env, [0, 1, 2, 3, 4])
+    assert env["y"] == [0, 1, 2] and env["y"].buffer is env["x"].buffer
+
+    # only a view ending where its buffer does extends it
+    equals("x = [1] + [2]; y = x + [3]; z = x + [4]; [x, y, z]", {}, [[1, 2], [1, 2, 3], [1, 2, 4]])
+    equals("x = [1] + [2]; y = x + x; [x, y]", {}, [[1, 2], [1, 2, 1, 2]])
+
+    # assigning an item copies a shared buffer first
+    equals("x = [1] + [2]; y = x + [3]; y[0] = 9; x[1] = 8; z = x + [7]; [x, y, z]", {}, [[1, 8], [9, 2, 3], [1, 8, 7]])
+    equals("x = [1, 2]; y = x + []; y[0] = 5; x[1] = 6; [x, y]", {}, [[1, 6], [5, 2]])
+
+    # objects: + makes a new object
+    equals('x = {"a": 1}; y = x + {"b": 2}; y["a"] = 3; [x, y]', {}, [{"a": 1}, {"a": 3, "b": 2}])
+
+    # the arrays and objects inside the operands are copied, lazily
+    equals("a = [[1]]; b = a + []; b[0][0] = 5; [a, b]", {}, [[[1]], [[5]]])
+    equals('p = {"a": {"b": 1}}; o = p + {}; o.a.b = 2; [p, o]', {}, [{"a": {"b": 1}}, {"a": {"b": 2}}])
+    equals("x = [1, 2]; y = x + [[3]]; z = y + []; z[2][0] = 9; [y, z]", {}, [[1, 2, [3]], [1, 2, [9]]])
+    equals('r = {"a": 1}; x = [] + [r]; r["a"] = 2; [r, x]', {}, [{"a": 2}, [{"a": 1}]])
+    equals("i = [1]; a = [i]; b = a + []; i[0] = 2; c = b[0]; c[0] = 3; [a, b, head(b) == c]", {}, [[[2]], [[3]], True])
+    env = {}
+    equals("x = [] + [[1]]; y = x + [[2]]; z = x[0]; z[0] = 5; [x, y]", env, [[[5]], [[1], [2]]])
+    assert type(env["y"].buffer[0]) is FrozenList and type(env["z"]) is ListView
+    # a frozen value is copied at most once
+    equals("x = [] + [[1]]; y = x + x; z = [] + [y]; [y, z]", env, [[[1], [1]], [[[1], [1]]]])
+    assert env["z"].buffer[0].buffer is env["y"].buffer and env["y"].buffer[0] is env["y"].buffer[1]
+
+
+def test_binary_operations():
+    print("test binary operations")
+    assert binary_operations["+"][int, float] is operator.add
+    assert (bool, int) not in binary_operations["+"]
+    assert binary_operation("*", "ab", 2.0) == "abab"
+    assert binary_operation("<=", "a", "b") is True
+    assert binary_operation("==", [1], ListView([0, 1], 1, 2, False)) is True
+    for tag, left, right, message in [
+        ("+", True, 1, "Illegal types for +: boolean-number"),
+        ("-", 1, "a", "Illegal types for -:number-string"),
+        ("<", 1, "a", "Illegal types for <: number-string"),
+        ("%", None, {}, "Illegal types for %:null-object"),
+        ("/", 1, 0, "Division by zero"),
+    ]:
+        try:
+            binary_operation(tag, left, right)
+            assert False, f"{tag} should fail"
+        except Exception as e:
+            assert str(e).startswith(message), str(e)
+
+
+def test_quickening():
+    print("test quickening")
+    specializations.clear()
+    despecializations.clear()
+
+    # i + 1 and x + 1 specialize to int-int; x + 1 then sees a float from i == 15
+    equals("""
+        i = 0; x = 0; s = "";
+        while (i < 30) {
+            if (i == 15) { x = 0.5 };
+            if (i > 20) { s = s + "a" };
+            x = x + 1;
+            i = i + 1
+        };
+        [x, s]
+    """, {}, [15.5, "aaaaaaaaa"])
+    assert specializations["+ int-int"] == 2 and despecializations["+ int-int"] == 1
+    assert specializations["+ float-int"] == 1 and specializations["+ str-str"] == 1
+    assert specializations["< int-int"] == 1 and specializations.total() == 6
+
+    # a specialized node that sees other types is de-specialized, and still reports errors
+    specializations.clear()
+    try:
+        evaluate(parse(tokenize("f = function(a) { return a * 2 }; i = 0; while (i < 10) { f(i); i = i + 1 }; f(null)")), {})
+        assert False, "null * 2 should fail"
+    except Exception as e:
+        assert str(e) == "Illegal types for *:null-number"
+    assert specializations["* int-int"] == 1 and despecializations["* int-int"] == 1
+
+    # operands that exit
+    equals("f = function() { exit 3 }; i = 0; while (i < 10) { i = i + 1 }; i + f()", {}, 3)
+
+    # the state lasts for one run, and leaves the tree as it was
+    code = "i = 0; while (i < 10) { i = i + 1 }"
+    ast = parse(tokenize(code))
+    evaluate(ast, {})
+    assert inline_caches is None and ast == parse(tokenize(code))
+
+
+def test_trusted_trees():
+    print("test trusted trees")
+    ast = parse(tokenize("x = 1"))
+    evaluate(ast, {})
+    assert trusted_trees is None and ast == parse(tokenize("x = 1"))
+    # a tree validated by the caller isn't validated again
+    ast = {"tag": "program", "statements": [{"tag": "number", "value": 1.5}]}
+    validate(ast)
+    ast["statements"][0]["value"] = "1.5"
+    assert evaluate(ast, {}, validated=True) == ("1.5", None)
+    # an invalid node is reported before anything runs
+    ast = parse(tokenize("print 1; x = 2"))
+    ast["statements"][1]["value"]["value"] = "2"
+    environment = {}
+    try:
+        evaluate(ast, environment)
+        assert False, "The tree should be invalid"
+    except AssertionError as e:
+        assert str(e).startswith("unexpected type <class 'str'>")
+    assert environment == {}
+
+
 def test_control_flow_scoping_rules():
     print("test control flow scoping rules")
 
@@ -1060,5 +1722,12 @@ if __name__ == "__main__":
     test_evaluator_with_new_tags()
     test_scoping()
     test_closures()
+    test_environment()
+    test_tail_calls()
+    test_list_views()
+    test_copy_on_write()
+    test_binary_operations()
+    test_quickening()
+    test_trusted_trees()
     # test_control_flow_scoping_rules()
     print("done.")
\ No newline at end of file
@@ -0,0 +1,357 @@
+import hashlib
+import marshal
+import os
+import re
+import sys
+
+# LL(1) tables for the EBNF grammar string in parser.py.
+#
+# A grammar rule body is read into a small tree of tuples:
+#   ("t", tag)              a terminal token tag, e.g. "(" or "number"
+#   ("nt", name)            another rule
+#   ("seq", [items])        items in order
+#   ("alt", [items])        one of the items
+#   ("opt", item)           [ item ]
+#   ("rep", item)           { item }
+#
+# None stands for the end of the token stream, as it does for the tokenizer.
+
+ebnf_pattern = re.compile(r'\s*(?:("[^"]*")|<(\w+)>|(\w+)|([=|\[\]{}()]))')
+
+
+def read_grammar(text):
+    """
+    Read the grammar text into {rule name: rule tree}, one rule per line.
+    Names that are not rules (like identifier) are terminal token tags.
+    """
+    lines = [line.strip() for line in text.strip().splitlines() if line.strip()]
+    bodies = {}
+    for line in lines:
+        name, body = line.split("=", 1)
+        bodies[name.strip()] = body
+    rules = {}
+    for name, body in bodies.items():
+        items = read_ebnf_tokens(body)
+        tree, position = read_alternatives(items, 0, bodies)
+        assert position == len(items), f"Unexpected '{items[position]}' in rule {name}"
+        rules[name] = tree
+    return rules
+
+
+def read_ebnf_tokens(body):
+    items = []
+    position = 0
+    body = body.rstrip()
+    while position < len(body):
+        match = ebnf_pattern.match(body, position)
+        assert match, f"Can't read grammar text at [{body[position:]}]"
+        quoted, token_class, name, symbol = match.groups()
+        if quoted:
+            items.append(("t", quoted[1:-1]))
+        elif token_class:
+            items.append(("t", token_class))
+        elif name:
+            items.append(("name", name))
+        else:
+            items.append(symbol)
+        position = match.end()
+    return items
+
+
+def read_alternatives(items, position, bodies):
+    choices = []
+    sequence, position = read_sequence(items, position, bodies)
+    choices.append(sequence)
+    while position < len(items) and items[position] == "|":
+        sequence, position = read_sequence(items, position + 1, bodies)
+        choices.append(sequence)
+    if len(choices) == 1:
+        return choices[0], position
+    return ("alt", choices), position
+
+
+def read_sequence(items, position, bodies):
+    sequence = []
+    closers = {"|", ")", "]", "}"}
+    while position < len(items) and items[position] not in closers:
+        item = items[position]
+        if item in ["(", "[", "{"]:
+            inner, position = read_alternatives(items, position + 1, bodies)
+            closer = {"(": ")", "[": "]", "{": "}"}[item]
+            assert items[position] == closer, f"Expected '{closer}' in grammar"
+            if item == "[":
+                inner = ("opt", inner)
+            if item == "{":
+                inner = ("rep", inner)
+            sequence.append(inner)
+        elif item[0] == "name":
+            name = item[1]
+            sequence.append(("nt", name) if name in bodies else ("t", name))
+        else:
+            sequence.append(item)
+        position = position + 1
+    if len(sequence) == 1:
+        return sequence[0], position
+    return ("seq", sequence), position
+
+
+def first_of(tree, first, nullable):
+    """
+    The token tags that can start tree, and whether tree can match nothing.
+    """
+    kind = tree[0]
+    if kind == "t":
+        return {tree[1]}, False
+    if kind == "nt":
+        return first[tree[1]], nullable[tree[1]]
+    if kind == "seq":
+        tags = set()
+        for item in tree[1]:
+            item_tags, item_nullable = first_of(item, first, nullable)
+            tags |= item_tags
+            if not item_nullable:
+                return tags, False
+        return tags, True
+    if kind == "alt":
+        tags = set()
+        any_nullable = False
+        for item in tree[1]:
+            item_tags, item_nullable = first_of(item, first, nullable)
+            tags |= item_tags
+            any_nullable = any_nullable or item_nullable
+        return tags, any_nullable
+    if kind in ["opt", "rep"]:
+        return first_of(tree[1], first, nullable)[0], True
+    assert False, f"Unknown grammar node {tree}"
+
+
+def first_sets(rules):
+    first = {name: set() for name in rules}
+    nullable = {name: False for name in rules}
+    changed = True
+    while changed:
+        changed = False
+        for name, tree in rules.items():
+            tags, can_be_empty = first_of(tree, first, nullable)
+            if not tags <= first[name] or can_be_empty != nullable[name]:
+                first[name] |= tags
+                nullable[name] = nullable[name] or can_be_empty
+                changed = True
+    return first, nullable
+
+
+def walk_follow(tree, after, first, nullable, follow, choices):
+    """
+    Push the tags that can come after tree down into the FOLLOW sets of the
+    rules it mentions, and note every choice point with what follows it.
+    """
+    kind = tree[0]
+    if kind == "nt":
+        follow[tree[1]] |= after
+    elif kind == "seq":
+        for item in reversed(tree[1]):
+            walk_follow(item, after, first, nullable, follow, choices)
+            tags, item_nullable = first_of(item, first, nullable)
+            after = tags | after if item_nullable else set(tags)
+    elif kind == "alt":
+        choices.append((tree, set(after)))
+        for item in tree[1]:
+            walk_follow(item, after, first, nullable, follow, choices)
+    elif kind == "opt":
+        choices.append((tree, set(after)))
+        walk_follow(tree[1], after, first, nullable, follow, choices)
+    elif kind == "rep":
+        choices.append((tree, set(after)))
+        after = first_of(tree[1], first, nullable)[0] | after
+        walk_follow(tree[1], after, first, nullable, follow, choices)
+
+
+def follow_sets(rules, first, nullable, start):
+    follow = {name: set() for name in rules}
+    follow[start].add(None)
+    while True:
+        before = {name: set(tags) for name, tags in follow.items()}
+        choices = {}
+        for name, tree in rules.items():
+            choices[name] = []
+            walk_follow(tree, follow[name], first, nullable, follow, choices[name])
+        if follow == before:
+            return follow, choices
+
+
+def describe(tree):
+    """
+    Write a rule tree back out in the grammar's notation.
+    """
+    kind = tree[0]
+    if kind == "t":
+        return f'"{tree[1]}"'
+    if kind == "nt":
+        return tree[1]
+    if kind == "seq":
+        return " ".join(describe(item) for item in tree[1])
+    if kind == "alt":
+        return "( " + " | ".join(describe(item) for item in tree[1]) + " )"
+    if kind == "opt":
+        return "[ " + describe(tree[1]) + " ]"
+    if kind == "rep":
+        return "{ " + describe(tree[1]) + " }"
+
+
+def label_of(tree):
+    """
+    The name a prediction table uses for an alternative: the rule it calls,
+    or the token it starts with.
+    """
+    if tree[0] in ["nt", "t"]:
+        return tree[1]
+    if tree[0] == "seq":
+        return label_of(tree[1][0])
+    return str(tree)
+
+
+def build_tables(text, start="program"):
+    """
+    Build FIRST and FOLLOW sets, a prediction table for every rule whose body
+    is a list of alternatives, and the LL(1) conflicts in the grammar.
+    On a conflict the alternative listed first is predicted.
+    """
+    rules = read_grammar(text)
+    first, nullable = first_sets(rules)
+    follow, choices = follow_sets(rules, first, nullable, start)
+    predict = {}
+    conflicts = []
+    for name, tree in rules.items():
+        if tree[0] == "alt":
+            table = {}
+            for item in tree[1]:
+                tags, item_nullable = first_of(item, first, nullable)
+                if item_nullable:
+                    tags = tags | follow[name]
+                for tag in tags:
+                    if tag in table:
+                        conflicts.append((name, tag, f"{table[tag]} / {label_of(item)}"))
+                    else:
+                        table[tag] = label_of(item)
+            predict[name] = table
+        for choice, after in choices[name]:
+            if choice[0] in ["opt", "rep"]:
+                overlap = first_of(choice[1], first, nullable)[0] & after
+                for tag in overlap:
+                    conflicts.append((name, tag, describe(choice)))
+    return {
+        "first": {name: frozenset(tags) for name, tags in first.items()},
+        "nullable": nullable,
+        "follow": {name: frozenset(tags) for name, tags in follow.items()},
+        "predict": predict,
+        "conflicts": sorted(set(conflicts), key=str),
+    }
+
+
+# changes whenever this module (and so how tables are built) changes, like
+# astcache.version_stamp; astcache can't be imported here, it imports the parser
+with open(__file__, "rb") as f:
+    version_stamp = hashlib.sha256(f"{sys.implementation.cache_tag} {marshal.version}".encode() + f.read()).hexdigest()[:16]
+
+
+def cache_path(text, cache_directory, stamp=version_stamp):
+    digest = hashlib.sha256(f"{stamp} {text}".encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_directory, f"ll1-{digest}.{sys.implementation.cache_tag}.bin")
+
+
+default_cache_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__")
+
+
+def load_tables(text, cache_directory=default_cache_directory):
+    """
+    Return the tables for a grammar, reading them from the cache directory
+    when the same grammar text has been seen before.
+    """
+    path = cache_path(text, cache_directory)
+    try:
+        with open(path, "rb") as f:
+            return marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    tables = build_tables(text)
+    # like .pyc files, a cache that can't be written is not an error
+    try:
+        os.makedirs(cache_directory, exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            marshal.dump(tables, f)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        pass
+    return tables
+
+
+test_grammar = """
+    sum = term { "+" term }
+    term = <number> | identifier | "(" sum ")" | call
+    call = "call" [ sum ]
+    program = sum { ";" sum } [ ";" ]
+"""
+
+
+def test_read_grammar():
+    print("testing read_grammar...")
+    rules = read_grammar(test_grammar)
+    assert rules["sum"] == ("seq", [("nt", "term"), ("rep", ("seq", [("t", "+"), ("nt", "term")]))])
+    assert rules["term"] == (
+        "alt",
+        [
+            ("t", "number"),
+            ("t", "identifier"),
+            ("seq", [("t", "("), ("nt", "sum"), ("t", ")")]),
+            ("nt", "call"),
+        ],
+    )
+    assert rules["call"] == ("seq", [("t", "call"), ("opt", ("nt", "sum"))])
+
+
+def test_first_and_follow():
+    print("testing first and follow sets...")
+    tables = build_tables(test_grammar)
+    assert tables["first"]["sum"] == {"number", "identifier", "(", "call"}
+    assert tables["nullable"]["call"] is False
+    assert tables["follow"]["sum"] == {"+", ")", ";", None}
+    assert tables["follow"]["term"] == {"+", ")", ";", None}
+
+
+def test_predictions_and_conflicts():
+    print("testing predictions and conflicts...")
+    tables = build_tables(test_grammar)
+    assert tables["predict"]["term"] == {
+        "number": "number",
+        "identifier": "identifier",
+        "(": "(",
+        "call": "call",
+    }
+    # after a sum, ";" could either start another sum or end the program,
+    # and in "call 1 + 2" the "+" could belong to the call's argument or not
+    assert tables["conflicts"] == [
+        ("program", ";", '{ ";" sum }'),
+        ("sum", "+", '{ "+" term }'),
+    ]
+
+
+def test_load_tables():
+    print("testing load_tables...")
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        tables = load_tables(test_grammar, directory)
+        assert os.path.exists(cache_path(test_grammar, directory))
+        assert load_tables(test_grammar, directory) == tables
+        # a different grammar gets its own cache entry
+        assert cache_path(test_grammar + " ", directory) != cache_path(test_grammar, directory)
+        # and so does the same grammar once ll1.py has changed
+        assert cache_path(test_grammar, directory, "other") != cache_path(test_grammar, directory)
+
+
+if __name__ == "__main__":
+    test_read_grammar()
+    test_first_and_follow()
+    test_predictions_and_conflicts()
+    test_load_tables()
+    print("done.")
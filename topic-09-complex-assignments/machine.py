@@ -0,0 +1,560 @@
+from tokenizer import tokenize
+from parser import parse
+from astcache import load_ast
+from evaluator import type_of, is_truthy, ast_to_string, evaluate_builtin_function, __builtin_functions, array_types, object_types, owned_item, Function, binary_operation
+import copy
+
+# An evaluator that keeps its own stack.
+#
+# evaluate() in evaluator.py calls itself for every child node and for every
+# function call, so a deeply recursive program runs out of Python stack.
+# Here every node that has children to evaluate is a generator, steps(ast, environment).
+# Instead of calling evaluate() on a child, it yields (child, environment) and is
+# resumed with the child's (value, status). evaluate() keeps the suspended
+# generators on a list, so the depth of the program's recursion is only limited
+# by memory.
+#
+# Simple children (leaves, operators on two leaves, and local assignments of
+# those) are evaluated in place by simple_value(), without a generator.
+
+literal_tags = {"number", "string", "boolean"}
+leaf_tags = {"number", "string", "boolean", "null", "identifier"}
+
+
+def lookup(identifier, environment):
+    while True:
+        if identifier in environment:
+            return environment[identifier]
+        if "$parent" not in environment:
+            break
+        environment = environment["$parent"]
+    if identifier in __builtin_functions:
+        return {"tag": "builtin", "name": identifier}
+    raise Exception(f"Unknown identifier: '{identifier}'")
+
+
+binary_tags = {"+", "-", "*", "/", "%", "<", ">", "<=", ">=", "==", "!="}
+
+# returned by simple_value for a node that needs its own generator
+pending = object()
+
+
+def leaf_value(ast, environment):
+    if ast["tag"] == "identifier":
+        return lookup(ast["value"], environment)
+    return ast.get("value")
+
+
+def simple_value(ast, environment):
+    """
+    the value of a leaf, of an operator applied to two leaves, or of a local
+    assignment of one of these, without going through a generator; pending
+    (having evaluated nothing) for anything else
+    """
+    tag = ast["tag"]
+    if tag == "identifier":
+        return lookup(ast["value"], environment)
+    if tag in literal_tags:
+        return ast["value"]
+    if tag in binary_tags:
+        left = ast["left"]
+        right = ast["right"]
+        if left["tag"] in leaf_tags and right["tag"] in leaf_tags:
+            return binary_operation(tag, leaf_value(left, environment), leaf_value(right, environment))
+    if tag == "assign":
+        target = ast["target"]
+        if target["tag"] == "identifier" and not target.get("extern"):
+            value = simple_value(ast["value"], environment)
+            if value is not pending:
+                environment[target["value"]] = value
+            return value
+    if tag == "null":
+        return None
+    return pending
+
+
+def steps(ast, environment):
+    """
+    Evaluate ast like evaluator.evaluate, yielding (child, environment) for each
+    child that needs evaluating and receiving its (value, status).
+    Returns (value, status).
+    """
+    tag = ast["tag"]
+    if tag in literal_tags:
+        return ast["value"], None
+    if tag == "null":
+        return None, None
+    if tag == "identifier":
+        return lookup(ast["value"], environment), None
+
+    if tag in binary_tags:
+        left_value = simple_value(ast["left"], environment)
+        if left_value is pending:
+            left_value, status = yield ast["left"], environment
+            if status == "exit": return left_value, "exit"
+        right_value = simple_value(ast["right"], environment)
+        if right_value is pending:
+            right_value, status = yield ast["right"], environment
+            if status == "exit": return right_value, "exit"
+        return binary_operation(tag, left_value, right_value), None
+
+    if tag in ["&&", "and"]:
+        left_value = simple_value(ast["left"], environment)
+        if left_value is pending:
+            left_value, status = yield ast["left"], environment
+            if status == "exit": return left_value, "exit"
+        if not is_truthy(left_value):
+            return left_value, None
+        right_value = simple_value(ast["right"], environment)
+        if right_value is pending:
+            right_value, status = yield ast["right"], environment
+            if status == "exit": return right_value, "exit"
+        return is_truthy(left_value) and is_truthy(right_value), None
+
+    if tag in ["||", "or"]:
+        left_value = simple_value(ast["left"], environment)
+        if left_value is pending:
+            left_value, status = yield ast["left"], environment
+            if status == "exit": return left_value, "exit"
+        if is_truthy(left_value):
+            return left_value, None
+        right_value = simple_value(ast["right"], environment)
+        if right_value is pending:
+            right_value, status = yield ast["right"], environment
+            if status == "exit": return right_value, "exit"
+        return is_truthy(left_value) or is_truthy(right_value), None
+
+    if tag == "negate":
+        value = simple_value(ast["value"], environment)
+        if value is pending:
+            value, status = yield ast["value"], environment
+            if status == "exit": return value, "exit"
+        types = type_of(value)
+        if types == "number":
+            return -value, None
+        raise Exception(f"Illegal type for {tag}:{types}")
+
+    if tag in ["!", "not"]:
+        value = simple_value(ast["value"], environment)
+        if value is pending:
+            value, status = yield ast["value"], environment
+            if status == "exit": return value, "exit"
+        return not is_truthy(value), None
+
+    if tag == "list":
+        items = []
+        for item in ast["items"]:
+            result = simple_value(item, environment)
+            if result is pending:
+                result, status = yield item, environment
+                if status == "exit": return result, "exit"
+            items.append(result)
+        return items, None
+
+    if tag == "object":
+        object = {}
+        for item in ast["items"]:
+            key = simple_value(item["key"], environment)
+            if key is pending:
+                key, status = yield item["key"], environment
+                if status == "exit": return key, "exit"
+            assert type(key) is str, "Object key must be a string"
+            value = simple_value(item["value"], environment)
+            if value is pending:
+                value, status = yield item["value"], environment
+                if status == "exit": return value, "exit"
+            object[key] = value
+        return object, None
+
+    if tag == "print":
+        if ast["value"]:
+            value = simple_value(ast["value"], environment)
+            if value is pending:
+                value, status = yield ast["value"], environment
+                if status == "exit": return value, "exit"
+            if type(value) is bool:
+                value = "true" if value else "false"
+            print(str(value))
+            return str(value), None
+        print()
+        return None, None
+
+    if tag == "assert":
+        if ast["condition"]:
+            condition_value = simple_value(ast["condition"], environment)
+            if condition_value is pending:
+                condition_value, status = yield ast["condition"], environment
+                if status == "exit": return condition_value, "exit"
+            if not is_truthy(condition_value):
+                error_msg = f"Assertion failed: {ast_to_string(ast['condition'])}"
+                if "explanation" in ast and ast["explanation"]:
+                    explanation_val = simple_value(ast["explanation"], environment)
+                    if explanation_val is pending:
+                        explanation_val, status = yield ast["explanation"], environment
+                        if status == "exit": return explanation_val, "exit"
+                    error_msg += f" ({explanation_val})"
+                raise Exception(error_msg)
+        return None, None
+
+    if tag == "if":
+        condition_value = simple_value(ast["condition"], environment)
+        if condition_value is pending:
+            condition_value, status = yield ast["condition"], environment
+            if status == "exit": return condition_value, "exit"
+        if is_truthy(condition_value):
+            value, status = yield ast["then"], environment
+            if status:
+                return value, status
+        elif "else" in ast:
+            value, status = yield ast["else"], environment
+            if status:
+                return value, status
+        return None, None
+
+    if tag == "while":
+        condition_value = simple_value(ast["condition"], environment)
+        if condition_value is pending:
+            condition_value, status = yield ast["condition"], environment
+            if status == "exit": return condition_value, "exit"
+        while is_truthy(condition_value):
+            value, status = yield ast["do"], environment
+            if status == "return" or status == "exit":
+                return value, status
+            if status == "break":
+                break
+            condition_value = simple_value(ast["condition"], environment)
+            if condition_value is pending:
+                condition_value, status = yield ast["condition"], environment
+                if status == "exit": return condition_value, "exit"
+        return None, None
+
+    if tag == "statement_list":
+        last_value = None
+        for statement in ast["statements"]:
+            last_value = simple_value(statement, environment)
+            if last_value is pending:
+                last_value, status = yield statement, environment
+                if status:
+                    return last_value, status
+        return last_value, None
+
+    if tag == "program":
+        last_value = None
+        for statement in ast["statements"]:
+            value = simple_value(statement, environment)
+            if value is pending:
+                value, status = yield statement, environment
+            else:
+                status = None
+            if status:
+                if status == "return":
+                    raise Exception("'return' statement outside of function.")
+                if status in ["break", "continue"]:
+                    raise Exception(f"'{status}' statement outside of loop.")
+                return value, status
+            last_value = value
+        return last_value, None
+
+    if tag == "function":
+        return Function(ast["parameters"], ast["body"], environment), None
+
+    if tag == "call":
+        function = simple_value(ast["function"], environment)
+        if function is pending:
+            function, status = yield ast["function"], environment
+            if status == "exit": return function, "exit"
+        argument_values = []
+        for argument in ast["arguments"]:
+            value = simple_value(argument, environment)
+            if value is pending:
+                value, status = yield argument, environment
+                if status == "exit": return value, "exit"
+            argument_values.append(value)
+        if function.get("tag") == "builtin":
+            return evaluate_builtin_function(function["name"], argument_values)
+        local_environment = {
+            name["value"]: value
+            for name, value in zip(function["parameters"], argument_values)
+        }
+        local_environment["$parent"] = function["environment"]
+        value, status = yield function["body"], local_environment
+        if status == "return":
+            return value, None
+        if status == "exit":
+            return value, "exit"
+        if status in ["break", "continue"]:
+            raise Exception(f"'{status}' statement propagated out of function call.")
+        return None, None
+
+    if tag == "complex":
+        base = simple_value(ast["base"], environment)
+        if base is pending:
+            base, status = yield ast["base"], environment
+            if status == "exit": return base, "exit"
+        index = simple_value(ast["index"], environment)
+        if index is pending:
+            index, status = yield ast["index"], environment
+            if status == "exit": return index, "exit"
+        if index is None:
+            raise Exception(f"TypeError: Cannot index with 'null'. Base: {base}, Index AST: {ast_to_string(ast['index'])}")
+        if type(index) in [int, float]:
+            assert int(index) == index
+            assert type(base) in array_types
+            if not (0 <= index < len(base)): raise IndexError("List index out of range")
+            return owned_item(base, index), None
+        if type(index) == str:
+            assert type(base) in object_types
+            if index not in base: raise KeyError(f"Key '{index}' not found in object")
+            return owned_item(base, index), None
+        assert False, f"Unknown index type [{index}]"
+
+    if tag == "assign":
+        target = ast["target"]
+        if target["tag"] == "identifier":
+            name = target["value"]
+            if target.get("extern"):
+                scope = environment
+                while scope is not None and name not in scope:
+                    scope = scope.get("$parent")
+                assert scope is not None, f"Extern assignment: '{name}' not found in any outer scope"
+                target_base = scope
+            else:
+                target_base = environment
+            target_index = name
+        elif target["tag"] == "complex":
+            base = simple_value(target["base"], environment)
+            if base is pending:
+                base, status = yield target["base"], environment
+                if status == "exit": return base, "exit"
+            index_ast = target["index"]
+            if index_ast["tag"] == "string":
+                index = index_ast["value"]
+            else:
+                index = simple_value(index_ast, environment)
+                if index is pending:
+                    index, status = yield index_ast, environment
+                    if status == "exit": return index, "exit"
+            if index is None: raise Exception("Cannot use 'null' as index for assignment.")
+            assert type(index) in [int, float, str], f"Unknown index type [{index}]"
+            if isinstance(base, array_types):
+                assert isinstance(index, int), "List index must be integer"
+                assert 0 <= index < len(base), "List index out of range"
+            elif not isinstance(base, dict):
+                assert False, f"Cannot assign to base of type {type(base)}"
+            target_base = base
+            target_index = index
+        value = simple_value(ast["value"], environment)
+        if value is pending:
+            value, status = yield ast["value"], environment
+            if status == "exit": return value, "exit"
+        target_base[target_index] = value
+        return value, None
+
+    if tag == "return":
+        if "value" in ast and ast["value"] is not None:
+            value = simple_value(ast["value"], environment)
+            if value is pending:
+                value, status = yield ast["value"], environment
+                if status == "exit": return value, "exit"
+            return value, "return"
+        return None, "return"
+
+    if tag == "exit":
+        if "value" in ast and ast["value"] is not None:
+            value = simple_value(ast["value"], environment)
+            if value is pending:
+                value, status = yield ast["value"], environment
+                if status == "exit": return value, "exit"
+            assert isinstance(value, int), "Exit code must be an integer."
+            return value, "exit"
+        return 0, "exit"
+
+    if tag == "break":
+        return None, "break"
+
+    if tag == "continue":
+        return None, "continue"
+
+    if tag == "forget":
+        for name in ast["names"]:
+            environment.pop(name, None)
+        return None, None
+
+    if tag == "import":
+        filename_val = simple_value(ast["value"], environment)
+        if filename_val is pending:
+            filename_val, status = yield ast["value"], environment
+            if status == "exit": return filename_val, "exit"
+        assert isinstance(filename_val, str), "Import path must be a string."
+        try:
+            imported_ast = load_ast(filename_val)
+            return (yield imported_ast, environment)
+        except FileNotFoundError:
+            raise Exception(f"ImportError: File not found '{filename_val}'")
+        except Exception as e:
+            raise Exception(f"Error during import of '{filename_val}': {e}")
+
+    assert False, f"Unknown tag [{tag}] in AST"
+
+
+def evaluate(ast, environment):
+    """
+    Evaluate ast in environment, returning (value, status) like evaluator.evaluate.
+    """
+    stack = [steps(ast, environment)]
+    result = None
+    error = None
+    while True:
+        generator = stack[-1]
+        try:
+            if error is None:
+                child, child_environment = generator.send(result)
+            else:
+                child, child_environment = generator.throw(error)
+                error = None
+        except StopIteration as done:
+            stack.pop()
+            if not stack:
+                return done.value
+            result = done.value
+            continue
+        except Exception as e:
+            stack.pop()
+            if not stack:
+                raise
+            # the traceback would otherwise grow by a frame for every generator it passes
+            error = e.with_traceback(None)
+            continue
+        # simple children were already evaluated by the generator itself
+        stack.append(steps(child, child_environment))
+        result = None
+
+
+def same_as_evaluator(code, environment=None):
+    import evaluator
+
+    expected_environment = {} if environment is None else copy.deepcopy(environment)
+    environment = {} if environment is None else environment
+    expected = evaluator.evaluate(parse(tokenize(code)), expected_environment)
+    result = evaluate(parse(tokenize(code)), environment)
+    assert result == expected, f"{code}: got {result}, expected {expected}"
+    return result
+
+
+def test_expressions():
+    print("testing expressions...")
+    for code in [
+        "4", "4.2", '"x"', "null", "true", "1+2*3", "(3+2)*2", "8/4/2", "7%3", "--3",
+        '"a"+"b"', '"ab"*2', "[1,2]+[3]", '{"a":1}+{"b":2}', "1<2", "2>=3", "1==1", "1!=1",
+        "!0", "0 && x", "1 || x", "1 && 2", "[1,[2,3]][1][0]", '{"a":{"b":4}}.a.b',
+        "head([1,2,3])", "tail([1,2,3])", "length(\"hello\")", 'keys({"a":1})',
+    ]:
+        same_as_evaluator(code)
+    assert evaluate(parse(tokenize("x + y")), {"x": 1, "$parent": {"y": 2}}) == (3, None)
+
+
+def test_statements():
+    print("testing statements...")
+    for code in [
+        "x=1; while(x<5) {x=x+1}; y=3",
+        "if(0) {x=1} else {x=2}",
+        "x=0; while(1) {x=x+1; if(x>3){break}}; x",
+        "x=0; y=0; while(x<5) {x=x+1; if(x%2){continue}; y=y+x}; y",
+        "a=[1,2,3]; a[1]=5; a",
+        'o={"a":1}; o.b=2; o["c"]=3; o',
+        "a=b=4",
+        "print 1+1",
+        "exit 12",
+        "exit",
+        "if(1){exit 3}; print 4",
+    ]:
+        same_as_evaluator(code)
+
+
+def test_functions():
+    print("testing functions...")
+    for code in [
+        "function f(x) { if (x > 1) { return 123 }; return 2+2 }; f(7) + f(0)",
+        "function f() { return }; f()",
+        "function f() { 1 }; f()",
+        "x = 1; function f() { extern x = 2 }; f(); x",
+        "x = 1; foo = function() { return x }; bar = function() { x = 2; return foo() }; bar()",
+        """
+        function makeCounter() {
+            count = 0;
+            return function() { extern count = count + 1; return count }
+        };
+        c1 = makeCounter(); c2 = makeCounter();
+        [c1(), c1(), c2(), c1()]
+        """,
+        "function f() { while(1) { return 5 } }; f()",
+        "function f() { exit 7 }; f(); print 1",
+    ]:
+        same_as_evaluator(code)
+
+
+def test_errors():
+    print("testing errors...")
+    for code, message in [
+        ("return 1", "'return' statement outside of function"),
+        ("break", "'break' statement outside of loop"),
+        ("if(true){ return 1 }", "'return' statement outside of function"),
+        ("function f() { break }; f()", "'break' statement propagated out of function call"),
+        ("y", "Unknown identifier: 'y'"),
+        ("1 - \"a\"", "Illegal types for -:number-string"),
+        ("assert 1 == 2, \"nope\"", "Assertion failed: (1==2) (nope)"),
+        ('import "no such file.t"', "ImportError: File not found 'no such file.t'"),
+    ]:
+        try:
+            evaluate(parse(tokenize(code)), {})
+            assert False, f"{code} should fail"
+        except Exception as e:
+            assert message in str(e), f"{code}: {e}"
+
+
+def test_import():
+    print("testing import...")
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "library.t")
+        with open(path, "w") as f:
+            f.write("function double(x) { return x + x }; y = oops")
+        environment = {}
+        try:
+            evaluate(parse(tokenize(f'import "{path}"')), environment)
+            assert False, "import should fail"
+        except Exception as e:
+            assert str(e) == f"Error during import of '{path}': Unknown identifier: 'oops'"
+        assert "double" in environment
+        with open(path, "w") as f:
+            f.write("function double(x) { return x + x }")
+        same_as_evaluator(f'import "{path}"; double(4)')
+
+
+def test_deep_recursion():
+    print("testing deep recursion...")
+    import sys
+
+    depth = sys.getrecursionlimit() * 10
+    code = f"""
+        function count(n) {{ if (n == 0) {{ return 0 }}; return 1 + count(n - 1) }};
+        count({depth})
+    """
+    assert evaluate(parse(tokenize(code)), {}) == (depth, None)
+    code = f"""
+        function sum(xs) {{ if (length(xs) == 0) {{ return 0 }}; return head(xs) + sum(tail(xs)) }};
+        sum([{",".join(["1"] * 3000)}])
+    """
+    assert evaluate(parse(tokenize(code)), {}) == (3000, None)
+
+
+if __name__ == "__main__":
+    test_expressions()
+    test_statements()
+    test_functions()
+    test_errors()
+    test_import()
+    test_deep_recursion()
+    print("done.")
@@ -0,0 +1,620 @@
+from tokenizer import tokenize
+from parser import parse
+from evaluator import is_truthy, ast_to_string, binary_operation, binary_operations
+
+# Constant folding and propagation, between parse() and evaluate().
+#
+# An operator whose operands are all literals is replaced by the literal it
+# evaluates to, computed by the evaluator's own operations so the type rules
+# are exactly the same. Operations that fail (illegal types, division by
+# zero) are left for the program to fail on when it gets there.
+#
+# A variable assigned a literal by a statement of the program itself, and
+# assigned nowhere else, is replaced by that literal in the statements after
+# it (functions defined there included). Nothing else can change it as long
+# as the program imports nothing, and runs in an environment of its own; the
+# REPL, whose earlier lines could define a function that sets it with extern,
+# only folds.
+#
+# Then, in such a program, loop invariants can be hoisted: see Hoister below.
+# That is only done when asked for (runner.py --optimize).
+#
+# optimize() returns a new tree and the list of what it did, which runner.py
+# prints for --explain-opt.
+
+literal_tags = ["number", "string", "boolean", "null"]
+
+# longest string a fold may make, so "-" * 1000000 stays an expression
+longest_folded_string = 1000
+
+
+def literal(value):
+    if value is None:
+        return {"tag": "null"}
+    if type(value) is bool:
+        return {"tag": "boolean", "value": value}
+    if type(value) is str:
+        return {"tag": "string", "value": value}
+    return {"tag": "number", "value": value}
+
+
+def literal_value(ast):
+    return ast.get("value")
+
+
+# the value of a unary or binary operator on literal operand values
+def fold_negate(value):
+    assert type(value) in [int, float]
+    return -value
+
+
+def fold_and(left_value, right_value):
+    return left_value if not is_truthy(left_value) else is_truthy(right_value)
+
+
+def fold_or(left_value, right_value):
+    return left_value if is_truthy(left_value) else is_truthy(right_value)
+
+
+# the truthiness of a left operand that decides the result, for each tag
+short_circuits = {"&&": False, "and": False, "||": True, "or": True}
+
+unary_folds = {
+    "negate": fold_negate,
+    "!": lambda value: not is_truthy(value),
+    "not": lambda value: not is_truthy(value),
+}
+
+binary_folds = {tag: lambda left_value, right_value, tag=tag: binary_operation(tag, left_value, right_value)
+                for tag in [*binary_operations, "==", "!="]}
+binary_folds.update({"&&": fold_and, "and": fold_and, "||": fold_or, "or": fold_or})
+
+
+class Optimizer:
+    """
+    The state of one optimize(): the constants known so far and the report.
+    """
+
+    def __init__(self):
+        self.constants = {}
+        self.report = []
+
+    def fold(self, ast, start, operation, *values):
+        """
+        the literal for operation(*values) in place of ast, or None if it fails;
+        what was reported from inside ast since start is replaced by the fold
+        """
+        try:
+            value = operation(*values)
+        except Exception:
+            return None
+        if type(value) is str and len(value) > longest_folded_string:
+            return None
+        self.report[start:] = [entry for entry in self.report[start:] if entry[0] != "fold"]
+        self.report.append(("fold", ast_to_string(ast), value))
+        return literal(value)
+
+    def node(self, ast):
+        tag = ast["tag"]
+        start = len(self.report)
+        if tag == "identifier":
+            if ast["value"] in self.constants:
+                value = self.constants[ast["value"]]
+                self.report.append(("propagate", ast["value"], value))
+                return literal(value)
+            return ast
+        if tag in unary_folds:
+            value = self.node(ast["value"])
+            if value["tag"] in literal_tags:
+                folded = self.fold(ast, start, unary_folds[tag], literal_value(value))
+                if folded is not None:
+                    return folded
+            return {**ast, "value": value}
+        if tag in binary_folds:
+            left = self.node(ast["left"])
+            # a left operand that decides the result leaves the right one unevaluated
+            if tag in short_circuits and left["tag"] in literal_tags:
+                if is_truthy(literal_value(left)) == short_circuits[tag]:
+                    folded = self.fold(ast, start, lambda: literal_value(left))
+                    if folded is not None:
+                        return folded
+            right = self.node(ast["right"])
+            if left["tag"] in literal_tags and right["tag"] in literal_tags:
+                folded = self.fold(ast, start, binary_folds[tag], literal_value(left), literal_value(right))
+                if folded is not None:
+                    return folded
+            return {**ast, "left": left, "right": right}
+        if tag == "assign":
+            target = ast["target"]
+            if target["tag"] == "complex":
+                target = {**target, "base": self.node(target["base"]), "index": self.node(target["index"])}
+            return {**ast, "target": target, "value": self.node(ast["value"])}
+        if tag == "function":
+            return {**ast, "body": self.node(ast["body"])}
+        # the messages of a failed assert and of a null index show the expression as written
+        if tag == "assert":
+            explanation = ast.get("explanation")
+            return {**ast, "explanation": explanation and self.node(explanation)}
+        if tag == "complex":
+            base = self.node(ast["base"])
+            start = len(self.report)
+            index = self.node(ast["index"])
+            # only an index that can't be null can't end up in that message
+            if index["tag"] not in literal_tags or index["tag"] == "null":
+                del self.report[start:]
+                index = ast["index"]
+            return {**ast, "base": base, "index": index}
+        if tag == "object":
+            items = [{"key": self.node(item["key"]), "value": self.node(item["value"])} for item in ast["items"]]
+            return {**ast, "items": items}
+        # every other node: optimize the nodes in its fields
+        optimized = {}
+        for field, value in ast.items():
+            if type(value) is dict and "tag" in value:
+                value = self.node(value)
+            elif type(value) is list:
+                value = [self.node(item) for item in value]
+            optimized[field] = value
+        return optimized
+
+
+def assignments(ast, counts, parameters):
+    """
+    Count the assignments to each name in ast, and collect the names of
+    parameters. Return False if ast imports a file.
+    """
+    if type(ast) is list:
+        return all([assignments(item, counts, parameters) for item in ast])
+    if type(ast) is not dict:
+        return True
+    tag = ast.get("tag")
+    if tag == "import":
+        return False
+    if tag == "function":
+        parameters.update(parameter["value"] for parameter in ast["parameters"])
+    if tag == "assign" and ast["target"]["tag"] == "identifier":
+        name = ast["target"]["value"]
+        counts[name] = counts.get(name, 0) + 1
+    return all([assignments(value, counts, parameters) for value in ast.values()])
+
+
+# Loop-invariant code motion: an expression in a while loop that has no
+# effects and whose value can't change while the loop runs is computed once,
+# into a variable of its own, before the loop.
+#
+# - It has no effects if it is made of literals, variables, operators and
+#   indexing, and calls of length() and head() (when the program doesn't
+#   define those names itself). + needs a literal operand, so that it can't
+#   be making a new array or object each time round.
+# - Its value can't change if the loop assigns none of its variables, and,
+#   when it reads the contents of arrays or objects (by indexing, length(),
+#   head(), or == and != on anything but literals), assigns no item of any.
+#   A loop that calls any other function (or input()) hoists nothing, as the
+#   call could assign anything with extern.
+# - It must be evaluated each time round before anything observable can
+#   happen: in the condition, outside the right operand of && and ||, or in
+#   the body's leading statements that don't assert, print, branch or leave
+#   the loop.
+#   So the hoisted value is computed no earlier than it was before, except
+#   that parts of the condition or body to its left now run after it, which
+#   changes nothing unless both would fail.
+#
+# What the condition needs is computed right before the loop; what the body
+# needs, under an if on the condition, so it is only computed if the loop
+# runs at least once. That if evaluates the condition once more, so nothing
+# is hoisted from the body of a loop whose condition assigns.
+#
+# The variables ($invariant_1, ...) are dropped again after the loop, by a
+# forget statement, which only the optimizer makes, so they aren't seen when
+# a function made in that environment is printed. A return or exit from
+# inside the loop leaves them there, in an environment that is going away
+# unless a function made in it is kept.
+
+# builtins with no effects whose result is an existing value, not a new one
+pure_builtins = ["length", "head"]
+
+
+class LoopFacts:
+    """
+    What a loop does that can change the value of an expression in it.
+    """
+
+    def __init__(self, loop, rebound):
+        self.assigned = set()
+        self.assigns_items = False
+        self.calls = False
+        self.rebound = rebound
+        self.visit(loop["condition"])
+        self.condition_assigns = bool(self.assigned) or self.assigns_items
+        self.visit(loop["do"])
+
+    def visit(self, ast):
+        if type(ast) is list:
+            for item in ast:
+                self.visit(item)
+            return
+        if type(ast) is not dict:
+            return
+        tag = ast.get("tag")
+        if tag == "function":
+            # its body only runs if it is called, which is a call
+            return
+        if tag == "assign":
+            if ast["target"]["tag"] == "identifier":
+                self.assigned.add(ast["target"]["value"])
+            else:
+                self.assigns_items = True
+        if tag == "call" and not self.builtin_call(ast):
+            self.calls = True
+        if tag == "import":
+            self.calls = True
+        for value in ast.values():
+            self.visit(value)
+
+    def builtin_call(self, ast):
+        function = ast["function"]
+        return (
+            function["tag"] == "identifier"
+            and function["value"] in ["length", "head", "tail", "keys"]
+            and function["value"] not in self.rebound
+        )
+
+
+class Hoister:
+    """
+    The state of hoisting the loop invariants of one program.
+    """
+
+    def __init__(self, rebound, report):
+        # names the program assigns or takes as parameters, so not (only) builtins
+        self.rebound = rebound
+        self.report = report
+        self.count = 0
+
+    def pure(self, ast):
+        """(has no effects, reads the contents of arrays or objects)"""
+        tag = ast["tag"]
+        if tag in literal_tags or tag == "identifier":
+            return True, False
+        if tag in unary_folds:
+            return self.pure(ast["value"])
+        if tag in binary_folds:
+            if tag == "+" and ast["left"]["tag"] not in ["number", "string"] and ast["right"]["tag"] not in ["number", "string"]:
+                return False, False
+            left_pure, left_reads = self.pure(ast["left"])
+            right_pure, right_reads = self.pure(ast["right"])
+            # == and != compare the contents of arrays and objects
+            compares_items = tag in ["==", "!="] and not (
+                ast["left"]["tag"] in literal_tags and ast["right"]["tag"] in literal_tags
+            )
+            return left_pure and right_pure, left_reads or right_reads or compares_items
+        if tag == "complex":
+            base_pure, _ = self.pure(ast["base"])
+            index_pure, _ = self.pure(ast["index"])
+            return base_pure and index_pure, True
+        if tag == "call":
+            function = ast["function"]
+            if function["tag"] != "identifier" or function["value"] not in pure_builtins or function["value"] in self.rebound:
+                return False, False
+            return all(self.pure(argument)[0] for argument in ast["arguments"]), True
+        return False, False
+
+    def invariant(self, ast, facts):
+        if ast["tag"] in literal_tags or ast["tag"] == "identifier":
+            # nothing to gain
+            return False
+        pure, reads_items = self.pure(ast)
+        if not pure or (reads_items and facts.assigns_items):
+            return False
+        return not (variables(ast) & facts.assigned)
+
+    def collect(self, ast, facts, found):
+        """
+        Add to found the largest invariants among the parts of ast evaluated
+        every time ast is.
+        """
+        if self.invariant(ast, facts):
+            found.append(ast)
+            return
+        tag = ast["tag"]
+        if tag in short_circuits:
+            children = [ast["left"]]
+        elif tag in binary_folds:
+            children = [ast["left"], ast["right"]]
+        elif tag in unary_folds:
+            children = [ast["value"]]
+        elif tag == "complex":
+            children = [ast["base"], ast["index"]]
+        elif tag == "call":
+            children = [ast["function"], *ast["arguments"]]
+        elif tag == "list":
+            children = ast["items"]
+        elif tag == "object":
+            children = [node for item in ast["items"] for node in [item["key"], item["value"]]]
+        else:
+            children = []
+        for child in children:
+            self.collect(child, facts, found)
+
+    def leading_invariants(self, body, facts, found):
+        """
+        Collect the invariants of the statements of a loop body that run each
+        time round before anything observable can happen.
+        """
+        for statement in body["statements"]:
+            tag = statement["tag"]
+            if tag == "assign":
+                target = statement["target"]
+                if target["tag"] == "complex":
+                    self.collect(target["base"], facts, found)
+                    self.collect(target["index"], facts, found)
+                self.collect(statement["value"], facts, found)
+            elif tag in ["assert", "print", "if"]:
+                # what they evaluate first still counts, then they may stop, print or branch
+                part = statement.get("value") if tag == "print" else statement["condition"]
+                if part is not None:
+                    self.collect(part, facts, found)
+                return
+            else:
+                return
+
+    def temporary(self, ast, temporaries, hoisted):
+        """the name of the variable holding the value of ast, adding it to hoisted if it is new"""
+        text = ast_to_string(ast)
+        if text not in temporaries:
+            self.count += 1
+            temporaries[text] = f"$invariant_{self.count}"
+            hoisted.append({"tag": "assign", "target": {"tag": "identifier", "value": temporaries[text]}, "value": ast})
+            self.report.append(("hoist", text, temporaries[text]))
+        return temporaries[text]
+
+    def loop(self, loop):
+        """the statements that replace a while loop"""
+        loop = {**loop, "do": self.statement_list(loop["do"])}
+        facts = LoopFacts(loop, self.rebound)
+        if facts.calls:
+            return [loop]
+        in_condition, in_body = [], []
+        self.collect(loop["condition"], facts, in_condition)
+        if not facts.condition_assigns:
+            self.leading_invariants(loop["do"], facts, in_body)
+        temporaries, before, guarded, names = {}, [], [], {}
+        for node in in_condition:
+            names[id(node)] = self.temporary(node, temporaries, before)
+        for node in in_body:
+            names[id(node)] = self.temporary(node, temporaries, guarded)
+        if not names:
+            return [loop]
+        statements = before + [
+            {"tag": "if", "condition": replaced(loop["condition"], names), "then": {"tag": "statement_list", "statements": guarded}}
+        ] * bool(guarded)
+        forget = {"tag": "forget", "names": list(temporaries.values())}
+        return statements + [replaced(loop, names), forget]
+
+    def statement_list(self, ast):
+        statements = []
+        for statement in ast["statements"]:
+            statements.extend(self.statement(statement))
+        return {**ast, "statements": statements}
+
+    def statement(self, ast):
+        """the statements that replace ast, with the loops in it optimized"""
+        if type(ast) is not dict or "tag" not in ast:
+            return [ast]
+        if ast["tag"] == "while":
+            return self.loop(ast)
+        if ast["tag"] in ["statement_list", "program"]:
+            return [self.statement_list(ast)]
+        optimized = {}
+        for field, value in ast.items():
+            if type(value) is dict and value.get("tag") in ["statement_list", "function", "if", "assign"]:
+                [value] = self.statement(value)
+            optimized[field] = value
+        return [optimized]
+
+
+def variables(ast):
+    """the names of the variables ast reads"""
+    if type(ast) is list:
+        return set().union(*[variables(item) for item in ast])
+    if type(ast) is not dict:
+        return set()
+    if ast.get("tag") == "identifier":
+        return {ast["value"]}
+    return set().union(*[variables(value) for value in ast.values()])
+
+
+def replaced(ast, names):
+    """a copy of ast with the nodes whose ids are in names replaced by those variables"""
+    if type(ast) is list:
+        return [replaced(item, names) for item in ast]
+    if type(ast) is not dict:
+        return ast
+    if id(ast) in names:
+        return {"tag": "identifier", "value": names[id(ast)]}
+    return {field: replaced(value, names) for field, value in ast.items()}
+
+
+def optimize(ast, propagate=True, hoist=False):
+    """
+    Fold the constant expressions of a program and, unless propagate is False
+    (for a program that shares its environment), propagate its constants and,
+    if hoist is True, hoist its loop invariants. Returns (the new program,
+    report), where each entry of report is ("fold", expression, value),
+    ("propagate", name, value) or ("hoist", expression, variable).
+    """
+    optimizer = Optimizer()
+    counts, parameters = {}, set()
+    if not assignments(ast, counts, parameters):
+        propagate = False
+    statements = []
+    for statement in ast["statements"]:
+        statement = optimizer.node(statement)
+        statements.append(statement)
+        if (
+            propagate
+            and statement["tag"] == "assign"
+            and statement["target"]["tag"] == "identifier"
+            and not statement["target"].get("extern")
+            and statement["value"]["tag"] in literal_tags
+        ):
+            name = statement["target"]["value"]
+            if counts[name] == 1 and name not in parameters:
+                optimizer.constants[name] = literal_value(statement["value"])
+    ast = {**ast, "statements": statements}
+    if propagate and hoist:
+        ast = Hoister(set(counts) | parameters, optimizer.report).statement_list(ast)
+    return ast, optimizer.report
+
+
+def explain(report):
+    """the report of optimize() as text, one line for each thing it did"""
+    def show(value):
+        return ast_to_string(literal(value))
+    lines = []
+    for kind, before, value in report:
+        if kind == "fold":
+            lines.append(f"folded     {before} => {show(value)}")
+        elif kind == "hoist":
+            lines.append(f"hoisted    {before} => {value}")
+        else:
+            lines.append(f"propagated {before} => {show(value)}")
+    return "\n".join(lines) if lines else "nothing to optimize"
+
+
+def optimized(code, propagate=True, hoist=True):
+    ast, report = optimize(parse(tokenize(code)), propagate, hoist)
+    return [ast_to_string(statement) for statement in ast["statements"]], report
+
+
+def same_as_unoptimized(code):
+    """check that code leaves the same variables optimized or not"""
+    import evaluator
+
+    expected, environment = {}, {}
+    evaluator.evaluate(parse(tokenize(code)), expected)
+    evaluator.evaluate(optimize(parse(tokenize(code)), hoist=True)[0], environment)
+    assert environment == expected, f"{code}: {environment} != {expected}"
+
+
+def test_fold():
+    print("testing fold...")
+    statements, report = optimized('x = 60*60*24; y = "prefix" + "_" + "name"; z = -(-1)')
+    assert statements == ["x = 86400", 'y = "prefix_name"', "z = 1"]
+    assert report[0] == ("fold", "((60*60)*24)", 86400)
+    assert report[1] == ("fold", '(("prefix"+"_")+"name")', "prefix_name")
+    statements, report = optimized('a = [1 < 2, "ab" * 2, 7 % 4 == 3, !0, 0 && f(), 1 || f(), 2 && "", null == null, 1 / 4]')
+    assert statements == ['a = [true,"abab",true,true,0,1,false,true,0.25]']
+    # what would fail at run time, or make a huge string, is left alone
+    statements, report = optimized('a = [1 / 0, true + 1, -"x", "-" * 100000, 1 + f(2 * 3)]')
+    assert statements == ['a = [(1/0),(true+1),(-"x"),("-"*100000),(1+f(6))]']
+    assert report == [("fold", "(2*3)", 6)]
+    long = "a" * (longest_folded_string + 200)
+    statements, report = optimized(f'x = "{long}" || 1; y = "{long}" or 1')
+    assert statements == [f'x = ("{long}"||1)', f'y = ("{long}"||1)'] and report == []
+
+
+def test_propagate():
+    print("testing propagate...")
+    ast, report = optimize(parse(tokenize("day = 60*60*24; week = day * 7; function f(n) { return n * week }; print f(2)")))
+    assert ast_to_string(ast["statements"][1]) == "week = 604800"
+    assert ast_to_string(ast["statements"][2]["value"]["body"]) == "{return (n*604800)}"
+    assert ("propagate", "day", 86400) in report and ("propagate", "week", 604800) in report
+    # not before the assignment, nor where the name is assigned again, a parameter or maybe imported
+    assert optimized("print x; x = 1; print x")[0] == ["print (x)", "x = 1", "print (1)"]
+    assert optimized("x = 1; if (y) { x = 2 }; print x")[0][2] == "print (x)"
+    assert optimized("x = 1; function f() { extern x = 2 }; print x")[0][2] == "print (x)"
+    assert optimized("x = 1; function f(x) { return x }; print x")[0][2] == "print (x)"
+    assert optimized('x = 1; import "other.t"; print x')[0][2] == "print (x)"
+    assert optimized("x = 1; print x", propagate=False)[0][1] == "print (x)"
+    # what error messages show is left as written
+    assert optimized("n = 2; assert n + 1 == 4, n")[0][1] == "assert (((n+1)==4)), 2"
+    assert optimized("x = null; print [1][x]; print [1][f(x)]")[0][1:] == ["print ([1][x])", "print ([1][f(x)])"]
+    assert optimized("n = 1; print [1, 2][n - 1]; print [1][f(n)]")[0][1:] == ["print ([1,2][0])", "print ([1][f(n)])"]
+    # the assignment itself stays, and targets aren't replaced
+    assert optimized("x = [1]; y = 0; x[y] = y + 1")[0][2] == "x[0] = 1"
+
+
+def test_explain():
+    print("testing explain...")
+    ast, report = optimize(parse(tokenize('x = 2 * 3; print x + "a"')))
+    assert explain(report) == "\n".join([
+        "folded     (2*3) => 6",
+        "propagated x => 6",
+    ])
+    assert explain([]) == "nothing to optimize"
+
+
+def test_hoist():
+    print("testing hoist...")
+    code = 'i = 0; while (i < length(data)) { t = t + o["a"]["b"] * i; i = i + 1 }'
+    statements, report = optimized(code)
+    assert statements[1:] == [
+        "$invariant_1 = length(data)",
+        'if ((i<$invariant_1)) {{$invariant_2 = o["a"]["b"]}}',
+        "while ((i<$invariant_1)) {{t = (t+($invariant_2*i));i = (i+1)}}",
+        "forget $invariant_1,$invariant_2",
+    ]
+    assert report == [("hoist", "length(data)", "$invariant_1"), ("hoist", 'o["a"]["b"]', "$invariant_2")]
+    # inner loops first, then what they leave invariant in the outer one
+    statements, _ = optimized("while (i < n) { y = m * 2; while (j < n) { j = j + m * 3 }; i = i + 1 }")
+    assert statements[0] == "if ((i<n)) {{$invariant_2 = (m*2)}}"
+    assert statements[1].startswith("while ((i<n)) {{y = $invariant_2;if ((j<n)) {{$invariant_1 = (m*3)}}")
+    assert statements[1].endswith(";forget $invariant_1;i = (i+1)}}") and statements[2] == "forget $invariant_2"
+    # not with calls that could assign anything, nor what the loop assigns
+    for code in [
+        "while (i < n) { i = f(i) + m * 2 }",
+        "while (i < n) { x = input(); y = m * 2 }",
+        "while (i < n) { i = i + 1; m = m * 2 }",
+        "while (i < n) { d[i] = d[0] * 2; i = i + 1 }",
+        "while (i < n) { d[i] = length(d) + 1; i = i + 1 }",
+        "while (i < n) { same = (a == b); a[0] = 9; i = i + 1 }",
+        "while (i < n) { same = (a != b); a[0] = 9; i = i + 1 }",
+        "length = f; while (i < length(d)) { i = i + 1 }",
+        'while (i < n) { import "other.t"; y = m * 2 }',
+    ]:
+        assert optimized(code)[1] == [], code
+    # nor where they might not be evaluated, nor where the environment is shared
+    for code in [
+        "while (i < n && x[0] > 1) { i = i + 1 }",
+        "while (i < n) { print i; y = m * 2; i = i + 1 }",
+        "while (i < n) { if (i > 1) { y = m * 2 }; i = i + 1 }",
+        "while (i < n) { assert i != 0; y = m / i; z = m * 2; i = i + 1 }",
+    ]:
+        assert optimized(code)[1] == [], code
+    assert optimized("while (i < n * 2) { i = i + 1 }", propagate=False)[1] == []
+    # nor unless asked to
+    assert optimized("while (i < n * 2) { i = i + 1 }", hoist=False)[1] == []
+    # nor from the body when the condition assigns, as the if would run it an extra time
+    for code in [
+        "i=5; m=3; m=m+1; n=0; while (i = i - 1) { y = m * 2; n = n + 1 }",
+        "data=[1,2,3,4,5,6]; k=-1; t=0; m=5; m=m+0; while ((k = k + 1) < length(data)) { y = m * 2; t = t + y }",
+    ]:
+        assert ("hoist", "(m*2)", "$invariant_1") not in optimized(code)[1], code
+        same_as_unoptimized(code)
+    # the variables don't outlive the loop, on any engine
+    import evaluator, machine, compiler, vm, transpiler
+
+    code = """
+        n = 3; n = n + 1; i = 0; while (i < n * 2) { i = i + 1 };
+        function f() { j = 0; while (j < n * 2) { j = j + 1 }; return function() { return j } };
+        g = f()
+    """
+    ast, report = optimize(parse(tokenize(code)), hoist=True)
+    assert [entry[0] for entry in report].count("hoist") == 2
+    for engine in [evaluator, machine, compiler, vm, transpiler]:
+        environment = {}
+        engine.evaluate(ast, environment)
+        assert environment["i"] == 8 and engine.evaluate(parse(tokenize("g()")), environment) == (8, None)
+        for name in ["$invariant_1", "$invariant_2"]:
+            assert name not in environment and name not in environment["g"]["environment"], engine.__name__
+    # == compares what the loop changes in an array
+    same_as_unoptimized("a=[1,2]; b=[1,2]; i=0; c=0; while (i < 3) { same = (a == b); a[0] = 9; i = i + 1; if (same) { c = c + 1 } }")
+
+
+if __name__ == "__main__":
+    test_fold()
+    test_propagate()
+    test_explain()
+    test_hoist()
+    print("done.")
@@ -1,5 +1,7 @@
 from tokenizer import tokenize
 from pprint import pprint
+from collections import deque
+from ll1 import load_tables
 
 # *(&(*& NOTES))
 
@@ -16,7 +18,7 @@ grammar = """
 
     list = "[" expression { "," expression } "]"
     object = "{" [ expression ":" expression { "," expression ":" expression } ] "}"
-    function = "function" "(" [ identifier { "," identifier } ] ")" statements
+    function = "function" "(" [ identifier { "," identifier } ] ")" statement_list
 
     complex_expression = simple_expression { ("[" expression "]") | ("." identifier) | "(" [ expression { "," expression } ] ")" }
 
@@ -33,7 +35,7 @@ grammar = """
 
     return_statement = "return" [ expression ]
     print_statement = "print" [ expression ]
-    function_statement = "function" identifier "(" [ identifier { "," identifier } ] ")" statements
+    function_statement = "function" identifier "(" [ identifier { "," identifier } ] ")" statement_list
 
     if_statement = "if" "(" expression ")" statement_list [ "else" (if_statement | statement_list) ]
     while_statement = "while" "(" expression ")" statement_list
@@ -49,47 +51,107 @@ grammar = """
     program = [ statement { ";" statement } {";"} ]
     """
 
+# FIRST/FOLLOW sets and prediction tables for the grammar above, see ll1.py
+ll1_tables = load_tables(grammar)
+expression_start = ll1_tables["first"]["expression"]
+
+# TOKEN CURSOR
+
+
+class TokenCursor:
+    """
+    A shared position in a token stream.
+
+    The parsing functions advance one cursor in place instead of slicing
+    off the first token, so parsing is linear in the number of tokens.
+    tokens[0] is the current token. Tokens are pulled from the underlying
+    list or iterator only as they are needed.
+    """
+
+    __slots__ = ("origin", "source", "window", "consumed")
+
+    def __init__(self, tokens):
+        self.origin = tokens
+        self.source = iter(tokens)
+        self.window = deque()
+        self.consumed = 0
+
+    def __getitem__(self, index):
+        window = self.window
+        while len(window) <= index:
+            token = next(self.source, None)
+            if token is None:
+                raise IndexError("Read past the end of the token stream.")
+            window.append(token)
+        return window[index]
+
+    def advance(self):
+        self[0]
+        self.window.popleft()
+        self.consumed += 1
+        return self
+
+    def __eq__(self, other):
+        if not isinstance(other, TokenCursor):
+            return NotImplemented
+        return self.origin is other.origin and self.consumed == other.consumed
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"TokenCursor(at {self[0]})"
+
+
+def as_cursor(tokens):
+    if isinstance(tokens, TokenCursor):
+        return tokens
+    return TokenCursor(tokens)
+
+
 # BASIC EXPRESSIONS
 
+# prefix operators and the node tag each one produces
+unary_operators = {
+    "-": "negate",
+    "!": "not",
+}
+
 
 def parse_simple_expression(tokens):
     """
     simple_expression = identifier | <boolean> | <number> | <string> | <null> | list | object | ("-" simple_expression) | ("!" simple_expression) | function | ( "(" expression ")" )
     """
+    tokens = as_cursor(tokens)
 
     token = tokens[0]
 
-    if token["tag"] in {"identifier", "boolean", "number", "string"}:
-        return {"tag": token["tag"], "value": token["value"]}, tokens[1:]
+    if token.tag in {"identifier", "boolean", "number", "string"}:
+        return {"tag": token.tag, "value": token.value}, tokens.advance()
     
-    if token["tag"] == "null":
-        return {"tag": "null"}, tokens[1:]
+    if token.tag == "null":
+        return {"tag": "null"}, tokens.advance()
 
-    if token["tag"] == "[":
+    if token.tag == "[":
         return parse_list(tokens)
 
-    if token["tag"] == "{":
+    if token.tag == "{":
         return parse_object(tokens)
 
-    if token["tag"] == "-":
-        value, tokens = parse_simple_expression(tokens[1:])
-        return {"tag": "negate", "value": value}, tokens
-
-    if token["tag"] == "!":
-        value, tokens = parse_simple_expression(tokens[1:])
-        return {"tag": "not", "value": value}, tokens
+    if token.tag in unary_operators:
+        value, tokens = parse_simple_expression(tokens.advance())
+        return {"tag": unary_operators[token.tag], "value": value}, tokens
 
-    if token["tag"] == "function":
+    if token.tag == "function":
         return parse_function(tokens)
 
-    if token["tag"] == "(":
-        ast, tokens = parse_expression(tokens[1:])
+    if token.tag == "(":
+        ast, tokens = parse_expression(tokens.advance())
         assert (
-            tokens[0]["tag"] == ")"
-        ), f"Expected ')' at position {tokens[0]['position']}"
-        return ast, tokens[1:]
+            tokens[0].tag == ")"
+        ), f"Expected ')' at position {tokens[0].position}"
+        return ast, tokens.advance()
     
-    assert False, f"Unexpected token '{token['tag']}' at position {token['position']}"
+    assert False, f"Unexpected token '{token.tag}' at position {token.position}"
 
 
 def test_parse_simple_expression():
@@ -167,20 +229,21 @@ def parse_list(tokens):
     """
     list = "[" expression { "," expression } "]"
     """
-    assert tokens[0]["tag"] == "[", f"Expected '[' at position {tokens[0]['position']}"
-    tokens = tokens[1:]
+    tokens = as_cursor(tokens)
+    assert tokens[0].tag == "[", f"Expected '[' at position {tokens[0].position}"
+    tokens.advance()
     items = []
-    if tokens[0]["tag"] != "]":
+    if tokens[0].tag != "]":
         value, tokens = parse_expression(tokens)
         items.append(value)
-        while tokens[0]["tag"] == ",":
-            tokens = tokens[1:]
-            if tokens[0]["tag"] == "]": # allow for extra ","
+        while tokens[0].tag == ",":
+            tokens.advance()
+            if tokens[0].tag == "]": # allow for extra ","
                 break; 
             value, tokens = parse_expression(tokens)
             items.append(value)
-    assert tokens[0]["tag"] == "]", f"Expected ']' at position {tokens[0]['position']}, got {tokens[0:]}."
-    return {"tag": "list", "items": items}, tokens[1:]
+    assert tokens[0].tag == "]", f"Expected ']' at position {tokens[0].position}, got {tokens[0]}."
+    return {"tag": "list", "items": items}, tokens.advance()
 
 
 def test_parse_list():
@@ -235,30 +298,31 @@ def parse_object(tokens):
     """
     object = "{" [ expression ":" expression { "," expression ":" expression } ] "}"
     """
-    assert tokens[0]["tag"] == "{", f"Expected '{{' at position {tokens[0]['position']}"
-    tokens = tokens[1:]
+    tokens = as_cursor(tokens)
+    assert tokens[0].tag == "{", f"Expected '{{' at position {tokens[0].position}"
+    tokens.advance()
     items = []
-    if tokens[0]["tag"] != "}":
+    if tokens[0].tag != "}":
         key, tokens = parse_expression(tokens)
         assert (
-            tokens[0]["tag"] == ":"
-        ), f"Expected ':' at position {tokens[0]['position']}"
-        tokens = tokens[1:]
+            tokens[0].tag == ":"
+        ), f"Expected ':' at position {tokens[0].position}"
+        tokens.advance()
         value, tokens = parse_expression(tokens)
         items.append({"key": key, "value": value})
-        while tokens[0]["tag"] == ",":
-            tokens = tokens[1:]
-            if tokens[0]["tag"] == "}": # allow for extra ","
+        while tokens[0].tag == ",":
+            tokens.advance()
+            if tokens[0].tag == "}": # allow for extra ","
                 break; 
             key, tokens = parse_expression(tokens)
             assert (
-                tokens[0]["tag"] == ":"
-            ), f"Expected ':' at position {tokens[0]['position']}"
-            tokens = tokens[1:]
+                tokens[0].tag == ":"
+            ), f"Expected ':' at position {tokens[0].position}"
+            tokens.advance()
             value, tokens = parse_expression(tokens)
             items.append({"key": key, "value": value})
-    assert tokens[0]["tag"] == "}", f"Expected '}}' at position {tokens[0]['position']}"
-    return {"tag": "object", "items": items}, tokens[1:]
+    assert tokens[0].tag == "}", f"Expected '}}' at position {tokens[0].position}"
+    return {"tag": "object", "items": items}, tokens.advance()
 
 
 def test_parse_object():
@@ -331,36 +395,44 @@ def test_parse_object():
     assert ast == {"tag": "object", "items": []}
 
 
+def parameter_node(token):
+    # with its keys in the order the dict token had them, as printing a function shows them
+    return {"tag": "identifier", "position": token["position"], "value": token["value"]}
+
+
 def parse_function(tokens):
     """
-    function = "function" "(" [ identifier { "," identifier } ] ")" statements
+    function = "function" "(" [ identifier { "," identifier } ] ")" statement_list
     """
+    tokens = as_cursor(tokens)
     assert (
-        tokens[0]["tag"] == "function"
-    ), f"Expected 'function' at position {tokens[0]['position']}"
-    tokens = tokens[1:]
-    assert tokens[0]["tag"] == "(", f"Expected '(' at position {tokens[0]['position']}"
-    tokens = tokens[1:]
+        tokens[0].tag == "function"
+    ), f"Expected 'function' at position {tokens[0].position}"
+    return parse_function_rest(tokens.advance())
+
+
+def parse_function_rest(tokens):
+    """
+    the parameters and body of a function, after the "function" keyword (and name)
+    """
+    assert tokens[0].tag == "(", f"Expected '(' at position {tokens[0].position}"
+    tokens.advance()
     parameters = []
-    if tokens[0]["tag"] != ")":
+    if tokens[0].tag != ")":
         assert (
-            tokens[0]["tag"] == "identifier"
-        ), f"Expected identifier at position {tokens[0]['position']}"
-        if "line" in tokens[0]:
-            del tokens[0]["line"]
-        parameters.append(tokens[0])
-        tokens = tokens[1:]
-        while tokens[0]["tag"] == ",":
-            tokens = tokens[1:]
+            tokens[0].tag == "identifier"
+        ), f"Expected identifier at position {tokens[0].position}"
+        parameters.append(parameter_node(tokens[0]))
+        tokens.advance()
+        while tokens[0].tag == ",":
+            tokens.advance()
             assert (
-                tokens[0]["tag"] == "identifier"
-            ), f"Expected identifier at position {tokens[0]['position']}"
-            if "line" in tokens[0]:
-                del tokens[0]["line"]
-            parameters.append(tokens[0])
-            tokens = tokens[1:]
-    assert tokens[0]["tag"] == ")", f"Expected ']' at position {tokens[0]['position']}"
-    tokens = tokens[1:]
+                tokens[0].tag == "identifier"
+            ), f"Expected identifier at position {tokens[0].position}"
+            parameters.append(parameter_node(tokens[0]))
+            tokens.advance()
+    assert tokens[0].tag == ")", f"Expected ']' at position {tokens[0].position}"
+    tokens.advance()
     body_statements, tokens = parse_statement_list(tokens)
     return {
         "tag": "function",
@@ -371,7 +443,7 @@ def parse_function(tokens):
 
 def test_parse_function():
     """
-    function = "function" "(" [ identifier { "," identifier } ] ")" statements
+    function = "function" "(" [ identifier { "," identifier } ] ")" statement_list
     """
     print("testing parse_function...")
     ast, tokens = parse_function(tokenize("function(x,y){}"))
@@ -443,42 +515,43 @@ def test_parse_function():
 
 def parse_complex_expression(tokens):
     """
-    complex_expression = simple_expression { ( ) | ("." identifier) | "(" [ expression { "," expression } ] ")" }
+    complex_expression = simple_expression { ("[" expression "]") | ("." identifier) | "(" [ expression { "," expression } ] ")" }
     """
+    tokens = as_cursor(tokens)
     ast, tokens = parse_simple_expression(tokens)
-    while tokens[0]["tag"] in ["[", ".", "("]:
-        if tokens[0]["tag"] == "[":
-            tokens = tokens[1:]
+    while tokens[0].tag in ["[", ".", "("]:
+        if tokens[0].tag == "[":
+            tokens.advance()
             index_ast, tokens = parse_expression(tokens)
             assert (
-                tokens[0]["tag"] == "]"
-            ), f"Expected ']' at position {tokens[0]['position']}"
-            tokens = tokens[1:]
+                tokens[0].tag == "]"
+            ), f"Expected ']' at position {tokens[0].position}"
+            tokens.advance()
             ast = {"tag": "complex", "base": ast, "index": index_ast}
-        if tokens[0]["tag"] == ".":
-            tokens = tokens[1:]
+        if tokens[0].tag == ".":
+            tokens.advance()
             assert (
-                tokens[0]["tag"] == "identifier"
-            ), f"Expected identifier at position {tokens[0]['position']}"
+                tokens[0].tag == "identifier"
+            ), f"Expected identifier at position {tokens[0].position}"
             ast = {
                 "tag": "complex",
                 "base": ast,
-                "index": {"tag": "string", "value": tokens[0]["value"]},
+                "index": {"tag": "string", "value": tokens[0].value},
             }
-            tokens = tokens[1:]
-        if tokens[0]["tag"] == "(":
-            tokens = tokens[1:]
+            tokens.advance()
+        if tokens[0].tag == "(":
+            tokens.advance()
             items = []
-            if tokens[0]["tag"] != ")":
+            if tokens[0].tag != ")":
                 value, tokens = parse_expression(tokens)
                 items.append(value)
-                while tokens[0]["tag"] == ",":
-                    value, tokens = parse_simple_expression(tokens[1:])
+                while tokens[0].tag == ",":
+                    value, tokens = parse_expression(tokens.advance())
                     items.append(value)
             assert (
-                tokens[0]["tag"] == ")"
-            ), f"Expected ')' at position {tokens[0]['position']}"
-            tokens = tokens[1:]
+                tokens[0].tag == ")"
+            ), f"Expected ')' at position {tokens[0].position}"
+            tokens.advance()
             ast = {"tag": "call", "function": ast, "arguments": items}
     return ast, tokens
 
@@ -488,6 +561,12 @@ def test_parse_complex_expression():
     complex_expression = simple_expression { ("[" expression "]") | ("." identifier) | "(" [ expression { "," expression } ] ")" }
     """
     print("testing parse_complex_expression...")
+    # every argument is a full expression
+    assert parse_complex_expression(tokenize("f(1, 2 + 3)"))[0]["arguments"][1] == {
+        "tag": "+",
+        "left": {"tag": "number", "value": 2},
+        "right": {"tag": "number", "value": 3},
+    }
     for s in ["x", '{"a":4,"b":"x"}', "{}"]:
         t = tokenize(s)
         assert parse_complex_expression(t) == parse_simple_expression(t)
@@ -535,6 +614,42 @@ def test_parse_complex_expression():
     }
 
 
+# BINARY EXPRESSIONS
+
+# binding power of each binary operator, loosest first.
+# every level is left associative; adding an operator is a table entry.
+binary_precedence = {
+    "||": 1,
+    "&&": 2,
+    "<": 3,
+    ">": 3,
+    "<=": 3,
+    ">=": 3,
+    "==": 3,
+    "!=": 3,
+    "+": 4,
+    "-": 4,
+    "*": 5,
+    "/": 5,
+    "%": 5,
+}
+
+
+def parse_binary_expression(tokens, min_precedence=1):
+    """
+    precedence climbing over binary_precedence, with complex_expression operands
+    """
+    tokens = as_cursor(tokens)
+    node, tokens = parse_complex_expression(tokens)
+    while True:
+        tag = tokens[0].tag
+        precedence = binary_precedence.get(tag)
+        if precedence is None or precedence < min_precedence:
+            return node, tokens
+        next_node, tokens = parse_binary_expression(tokens.advance(), precedence + 1)
+        node = {"tag": tag, "left": node, "right": next_node}
+
+
 # ARITHMETIC EXPRESSIONS
 
 
@@ -559,12 +674,7 @@ def parse_arithmetic_term(tokens):
     """
     arithmetic_term = arithmetic_factor { ("*" | "/" | "%") arithmetic_factor }
     """
-    node, tokens = parse_arithmetic_factor(tokens)
-    while tokens[0]["tag"] in ["*", "/", "%"]:
-        tag = tokens[0]["tag"]
-        next_node, tokens = parse_arithmetic_factor(tokens[1:])
-        node = {"tag": tag, "left": node, "right": next_node}
-    return node, tokens
+    return parse_binary_expression(tokens, binary_precedence["*"])
 
 
 def test_parse_arithmetic_term():
@@ -612,12 +722,7 @@ def parse_arithmetic_expression(tokens):
     """
     arithmetic_expression = arithmetic_term { ("+" | "-") arithmetic_term }
     """
-    node, tokens = parse_arithmetic_term(tokens)
-    while tokens[0]["tag"] in ["+", "-"]:
-        tag = tokens[0]["tag"]
-        next_node, tokens = parse_arithmetic_term(tokens[1:])
-        node = {"tag": tag, "left": node, "right": next_node}
-    return node, tokens
+    return parse_binary_expression(tokens, binary_precedence["+"])
 
 
 def test_parse_arithmetic_expression():
@@ -682,12 +787,7 @@ def parse_relational_expression(tokens):
     """
     relational_expression = arithmetic_expression { ("<" | ">" | "<=" | ">=" | "==" | "!=") arithmetic_expression }
     """
-    node, tokens = parse_arithmetic_expression(tokens)
-    while tokens[0]["tag"] in ["<", ">", "<=", ">=", "==", "!="]:
-        tag = tokens[0]["tag"]
-        next_node, tokens = parse_arithmetic_expression(tokens[1:])
-        node = {"tag": tag, "left": node, "right": next_node}
-    return node, tokens
+    return parse_binary_expression(tokens, binary_precedence["<"])
 
 
 def test_parse_relational_expression():
@@ -742,12 +842,7 @@ def parse_logical_term(tokens):
     """
     logical_term = logical_factor { "&&" logical_factor }
     """
-    node, tokens = parse_logical_factor(tokens)
-    while tokens[0]["tag"] == "&&":
-        tag = tokens[0]["tag"]
-        next_node, tokens = parse_logical_factor(tokens[1:])
-        node = {"tag": tag, "left": node, "right": next_node}
-    return node, tokens
+    return parse_binary_expression(tokens, binary_precedence["&&"])
 
 
 def test_parse_logical_term():
@@ -776,12 +871,7 @@ def parse_logical_expression(tokens):
     """
     logical_expression = logical_term { "||" logical_term }
     """
-    node, tokens = parse_logical_term(tokens)
-    while tokens[0]["tag"] == "||":
-        tag = tokens[0]["tag"]
-        next_node, tokens = parse_logical_term(tokens[1:])
-        node = {"tag": tag, "left": node, "right": next_node}
-    return node, tokens
+    return parse_binary_expression(tokens, binary_precedence["||"])
 
 
 def test_parse_logical_expression():
@@ -813,15 +903,15 @@ def parse_assignment_expression(tokens):
     """
     assignment_expression = [ "extern" ] logical_expression [ "=" assignment_expression ]
     """
+    tokens = as_cursor(tokens)
     extern = False
-    if tokens[0]["tag"] == "extern":
+    if tokens[0].tag == "extern":
         extern = True 
-        tokens = tokens[1:]       
+        tokens.advance()
+    left, tokens = parse_binary_expression(tokens)
 
-    left, tokens = parse_logical_expression(tokens)
-
-    if tokens[0]["tag"] == "=":
-        tokens = tokens[1:]
+    if tokens[0].tag == "=":
+        tokens.advance()
         right, tokens = parse_assignment_expression(tokens)
 
         # extern is only valid for simple identifiers
@@ -931,17 +1021,24 @@ def parse_statement_list(tokens):
     """
     statement_list = "{" statement { ";" statement } "}"
     """
-    assert tokens[0]["tag"] == "{", f"Expected '{{' at position {tokens[0]['position']}"
-    tokens = tokens[1:]
+    tokens = as_cursor(tokens)
+    assert tokens[0].tag == "{", f"Expected '{{' at position {tokens[0].position}"
+    statements, tokens = parse_statements(tokens.advance(), "}")
+    return {"tag": "statement_list", "statements": statements}, tokens.advance()
+
+
+def parse_statements(tokens, terminator):
+    """
+    statements separated by ";", up to (but not including) the terminator tag
+    """
     statements = []
     while True:
         # terminate at end of statement list
-        if tokens[0]["tag"] == "}":
-            tokens = tokens[1:]             
-            return {"tag": "statement_list", "statements": statements}, tokens
+        if tokens[0].tag == terminator:
+            return statements, tokens
         # skip extra separators
-        if tokens[0]["tag"] == ";":
-            tokens = tokens[1:]             
+        if tokens[0].tag == ";":
+            tokens.advance()
             continue
         # parse a statement and add it to the list
         statement, tokens = parse_statement(tokens)
@@ -953,7 +1050,7 @@ def parse_statement_list(tokens):
         if statement["tag"] == "assign" and statement["value"]["tag"] == "function":
             continue        
         # otherwise require a terminator
-        assert tokens[0]["tag"] in [";","}"], f"Statement terminator missing {tokens}."
+        assert tokens[0].tag in [";", terminator], f"Statement terminator missing at position {tokens[0].position}."
 
 def test_parse_statement_list():
     """
@@ -992,26 +1089,27 @@ def parse_if_statement(tokens):
     """
     if_statement = "if" "(" expression ")" statement_list [ "else" (if_statement | statement_list) ]
     """
-    assert tokens[0]["tag"] == "if"
-    tokens = tokens[1:]
-    if tokens[0]["tag"] != "(":
+    tokens = as_cursor(tokens)
+    assert tokens[0].tag == "if"
+    tokens.advance()
+    if tokens[0].tag != "(":
         raise Exception(f"Expected '(': {tokens[0]}")
-    condition, tokens = parse_expression(tokens[1:])
-    if tokens[0]["tag"] != ")":
+    condition, tokens = parse_expression(tokens.advance())
+    if tokens[0].tag != ")":
         raise Exception(f"Expected ')': {tokens[0]}")
-    then_statements, tokens = parse_statement_list(tokens[1:])
+    then_statements, tokens = parse_statement_list(tokens.advance())
     node = {
         "tag": "if",
         "condition": condition,
         "then": then_statements,
     }
-    if tokens[0]["tag"] == "else":
-        tokens = tokens[1:]
-        assert tokens[0]["tag"] in [
+    if tokens[0].tag == "else":
+        tokens.advance()
+        assert tokens[0].tag in [
             "{",
             "if",
         ], "Else must be followed by statements or if statement."
-        if tokens[0]["tag"] == "{":
+        if tokens[0].tag == "{":
             else_statements, tokens = parse_statement_list(tokens)
         else:
             else_statements, tokens = parse_if_statement(tokens)
@@ -1058,14 +1156,15 @@ def parse_while_statement(tokens):
     """
     while_statement = "while" "(" expression ")" statement_list
     """
-    assert tokens[0]["tag"] == "while"
-    tokens = tokens[1:]
-    if tokens[0]["tag"] != "(":
+    tokens = as_cursor(tokens)
+    assert tokens[0].tag == "while"
+    tokens.advance()
+    if tokens[0].tag != "(":
         raise Exception(f"Expected '(': {tokens[0]}")
-    condition, tokens = parse_expression(tokens[1:])
-    if tokens[0]["tag"] != ")":
+    condition, tokens = parse_expression(tokens.advance())
+    if tokens[0].tag != ")":
         raise Exception(f"Expected ')': {tokens[0]}")
-    do_statements, tokens = parse_statement_list(tokens[1:])
+    do_statements, tokens = parse_statement_list(tokens.advance())
     return {"tag": "while", "condition": condition, "do": do_statements}, tokens
 
 
@@ -1089,9 +1188,10 @@ def parse_return_statement(tokens):
     """
     return_statement = "return" [ expression ]
     """
-    assert tokens[0]["tag"] == "return"
-    tokens = tokens[1:]
-    if tokens[0]["tag"] in ["}", ";", None]:
+    tokens = as_cursor(tokens)
+    assert tokens[0].tag == "return"
+    tokens.advance()
+    if tokens[0].tag not in expression_start:
         value = None
         return {"tag": "return"}, tokens
     else:
@@ -1120,9 +1220,10 @@ def parse_print_statement(tokens):
     """
     print_statement = "print" [ expression ]
     """
-    assert tokens[0]["tag"] == "print"
-    tokens = tokens[1:]
-    if tokens[0]["tag"] in ["}", ";", None]:
+    tokens = as_cursor(tokens)
+    assert tokens[0].tag == "print"
+    tokens.advance()
+    if tokens[0].tag not in expression_start:
         # no expression
         return {"tag": "print", "value": None}, tokens
     else:
@@ -1142,9 +1243,10 @@ def parse_exit_statement(tokens):
     """
     exit_statement = "exit" [ expression ]
     """
-    assert tokens[0]["tag"] == "exit"
-    tokens = tokens[1:]
-    if tokens[0]["tag"] in ["}", ";", None]:
+    tokens = as_cursor(tokens)
+    assert tokens[0].tag == "exit"
+    tokens.advance()
+    if tokens[0].tag not in expression_start:
         # no expression
         return {"tag": "exit", "value": None}, tokens
     else:
@@ -1164,8 +1266,9 @@ def parse_import_statement(tokens):
     """
     import_statement = "import" expression
     """
-    assert tokens[0]["tag"] == "import"
-    tokens = tokens[1:]
+    tokens = as_cursor(tokens)
+    assert tokens[0].tag == "import"
+    tokens.advance()
     value, tokens = parse_expression(tokens)
     return {"tag": "import", "value": value}, tokens
 
@@ -1182,8 +1285,9 @@ def parse_break_statement(tokens):
     """
     break_statement = "break"
     """
-    assert tokens[0]["tag"] == "break"
-    tokens = tokens[1:]
+    tokens = as_cursor(tokens)
+    assert tokens[0].tag == "break"
+    tokens.advance()
     return {"tag": "break"}, tokens
 
 
@@ -1199,8 +1303,9 @@ def parse_continue_statement(tokens):
     """
     continue_statement = "continue"
     """
-    assert tokens[0]["tag"] == "continue"
-    tokens = tokens[1:]
+    tokens = as_cursor(tokens)
+    assert tokens[0].tag == "continue"
+    tokens.advance()
     return {"tag": "continue"}, tokens
 
 
@@ -1215,30 +1320,27 @@ def test_parse_continue_statement():
 
 def parse_function_statement(tokens):
     """
-    function_statement = "function" identifier "(" [ identifier { "," identifier } ] ")" statements
-    """
-    assert tokens[0]["tag"] == "function"
-    tokens = tokens[1:]
-    assert tokens[0]["tag"] == "identifier"
-    identifier_token = tokens[0]
-    tokens = tokens[1:]
-    tokens = [
-        identifier_token,
-        {"tag": "=", "value": "="},
-        {"tag": "function", "value": "function"},
-    ] + tokens
-    return parse_assignment_expression(tokens)
+    function_statement = "function" identifier "(" [ identifier { "," identifier } ] ")" statement_list
+    """
+    tokens = as_cursor(tokens)
+    assert tokens[0].tag == "function"
+    tokens.advance()
+    assert tokens[0].tag == "identifier"
+    target = {"tag": "identifier", "value": tokens[0].value}
+    value, tokens = parse_function_rest(tokens.advance())
+    return {"tag": "assign", "target": target, "value": value}, tokens
 
     
 def parse_assert_statement(tokens):
     """
     assert_statement = "assert" expression [ "," expression ]
     """
-    assert tokens[0]["tag"] == "assert"
-    tokens = tokens[1:]
+    tokens = as_cursor(tokens)
+    assert tokens[0].tag == "assert"
+    tokens.advance()
     condition, tokens = parse_expression(tokens)
-    if tokens[0]["tag"] == ",":
-        tokens = tokens[1:]
+    if tokens[0].tag == ",":
+        tokens.advance()
         explanation, tokens = parse_expression(tokens)
         return {"tag": "assert", "condition": condition, "explanation": explanation},   tokens
     else:
@@ -1257,7 +1359,7 @@ def test_parse_assert_statement():
 
 def test_parse_function_statement():
     """
-    function_statement = "function" identifier "(" [ identifier { "," identifier } ] ")" statements
+    function_statement = "function" identifier "(" [ identifier { "," identifier } ] ")" statement_list
     """
     print("testing parse_function_statement...")
     ast, result = parse_function_statement(tokenize("function x(y){2}"))
@@ -1275,33 +1377,32 @@ def test_parse_function_statement():
     }
 
 
+# "function" also starts an expression; the table predicts the first listed alternative
+statement_predictions = ll1_tables["predict"]["statement"]
+statement_parsers = {
+    "if_statement": parse_if_statement,
+    "while_statement": parse_while_statement,
+    "function_statement": parse_function_statement,
+    "return_statement": parse_return_statement,
+    "print_statement": parse_print_statement,
+    "exit_statement": parse_exit_statement,
+    "import_statement": parse_import_statement,
+    "break_statement": parse_break_statement,
+    "continue_statement": parse_continue_statement,
+    "assert_statement": parse_assert_statement,
+    "expression": parse_expression,
+}
+
+
 def parse_statement(tokens):
     """
     statement = if_statement | while_statement | function_statement | return_statement | print_statement | exit_statement | import_statement | break_statement | continue_statement | assert_statement | expression
     """
-    tag = tokens[0]["tag"]
+    tokens = as_cursor(tokens)
     # note: none of these consumes a token
-    if tag == "if":
-        return parse_if_statement(tokens)
-    if tag == "while":
-        return parse_while_statement(tokens)
-    if tag == "function":
-        return parse_function_statement(tokens)
-    if tag == "return":
-        return parse_return_statement(tokens)
-    if tag == "print":
-        return parse_print_statement(tokens)
-    if tag == "exit":
-        return parse_exit_statement(tokens)
-    if tag == "import":
-        return parse_import_statement(tokens)
-    if tag == "break":
-        return parse_break_statement(tokens)
-    if tag == "continue":
-        return parse_continue_statement(tokens)
-    if tag == "assert":
-        return parse_assert_statement(tokens)
-    return parse_expression(tokens)
+    # tags that can't start a statement fall through to report an expression error
+    rule = statement_predictions.get(tokens[0].tag, "expression")
+    return statement_parsers[rule](tokens)
 
 
 def test_parse_statement():
@@ -1335,16 +1436,23 @@ def test_parse_statement():
         parse_statement(tokenize("function x(y){2}"))[0]
         == parse_function_statement(tokenize("function x(y){2}"))[0]
     )
+    # the prediction table comes from the grammar and covers every keyword
+    assert statement_predictions["assert"] == "assert_statement"
+    assert statement_predictions["identifier"] == "expression"
+    assert (
+        parse_statement(tokenize("assert 1, 2"))[0]
+        == parse_assert_statement(tokenize("assert 1, 2"))[0]
+    )
+    assert parse_statement(tokenize("x = 1"))[0] == parse_expression(tokenize("x = 1"))[0]
 
 
 def parse_program(tokens):
     """
-    program = [ statement { ";" statement } ]
+    program = [ statement { ";" statement } {";"} ]
     """
-    tokens = [{'tag': '{'}] + tokens[:-1] + [{'tag': '}'}] + tokens[-1:]
-    ast, tokens = parse_statement_list(tokens)
-    ast["tag"] = "program"
-    return ast, tokens
+    tokens = as_cursor(tokens)
+    statements, tokens = parse_statements(tokens, None)
+    return {"tag": "program", "statements": statements}, tokens
 
 
 def test_parse_program():
@@ -1374,6 +1482,7 @@ def test_parse_program():
 
 
 def parse(tokens):
+    # tokens can be a list or a lazy token stream
     ast, tokens = parse_program(tokens)
     return ast
 
@@ -1440,6 +1549,41 @@ def test_parse():
     ast = parse(tokens)
 
 
+def test_parse_binary_expression():
+    print("testing parse_binary_expression")
+    assert parse_binary_expression(tokenize("a+b*c<d"))[0] == {
+        "tag": "<",
+        "left": {
+            "tag": "+",
+            "left": {"tag": "identifier", "value": "a"},
+            "right": {
+                "tag": "*",
+                "left": {"tag": "identifier", "value": "b"},
+                "right": {"tag": "identifier", "value": "c"},
+            },
+        },
+        "right": {"tag": "identifier", "value": "d"},
+    }
+    # a minimum precedence stops at looser operators
+    ast, tokens = parse_binary_expression(tokenize("a*b+c"), binary_precedence["*"])
+    assert ast["tag"] == "*" and tokens[0]["tag"] == "+"
+
+
+def test_token_cursor():
+    print("testing token cursor")
+    # sub-parsers share one cursor and advance it in place
+    tokens = as_cursor(tokenize("1 + 2; x"))
+    ast, remaining = parse_expression(tokens)
+    assert remaining is tokens
+    assert tokens[0]["tag"] == ";"
+    # a lazy token stream parses the same as a list
+    source = "function f(x) { return x + 1 }; print f(2)"
+    assert parse(iter(tokenize(source))) == parse(tokenize(source))
+    # a long program parses in linear time
+    ast = parse(tokenize("x = x + 1;" * 20000))
+    assert len(ast["statements"]) == 20000
+
+
 if __name__ == "__main__":
     # List of all test functions
     test_functions = [
@@ -1485,3 +1629,5 @@ if __name__ == "__main__":
     #     print(f"Untested grammar = [[[ {test_grammar} ]]]")
 
     test_parse()
+    test_parse_binary_expression()
+    test_token_cursor()
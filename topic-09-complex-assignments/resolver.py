@@ -0,0 +1,243 @@
+import reprlib
+
+from tokenizer import tokenize
+from parser import parse
+from evaluator import __builtin_functions
+
+# Lexical addressing: resolve identifiers to (depth, slot) before running.
+#
+# A function's locals are its parameters and every name it assigns (without
+# extern) outside of nested functions, so they are known from its AST. Each
+# gets a slot, and a call keeps them in a Frame: a fixed-size list plus the
+# environment the function was defined in. An identifier then resolves to
+# the number of frames to go up and the slot to read there.
+#
+# Assignment makes a name local only when it runs, so until then its slot
+# holds `unbound`, and reading it continues the search by name in the
+# enclosing environments, like the tree evaluator would. Scopes that aren't
+# resolved keep using dict environments: the program itself (whose names
+# come from outside, the REPL and imports) and any function that imports a
+# file into its own environment.
+
+# the value of a slot whose name hasn't been assigned yet
+unbound = object()
+
+
+class Frame:
+    """
+    The environment of one call of a resolved function.
+    """
+
+    __slots__ = ("slots", "parent", "scope")
+
+    def __init__(self, slots, parent, scope):
+        self.slots = slots
+        self.parent = parent
+        self.scope = scope
+
+    # the dict environment protocol, for the other engines calling functions defined here
+
+    def __contains__(self, identifier):
+        if identifier == "$parent":
+            return self.parent is not None
+        slot = self.scope.names.get(identifier)
+        return slot is not None and self.slots[slot] is not unbound
+
+    def __getitem__(self, identifier):
+        if identifier == "$parent":
+            return self.parent
+        if identifier not in self:
+            raise KeyError(identifier)
+        return self.slots[self.scope.names[identifier]]
+
+    def __setitem__(self, identifier, value):
+        assert identifier in self.scope.names, f"'{identifier}' is not a local of this function"
+        self.slots[self.scope.names[identifier]] = value
+
+    def get(self, identifier, default=None):
+        return self[identifier] if identifier in self else default
+
+    # a frame printed inside itself (through a closure in it) shows as {...}, as a dict does
+    @reprlib.recursive_repr("{...}")
+    def __repr__(self):
+        # the parameters, "$parent", then the other locals, as the tree
+        # evaluator shows a call's environment (with its locals in the order
+        # they appear in the function rather than the order they were assigned)
+        items = {}
+        parameter_count = len(set(self.scope.parameters))
+        for index, (name, slot) in enumerate(self.scope.names.items()):
+            if index == parameter_count:
+                items["$parent"] = self.parent
+            if self.slots[slot] is not unbound:
+                items[name] = self.slots[slot]
+        items.setdefault("$parent", self.parent)
+        return repr(items)
+
+
+class Scope:
+    """
+    What the compiler knows about an environment: for a resolved function,
+    the slot of each of its locals; names is None for a dict environment.
+    """
+
+    __slots__ = ("names", "parameters", "parent")
+
+    def __init__(self, names, parameters, parent):
+        self.names = names
+        # the slot of each parameter, in order
+        self.parameters = parameters
+        self.parent = parent
+
+    @property
+    def resolved(self):
+        return self.names is not None
+
+    def address(self, name):
+        """
+        (depth, slot) of the nearest resolved scope that has name as a local,
+        or (depth, None) where depth reaches the first dict environment.
+        """
+        depth = 0
+        scope = self
+        while scope is not None and scope.resolved:
+            if name in scope.names:
+                return depth, scope.names[name]
+            scope = scope.parent
+            depth += 1
+        return depth, None
+
+
+def assigned_names(ast, names):
+    """
+    Add the names ast assigns to, outside of nested functions, to names.
+    Return False if ast imports a file (so any name could be assigned).
+    """
+    if type(ast) is list:
+        return all([assigned_names(item, names) for item in ast])
+    if type(ast) is not dict:
+        return True
+    tag = ast.get("tag")
+    if tag == "function":
+        return True
+    if tag == "import":
+        return False
+    if tag == "assign" and ast["target"]["tag"] == "identifier" and not ast["target"].get("extern"):
+        names.setdefault(ast["target"]["value"], len(names))
+    return all([assigned_names(value, names) for value in ast.values()])
+
+
+def function_scope(parameters, body, parent):
+    """
+    The scope of a function with these parameters and body, defined in parent
+    (None when that isn't known).
+    """
+    names = {}
+    for parameter in parameters:
+        names.setdefault(parameter["value"], len(names))
+    if not assigned_names(body, names):
+        return Scope(None, None, parent)
+    return Scope(names, [names[parameter["value"]] for parameter in parameters], parent)
+
+
+program_scope = Scope(None, None, None)
+
+
+def lookup(name, environment):
+    """
+    The value of name, searching environment and the ones it is in by name.
+    """
+    while environment is not None:
+        if type(environment) is Frame:
+            slot = environment.scope.names.get(name)
+            if slot is not None and environment.slots[slot] is not unbound:
+                return environment.slots[slot]
+            environment = environment.parent
+        else:
+            if name in environment:
+                return environment[name]
+            environment = environment.get("$parent")
+    if name in __builtin_functions:
+        return {"tag": "builtin", "name": name}
+    raise Exception(f"Unknown identifier: '{name}'")
+
+
+def find(name, environment):
+    """
+    The (container, key) where extern name = ... stores its value: the
+    nearest environment that has name.
+    """
+    while environment is not None:
+        if type(environment) is Frame:
+            slot = environment.scope.names.get(name)
+            if slot is not None and environment.slots[slot] is not unbound:
+                return environment.slots, slot
+            environment = environment.parent
+        else:
+            if name in environment:
+                return environment, name
+            environment = environment.get("$parent")
+    assert False, f"Extern assignment: '{name}' not found in any outer scope"
+
+
+def scope_of(code):
+    """the scope of a function literal, for the tests"""
+    function = parse(tokenize(f"f = {code}"))["statements"][0]["value"]
+    return function_scope(function["parameters"], function["body"], program_scope)
+
+
+def test_function_scope():
+    print("testing function_scope...")
+    scope = scope_of("function(a, b) { c = a; if (b) { d = 1; a = 2 }; extern e = 3; f = function(g) { h = g } }")
+    assert scope.names == {"a": 0, "b": 1, "c": 2, "d": 3, "f": 4}
+    assert scope.parameters == [0, 1]
+    assert scope.resolved
+    assert not scope_of('function() { if (1) { import "x.t" } }').resolved
+    assert scope_of('function() { f = function() { import "x.t" } }').resolved
+
+
+def test_address():
+    print("testing address...")
+    outer = scope_of("function(x, y) { z = 1 }")
+    inner = function_scope([{"tag": "identifier", "value": "y"}], {"tag": "statement_list", "statements": []}, outer)
+    assert inner.address("y") == (0, 0)
+    assert inner.address("x") == (1, 0)
+    assert inner.address("z") == (1, 2)
+    assert inner.address("print") == (2, None)
+    assert program_scope.address("x") == (0, None)
+
+
+def test_lookup():
+    print("testing lookup...")
+    scope = scope_of("function(x) { y = 1 }")
+    frame = Frame([1, unbound], {"y": 2, "$parent": {"z": 3}}, scope)
+    assert lookup("x", frame) == 1
+    assert lookup("y", frame) == 2
+    assert lookup("z", frame) == 3
+    assert lookup("head", frame) == {"tag": "builtin", "name": "head"}
+    try:
+        lookup("w", frame)
+        assert False, "w should be unknown"
+    except Exception as e:
+        assert str(e) == "Unknown identifier: 'w'"
+    container, key = find("y", frame)
+    assert container is frame.parent and key == "y"
+    frame.slots[1] = 4
+    assert find("y", frame) == (frame.slots, 1)
+    assert lookup("y", frame) == 4
+    # a frame is also a dict environment, for the other engines
+    frame.slots[1] = unbound
+    assert "x" in frame and "y" not in frame and "$parent" in frame
+    assert frame["x"] == 1 and frame.get("y") is None and frame.get("$parent") == {"y": 2, "$parent": {"z": 3}}
+    frame["y"] = 5
+    assert frame["y"] == 5 and frame.slots == [1, 5]
+    # printed like the tree evaluator's environment for the call
+    assert repr(frame) == "{'x': 1, '$parent': {'y': 2, '$parent': {'z': 3}}, 'y': 5}"
+    frame.parent = {"f": {"environment": frame}}
+    assert repr(frame) == "{'x': 1, '$parent': {'f': {'environment': {...}}}, 'y': 5}"
+
+
+if __name__ == "__main__":
+    test_function_scope()
+    test_address()
+    test_lookup()
+    print("done.")
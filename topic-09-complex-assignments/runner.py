@@ -1,25 +1,74 @@
 #!/usr/bin/env python
 
+import argparse
 import sys
 
 from tokenizer import tokenize
 
 from parser import parse
 
-from evaluator import evaluate
+from astcache import load_ast
+
+import evaluator
+import machine
+import compiler
+import vm
+import transpiler
+import optimizer
+
+# each engine evaluates an AST in an environment and returns (value, status)
+engines = {
+    "tree": evaluator.evaluate,
+    "machine": machine.evaluate,
+    "compiler": compiler.evaluate,
+    "vm": vm.evaluate,
+    "python": transpiler.evaluate,
+}
 
 def main():
+    argument_parser = argparse.ArgumentParser(description="Run a program, or start a REPL without one.")
+    argument_parser.add_argument("filename", nargs="?")
+    argument_parser.add_argument(
+        "--engine",
+        choices=engines,
+        default="tree",
+        help="tree: the recursive evaluator; machine: keeps its own stack, for deep recursion; compiler: compiles to Python closures first, for loops; vm: compiles to bytecode, cached next to the program; python: translates to Python source for CPython to run",
+    )
+    argument_parser.add_argument(
+        "--disassemble",
+        action="store_true",
+        help="print the bytecode the vm engine would run, instead of running the program",
+    )
+    argument_parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="also hoist loop-invariant expressions out of while loops before running",
+    )
+    argument_parser.add_argument(
+        "--explain-opt",
+        action="store_true",
+        help="print the constants folded and propagated and (with --optimize) the loop invariants hoisted before running, instead of running the program",
+    )
+    arguments = argument_parser.parse_args()
+    evaluate = engines[arguments.engine]
     environment = {}
     
     # Check for command line arguments
-    if len(sys.argv) > 1:
+    if arguments.filename:
         # Filename provided, read and execute it
-        with open(sys.argv[1], 'r') as f:
-            source_code = f.read()
         try:
-            tokens = tokenize(source_code)
-            ast = parse(tokens)
-            final_value, exit_status = evaluate(ast, environment)
+            if (arguments.engine == "vm" and not arguments.explain_opt) or arguments.disassemble:
+                code = vm.load_code(arguments.filename, hoist=arguments.optimize)
+                if arguments.disassemble:
+                    print(vm.disassemble(code))
+                    return
+                final_value, exit_status = vm.run(code, environment)
+            else:
+                ast, report = optimizer.optimize(load_ast(arguments.filename), hoist=arguments.optimize)
+                if arguments.explain_opt:
+                    print(optimizer.explain(report))
+                    return
+                final_value, exit_status = evaluate(ast, environment)
             if exit_status == "exit":
                 # print(f"Exiting with code: {final_value}") # Optional debug print
                 sys.exit(final_value if isinstance(final_value, int) else 0)
@@ -39,7 +88,8 @@ def main():
 
                 # Tokenize, parse, and execute the code
                 tokens = tokenize(source_code)
-                ast = parse(tokens)
+                # earlier lines can change any variable, so constants aren't propagated
+                ast, report = optimizer.optimize(parse(tokens), propagate=False)
                 final_value, exit_status = evaluate(ast, environment)
                 if exit_status == "exit":
                     print(f"Exiting with code: {final_value}") # REPL can print this
@@ -1,29 +1,14 @@
+import codecs
 import re
+from array import array
+from bisect import bisect_right
 
 patterns = [
     [r"//[^\n]*", "comment"],  # Comment
     [r"\s+", "whitespace"],  # Whitespace
     [r"\d*\.\d+|\d+\.\d*|\d+", "number"],  # numeric literals
     [r'"([^"]|"")*"', "string"],  # string literals
-    [r"true|false", "boolean"],  # boolean literals
-    [r"null", "null"],  # the null literal
-    [r"function", "function"],  # function keyword
-    [r"return", "return"],  # return keyword
-    [r"extern", "extern"],  # extern keyword
-    [r"if", "if"],  # if keyword
-    [r"else", "else"],  # else keyword
-    [r"while", "while"],  # while keyword
-    [r"for", "for"],  # for keyword
-    [r"break", "break"],  # for keyword
-    [r"continue", "continue"],  # for keyword
-    [r"print", "print"],  # print keyword
-    [r"import", "import"],  # import keyword
-    [r"exit", "exit"],  # exit keyword
-    [r"and", "&&"],  # alternate for &&
-    [r"or", "||"],  # alternate for ||
-    [r"not", "!"],  # alternate for !
-    [r"assert", "assert"],
-    [r"[a-zA-Z_][a-zA-Z0-9_]*", "identifier"],  # identifiers
+    [r"[a-zA-Z_][a-zA-Z0-9_]*", "identifier"],  # identifiers and keywords
     [r"\+", "+"],
     [r"\-", "-"],
     [r"\*", "*"],
@@ -52,65 +37,258 @@ patterns = [
     [r".", "error"],  # unexpected content
 ]
 
+# words that lex as something other than an identifier.
+# the identifier pattern matches the whole word, then one lookup classifies it.
+keywords = {
+    "true": "boolean",  # boolean literals
+    "false": "boolean",
+    "null": "null",  # the null literal
+    "function": "function",  # function keyword
+    "return": "return",  # return keyword
+    "extern": "extern",  # extern keyword
+    "if": "if",  # if keyword
+    "else": "else",  # else keyword
+    "while": "while",  # while keyword
+    "for": "for",  # for keyword
+    "break": "break",  # break keyword
+    "continue": "continue",  # continue keyword
+    "print": "print",  # print keyword
+    "import": "import",  # import keyword
+    "exit": "exit",  # exit keyword
+    "and": "&&",  # alternate for &&
+    "or": "||",  # alternate for ||
+    "not": "!",  # alternate for !
+    "assert": "assert",
+}
+
+# combine the patterns into one alternation so each token is found in a single scan.
+# python tries alternatives left to right, so the first pattern in the list still wins.
+master_pattern = re.compile(
+    "|".join(f"(?P<t{index}>{pattern})" for index, (pattern, tag) in enumerate(patterns))
+)
+master_tags = {f"t{index}": tag for index, (pattern, tag) in enumerate(patterns)}
+
 for pattern in patterns:
     pattern[0] = re.compile(pattern[0])
 
 test_generated_tags = set()
 
 
-# The lex/tokenize function
-def tokenize(characters, generated_tags=test_generated_tags):
-    line = 1
-    tokens = []
-    position = 0
-    while position < len(characters):
-        # find the first token pattern that matches
-        for pattern, tag in patterns:
-            match = pattern.match(characters, position)
-            if match:
+class LineIndex:
+    """
+    The source positions where each line starts.
+
+    Tokens only store their position. Line and column numbers are found by
+    bisecting this table when something (usually an error message) asks.
+    """
+
+    def __init__(self):
+        self.starts = array("Q", [0])
+
+    def add_text(self, text, offset):
+        # record the start of every line that begins inside text
+        newline = text.find("\n")
+        while newline != -1:
+            self.starts.append(offset + newline + 1)
+            newline = text.find("\n", newline + 1)
+
+    def line_of(self, position):
+        return bisect_right(self.starts, position)
+
+    def location(self, position):
+        line = self.line_of(position)
+        return line, position - self.starts[line - 1] + 1
+
+
+class Token:
+    """
+    A single lexed token.
+
+    Tokens are created for every tag and position in the source, so they use
+    __slots__ instead of a dict. The value slot is only filled in for literals
+    and identifiers. Subscript access (token["tag"], "value" in token, ...) is
+    kept so tokens can still be used like the dicts they replace.
+    Line and column are looked up from the shared LineIndex when needed.
+    """
+
+    __slots__ = ("tag", "value", "position", "lines")
+    fields = ("tag", "value", "position")
+
+    def __init__(self, tag, position, lines=None):
+        self.tag = tag
+        self.position = position
+        self.lines = lines
+
+    @property
+    def line(self):
+        return self.lines.line_of(self.position) if self.lines else None
+
+    @property
+    def column(self):
+        return self.lines.location(self.position)[1] if self.lines else None
+
+    def __getitem__(self, key):
+        if key in Token.fields and hasattr(self, key):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in Token.fields:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        delattr(self, key)
+
+    def __contains__(self, key):
+        return key in Token.fields and hasattr(self, key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def as_dict(self):
+        return {key: getattr(self, key) for key in Token.fields if hasattr(self, key)}
+
+    def __eq__(self, other):
+        if isinstance(other, Token):
+            return self.as_dict() == other.as_dict()
+        if isinstance(other, dict):
+            return self.as_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+
+def read_chunks(source, chunk_size):
+    """
+    Yield the text of a source a chunk at a time.
+
+    The source can be a string, a text or binary file object, an mmap, or
+    anything else that supports the buffer protocol (bytes, memoryview).
+    Binary input is decoded as UTF-8.
+    """
+    if isinstance(source, str):
+        yield source
+        return
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    if hasattr(source, "read"):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            if not isinstance(chunk, str):
+                chunk = decoder.decode(chunk)
+            yield chunk
+    else:
+        view = memoryview(source)
+        for start in range(0, len(view), chunk_size):
+            yield decoder.decode(view[start : start + chunk_size])
+    chunk = decoder.decode(b"", final=True)
+    if chunk:
+        yield chunk
+
+
+def token_is_complete(match, tag, buffer):
+    """
+    Decide whether a match found near the end of the buffered text can be
+    trusted, or whether more text might change it.
+    """
+    end = match.end()
+    # maximal munch needs to see the character after the token
+    if end >= len(buffer):
+        return False
+    # a quote right after a string may be an embedded "" quote
+    if tag == "string" and buffer[end] == '"':
+        return False
+    # a lone quote is an error only if its string never closes
+    if tag == "error" and match.group(0) == '"':
+        return False
+    return True
+
+
+# The streaming lex/tokenize function
+def tokenize_stream(source, generated_tags=test_generated_tags, chunk_size=65536):
+    """
+    Yield tokens lazily from a string, file object, mmap or memoryview.
+
+    Only the current chunk and the unfinished token at its end are kept in
+    memory, so the window stays bounded no matter how large the input is.
+    """
+    chunks = read_chunks(source, chunk_size)
+    lines = LineIndex()
+    buffer = ""
+    offset = 0  # source position of buffer[0]
+    index = 0
+    at_end = False
+    while True:
+        if index >= len(buffer):
+            if at_end:
                 break
+            match = None
+        else:
+            # find the first token pattern that matches
+            match = master_pattern.match(buffer, index)
+            tag = master_tags[match.lastgroup]
+
+        # read more text when the token might continue past the buffer
+        if not at_end and (match is None or not token_is_complete(match, tag, buffer)):
+            chunk = next(chunks, None)
+            if chunk is None:
+                at_end = True
+            else:
+                lines.add_text(chunk, offset + len(buffer))
+                offset = offset + index
+                buffer = buffer[index:] + chunk
+                index = 0
+            continue
 
-        # this should never fail, since the last pattern matches everything.
-        assert match
+        value = match.group(0)
+        if tag == "identifier":
+            tag = keywords.get(value, "identifier")
 
         # note that the tag was generated
         generated_tags.add(tag)
 
         # complain about errors and throw exception
+        position = offset + index
         if tag == "error":
-            raise Exception(f"Syntax error: illegal character : {[match.group(0)]}")
+            line, column = lines.location(position)
+            raise Exception(
+                f"Syntax error: illegal character : {[value]} at line {line}, column {column}"
+            )
+
+        index = match.end()
+
+        # skip whitespace and comments
+        if tag == "whitespace" or tag == "comment":
+            continue
 
         # package the token
-        token = {"tag": tag, "position": position}
-        value = match.group(0)
-        if token["tag"] == "identifier":
-            token["value"] = value
-        if token["tag"] == "string":
-            token["value"] = value[1:-1].replace('""', '"')
-        if token["tag"] == "number":
+        token = Token(tag, position, lines)
+        if tag == "identifier":
+            token.value = value
+        elif tag == "string":
+            token.value = value[1:-1].replace('""', '"')
+        elif tag == "number":
             if "." in value:
-                token["value"] = float(value)
+                token.value = float(value)
             else:
-                token["value"] = int(value)
-        if token["tag"] == "boolean":
-            token["value"] = True if value == "true" else False
-
-        # append token to stream, skipping whitespace and comments
-        if tag == "whitespace":
-            for c in value:
-                if c == "\n":
-                    line = line + 1
-        
-        token["line"] = line
-
-        if tag not in ["comment", "whitespace"]:
-            tokens.append(token)
-
-        # update position for next match
-        position = match.end()
+                token.value = int(value)
+        elif tag == "boolean":
+            token.value = True if value == "true" else False
+        yield token
+
+    yield Token(None, offset + index, lines)
+
 
-    tokens.append({"tag": None, "position": position, "line":line})
-    return tokens
+# The lex/tokenize function
+def tokenize(characters, generated_tags=test_generated_tags):
+    return list(tokenize_stream(characters, generated_tags))
 
 
 def test_simple_tokens():
@@ -142,11 +320,6 @@ def test_number_tokens():
         assert t[0]["tag"] == "number"
         assert t[0]["value"] == float(s)
 
-def remove_line_info(tokens):
-    for token in tokens.copy():
-        del token["line"]
-    return tokens
-
 def test_string_tokens():
     print("testing string tokens...")
     for s in ['"example"', '"this is a longer example"', '"an embedded "" quote"']:
@@ -194,19 +367,19 @@ def verify_same_tokens(a, b):
     def remove_position(tokens):
         for t in tokens:
             del t["position"]
-        return remove_line_info(tokens) 
+        return tokens
     return remove_position(tokenize(a)) == remove_position(tokenize(b))
 
 
 def test_multiple_tokens():
     print("testing multiple tokens...")
-    assert remove_line_info(tokenize("1+2")) == [
+    assert tokenize("1+2") == [
         {"tag": "number", "value": 1, "position": 0},
         {"tag": "+", "position": 1},
         {"tag": "number", "value": 2, "position": 2},
         {"tag": None, "position": 3},
     ]
-    assert remove_line_info(tokenize("1+2-3")) == [
+    assert tokenize("1+2-3") == [
         {"tag": "number", "value": 1, "position": 0},
         {"tag": "+", "position": 1},
         {"tag": "number", "value": 2, "position": 2},
@@ -215,7 +388,7 @@ def test_multiple_tokens():
         {"tag": None, "position": 5},
     ]
 
-    assert remove_line_info(tokenize("3+4*(5-2)")) == [
+    assert tokenize("3+4*(5-2)") == [
         {"tag": "number", "value": 3, "position": 0},
         {"tag": "+",  "position": 1},
         {"tag": "number", "value": 4, "position": 2},
@@ -250,7 +423,7 @@ def test_keywords():
         "print",
         "exit",
     ]:
-        t = remove_line_info(tokenize(keyword))
+        t = tokenize(keyword)
         assert len(t) == 2
         assert t[0]["tag"] == keyword, f"expected {keyword}, got {t[0]}"
         assert "value" not in t
@@ -268,7 +441,7 @@ def test_comments():
 def test_error():
     print("testing token errors...")
     try:
-        t = remove_line_info(tokenize("$banana"))
+        t = tokenize("$banana")
         assert False, "Should have a token exception for '$$'."
     except Exception as e:
         error_string = str(e)
@@ -276,20 +449,116 @@ def test_error():
         assert "illegal character" in error_string
 
 
+def test_master_pattern_priority():
+    print("testing master pattern priority...")
+    source = 'x = [1, 2.5, .5]; if (x != "a""b") { print x && y } // done\n'
+    position = 0
+    while position < len(source):
+        # the combined scan must pick the same pattern as trying them one by one
+        for pattern, tag in patterns:
+            match = pattern.match(source, position)
+            if match:
+                break
+        master_match = master_pattern.match(source, position)
+        assert master_tags[master_match.lastgroup] == tag
+        assert master_match.end() == match.end()
+        position = match.end()
+
+
+def test_token_compatibility():
+    print("testing token compatibility...")
+    t = tokenize("x 1")
+    assert isinstance(t[0], Token)
+    assert t[0] == {"tag": "identifier", "value": "x", "position": 0}
+    assert t[0]["value"] == "x" and t[0].value == "x"
+    assert t[0].get("value") == "x"
+    assert "value" not in t[2] and t[2].get("value") is None
+    try:
+        t[2]["value"]
+        assert False, "expected a KeyError for a missing token field"
+    except KeyError:
+        pass
+    del t[1]["value"]
+    assert t[1] == {"tag": "number", "position": 2}
+
+
+def test_tokenize_stream():
+    print("testing streaming tokenizer...")
+    import io
+    import mmap
+    import tempfile
+
+    source = 'x = "a""b""" + 12.5;\n// note\nif (x >= 1) {print "héllo"} iffy == .5\n'
+    expected = tokenize(source)
+    # small chunks put token boundaries everywhere, including inside tokens
+    for chunk_size in [1, 2, 3, 5, 7, 64]:
+        assert list(tokenize_stream(io.StringIO(source), chunk_size=chunk_size)) == expected
+        data = source.encode("utf-8")
+        assert list(tokenize_stream(io.BytesIO(data), chunk_size=chunk_size)) == expected
+        assert list(tokenize_stream(memoryview(data), chunk_size=chunk_size)) == expected
+    with tempfile.TemporaryFile() as f:
+        f.write(source.encode("utf-8"))
+        f.flush()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            assert list(tokenize_stream(m, chunk_size=4)) == expected
+    # the stream is lazy: the first token arrives before the input is read
+    stream = tokenize_stream(io.StringIO("1 " * 1000), chunk_size=4)
+    assert next(stream) == {"tag": "number", "value": 1, "position": 0}
+    try:
+        list(tokenize_stream(io.StringIO('x = "never closed'), chunk_size=2))
+        assert False, "expected an error for an unterminated string"
+    except Exception as e:
+        assert "illegal character" in str(e)
+
+
+def test_line_index():
+    print("testing line index...")
+    t = tokenize('x = 1;\n\n  y = "a\nb";\n// done\nz')
+    assert "line" not in t[0]
+    assert [(token.tag, token.line, token.column) for token in t] == [
+        ("identifier", 1, 1),
+        ("=", 1, 3),
+        ("number", 1, 5),
+        (";", 1, 6),
+        ("identifier", 3, 3),
+        ("=", 3, 5),
+        ("string", 3, 7),
+        (";", 4, 3),
+        ("identifier", 6, 1),
+        (None, 6, 2),
+    ]
+    try:
+        tokenize("x = 1\n  $")
+        assert False, "expected an illegal character error"
+    except Exception as e:
+        assert "line 2, column 3" in str(e)
+
+
 def test_tag_coverage():
     print("testing tag coverage...")
     for pattern, tag in patterns:
         assert tag in test_generated_tags, f"Tag [ {tag} ] was not tested."
+    for keyword, tag in keywords.items():
+        assert tag in test_generated_tags, f"Tag [ {tag} ] was not tested."
 
 
 # Test for keyword followed by identifiers
 def test_if_identifier_sequence():
     print("testing keyword followed by identifiers...")
-    t = remove_line_info(tokenize("if alpha beta"))
+    t = tokenize("if alpha beta")
     tags = [tok["tag"] for tok in t[:-1]]
     assert tags == ["if", "identifier", "identifier"], f"got {tags}"
 
 
+def test_keyword_prefixed_identifiers():
+    print("testing identifiers that start with keywords...")
+    for s in ["iffy", "format", "printer", "android", "order", "nothing", "truest", "nullable", "exits"]:
+        t = tokenize(s)
+        assert len(t) == 2, f"got tokens = {t}"
+        assert t[0]["tag"] == "identifier"
+        assert t[0]["value"] == s
+
+
 if __name__ == "__main__":
     print("testing tokenizer.")
     test_simple_tokens()
@@ -303,5 +572,10 @@ if __name__ == "__main__":
     test_comments()
     test_error()
     test_if_identifier_sequence()
+    test_keyword_prefixed_identifiers()
+    test_master_pattern_priority()
+    test_token_compatibility()
+    test_tokenize_stream()
+    test_line_index()
     test_tag_coverage()
     print("done.")
@@ -0,0 +1,747 @@
+from tokenizer import tokenize
+from parser import parse
+from astcache import load_ast
+from evaluator import type_of, ast_to_string, evaluate_builtin_function, number_types, binary_operation, Function
+from machine import lookup
+from vm import index_value, check_target
+import evaluator
+import copy
+import os
+
+# Translate an AST to Python source, and let CPython run it.
+#
+# transpile_program(ast) returns the source of a module with one Python
+# function per program or function body, each taking the environment as `env`.
+# if, while, break, continue and return become the Python statements, and
+# arithmetic on two numbers becomes the Python operator. Everything where the
+# language and Python disagree (lookups through "$parent", + on objects,
+# indexing, calls, extern) goes through the small runtime helpers below.
+#
+# Environments, function values and (value, status) results are the same as
+# in evaluator.py. is_truthy() agrees with Python's truth value for every value
+# a program can make, so conditions are plain Python conditions.
+#
+# Expressions nest in the source as deeply as in the AST, a few parentheses
+# per operator, and CPython refuses to compile source nested too deeply. A
+# program or function body whose translation doesn't compile is run by the
+# tree evaluator instead, which shares its environments and function values.
+
+
+class Exit(BaseException):
+    """
+    Raised by exit, and caught by evaluate(). It isn't an Exception, so the
+    import helper passes it through like the tree evaluator passes the status.
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+
+# RUNTIME HELPERS
+
+
+def store(scope, name, value):
+    scope[name] = value
+    return value
+
+
+def store_item(base, index, value):
+    base[index] = value
+    return value
+
+
+def find_scope(environment, name):
+    scope = environment
+    while scope is not None and name not in scope:
+        scope = scope.get("$parent")
+    assert scope is not None, f"Extern assignment: '{name}' not found in any outer scope"
+    return scope
+
+
+def assignment_target(base, index):
+    check_target(base, index)
+    return base, index
+
+
+def object_key(key):
+    assert type(key) is str, "Object key must be a string"
+    return key
+
+
+def negate(value):
+    types = type_of(value)
+    if types != "number":
+        raise Exception(f"Illegal type for negate:{types}")
+    return -value
+
+
+def print_value(value):
+    if type(value) is bool:
+        value = "true" if value else "false"
+    print(str(value))
+    return str(value)
+
+
+def assertion_failed(condition, *explanation):
+    message = f"Assertion failed: {ast_to_string(condition)}"
+    if explanation:
+        message += f" ({explanation[0]})"
+    raise Exception(message)
+
+
+def exit_code(value):
+    assert isinstance(value, int), "Exit code must be an integer."
+    return value
+
+
+def call(function, *arguments):
+    if function.get("tag") == "builtin":
+        return evaluate_builtin_function(function["name"], list(arguments))[0]
+    environment = {
+        name["value"]: value
+        for name, value in zip(function["parameters"], arguments)
+    }
+    environment["$parent"] = function["environment"]
+    return function_body(function)(environment)
+
+
+# for each file imported, (its AST, the Python function for it), so importing
+# it again while it is unchanged doesn't translate and compile it again
+imported_programs = {}
+
+
+def import_file(filename, environment):
+    assert isinstance(filename, str), "Import path must be a string."
+    try:
+        imported_ast = load_ast(filename)
+        path = os.path.abspath(filename)
+        entry = imported_programs.get(path)
+        if entry is None or entry[0] != imported_ast:
+            entry = imported_programs[path] = (imported_ast, load_program(imported_ast))
+        return entry[1](environment)
+    except FileNotFoundError:
+        raise Exception(f"ImportError: File not found '{filename}'")
+    except Exception as e:
+        raise Exception(f"Error during import of '{filename}': {e}")
+
+
+runtime = {
+    "number_types": number_types,
+    "lookup": lookup,
+    "binary_operation": binary_operation,
+    "index_value": index_value,
+    "store": store,
+    "store_item": store_item,
+    "find_scope": find_scope,
+    "assignment_target": assignment_target,
+    "object_key": object_key,
+    "negate": negate,
+    "print_value": print_value,
+    "assertion_failed": assertion_failed,
+    "exit_code": exit_code,
+    "call": call,
+    "import_file": import_file,
+    "Function": Function,
+    "Exit": Exit,
+}
+
+
+# TRANSLATION
+
+# operators that are the Python operator when both sides are numbers
+number_operators = {"+": "+", "-": "-", "*": "*", "<": "<", ">": ">", "<=": "<=", ">=": ">="}
+# the same, when the right-hand side is also not zero
+division_operators = {"/": "/", "%": "%"}
+
+
+class Translation:
+    """
+    The Python source being written, and the AST pieces it refers to.
+    """
+
+    __slots__ = ("lines", "definitions", "constants", "bodies", "temporaries")
+
+    def __init__(self):
+        # the function being written
+        self.lines = []
+        # the functions written so far
+        self.definitions = []
+        # AST pieces the source refers to as constant_<n>
+        self.constants = []
+        # (body AST, name of the Python function made from it)
+        self.bodies = []
+        self.temporaries = 0
+
+    def constant(self, value):
+        for index, constant in enumerate(self.constants):
+            if constant is value:
+                return f"constant_{index}"
+        self.constants.append(value)
+        return f"constant_{len(self.constants) - 1}"
+
+    def temporary(self):
+        self.temporaries += 1
+        return f"_{self.temporaries}"
+
+    def emit(self, indent, line):
+        self.lines.append("    " * indent + line)
+
+    def source(self):
+        return "\n\n".join(self.definitions) + "\n"
+
+
+class Context:
+    """
+    Where a statement is: the indentation, and whether it is in a function and in a loop.
+    """
+
+    __slots__ = ("indent", "in_function", "in_loop")
+
+    def __init__(self, indent, in_function, in_loop):
+        self.indent = indent
+        self.in_function = in_function
+        self.in_loop = in_loop
+
+    def nested(self, in_loop=None):
+        return Context(self.indent + 1, self.in_function, self.in_loop if in_loop is None else in_loop)
+
+
+def expression_literal(ast, translation):
+    return f"({ast['value']!r})"
+
+
+def expression_null(ast, translation):
+    return "None"
+
+
+def expression_identifier(ast, translation):
+    name = repr(ast["value"])
+    return f"(env[{name}] if {name} in env else lookup({name}, env))"
+
+
+def expression_list(ast, translation):
+    return "[" + "".join(expression(item, translation) + ", " for item in ast["items"]) + "]"
+
+
+def expression_object(ast, translation):
+    items = [
+        f"object_key({expression(item['key'], translation)}): {expression(item['value'], translation)}, "
+        for item in ast["items"]
+    ]
+    return "{" + "".join(items) + "}"
+
+
+def expression_binary(ast, translation):
+    tag = ast["tag"]
+    left = expression(ast["left"], translation)
+    right = expression(ast["right"], translation)
+    if tag in ["==", "!="]:
+        return f"({left} {tag} {right})"
+    if tag not in number_operators and tag not in division_operators:
+        return f"binary_operation({tag!r}, {left}, {right})"
+    # both sides are evaluated, in order, before either is looked at
+    l, r = translation.temporary(), translation.temporary()
+    condition = f"(type({l} := {left}) in number_types) & (type({r} := {right}) in number_types)"
+    if tag in division_operators:
+        condition = f"{condition} and {r} != 0"
+    return f"({l} {tag} {r} if {condition} else binary_operation({tag!r}, {l}, {r}))"
+
+
+def expression_and(ast, translation):
+    return f"({expression(ast['left'], translation)} and bool({expression(ast['right'], translation)}))"
+
+
+def expression_or(ast, translation):
+    return f"({expression(ast['left'], translation)} or bool({expression(ast['right'], translation)}))"
+
+
+def expression_not(ast, translation):
+    return f"(not {expression(ast['value'], translation)})"
+
+
+def expression_negation(ast, translation):
+    return f"negate({expression(ast['value'], translation)})"
+
+
+def expression_print(ast, translation):
+    if ast["value"]:
+        return f"print_value({expression(ast['value'], translation)})"
+    return "print()"
+
+
+def expression_function(ast, translation):
+    body = ast["body"]
+    name = translate_function(body, translation)
+    translation.bodies.append((body, name))
+    parameters = translation.constant(ast["parameters"])
+    body = translation.constant(body)
+    return f"Function({parameters}, {body}, env, compiled_{name})"
+
+
+def expression_call(ast, translation):
+    arguments = [expression(argument, translation) for argument in [ast["function"]] + ast["arguments"]]
+    return f"call({', '.join(arguments)})"
+
+
+def expression_complex(ast, translation):
+    base = expression(ast["base"], translation)
+    index = expression(ast["index"], translation)
+    return f"index_value({base}, {index}, {translation.constant(ast['index'])})"
+
+
+def expression_assign(ast, translation):
+    target = ast["target"]
+    value = expression(ast["value"], translation)
+    if target["tag"] == "identifier":
+        name = repr(target["value"])
+        if target.get("extern"):
+            # the scope is found before the value is evaluated, as in evaluator.py
+            return f"store(find_scope(env, {name}), {name}, {value})"
+        return f"store(env, {name}, {value})"
+    assert target["tag"] == "complex", f"Cannot assign to [{target['tag']}]"
+    base = expression(target["base"], translation)
+    index = expression(target["index"], translation)
+    return f"store_item(*assignment_target({base}, {index}), {value})"
+
+
+def expression_import(ast, translation):
+    return f"import_file({expression(ast['value'], translation)}, env)"
+
+
+expression_translators = {
+    "number": expression_literal,
+    "boolean": expression_literal,
+    "string": expression_literal,
+    "null": expression_null,
+    "list": expression_list,
+    "object": expression_object,
+    "identifier": expression_identifier,
+    "negate": expression_negation,
+    "&&": expression_and,
+    "and": expression_and,
+    "||": expression_or,
+    "or": expression_or,
+    "!": expression_not,
+    "not": expression_not,
+    "print": expression_print,
+    "function": expression_function,
+    "call": expression_call,
+    "complex": expression_complex,
+    "assign": expression_assign,
+    "import": expression_import,
+}
+for tag in ["+", "-", "*", "/", "%", "<", ">", "<=", ">=", "==", "!="]:
+    expression_translators[tag] = expression_binary
+
+
+def expression(ast, translation):
+    translator = expression_translators.get(ast["tag"])
+    assert translator, f"Unknown expression tag [{ast['tag']}] in AST"
+    return translator(ast, translation)
+
+
+def statement_assign(ast, translation, context):
+    target = ast["target"]
+    if target["tag"] == "identifier" and not target.get("extern"):
+        value = expression(ast["value"], translation)
+        translation.emit(context.indent, f"env[{target['value']!r}] = {value}")
+    else:
+        translation.emit(context.indent, expression(ast, translation))
+
+
+def statement_assert(ast, translation, context):
+    if not ast["condition"]:
+        return
+    condition = expression(ast["condition"], translation)
+    translation.emit(context.indent, f"if not {condition}:")
+    arguments = [translation.constant(ast["condition"])]
+    if "explanation" in ast and ast["explanation"]:
+        arguments.append(expression(ast["explanation"], translation))
+    translation.emit(context.indent + 1, f"assertion_failed({', '.join(arguments)})")
+
+
+def statement_if(ast, translation, context):
+    translation.emit(context.indent, f"if {expression(ast['condition'], translation)}:")
+    statement(ast["then"], translation, context.nested())
+    if "else" in ast:
+        translation.emit(context.indent, "else:")
+        statement(ast["else"], translation, context.nested())
+
+
+def statement_while(ast, translation, context):
+    translation.emit(context.indent, f"while {expression(ast['condition'], translation)}:")
+    statement(ast["do"], translation, context.nested(in_loop=True))
+
+
+def statement_statement_list(ast, translation, context):
+    for child in ast["statements"]:
+        statement(child, translation, context)
+    if not ast["statements"]:
+        translation.emit(context.indent, "pass")
+
+
+def statement_return(ast, translation, context):
+    value = "None"
+    if "value" in ast and ast["value"] is not None:
+        value = expression(ast["value"], translation)
+    if context.in_function:
+        translation.emit(context.indent, f"return {value}")
+    else:
+        translation.emit(context.indent, value)
+        translation.emit(context.indent, "raise Exception(\"'return' statement outside of function.\")")
+
+
+def statement_exit(ast, translation, context):
+    if "value" in ast and ast["value"] is not None:
+        translation.emit(context.indent, f"raise Exit(exit_code({expression(ast['value'], translation)}))")
+    else:
+        translation.emit(context.indent, "raise Exit(0)")
+
+
+def statement_loop_control(ast, translation, context):
+    tag = ast["tag"]
+    if context.in_loop:
+        translation.emit(context.indent, tag)
+    elif context.in_function:
+        translation.emit(context.indent, f"raise Exception(\"'{tag}' statement propagated out of function call.\")")
+    else:
+        translation.emit(context.indent, f"raise Exception(\"'{tag}' statement outside of loop.\")")
+
+
+def statement_forget(ast, translation, context):
+    for name in ast["names"]:
+        translation.emit(context.indent, f"env.pop({name!r}, None)")
+
+
+statement_translators = {
+    "assign": statement_assign,
+    "assert": statement_assert,
+    "if": statement_if,
+    "while": statement_while,
+    "statement_list": statement_statement_list,
+    "return": statement_return,
+    "exit": statement_exit,
+    "break": statement_loop_control,
+    "continue": statement_loop_control,
+    "forget": statement_forget,
+}
+
+
+def statement(ast, translation, context):
+    translator = statement_translators.get(ast["tag"])
+    if translator:
+        translator(ast, translation, context)
+    else:
+        translation.emit(context.indent, expression(ast, translation))
+
+
+def translate_function(body, translation):
+    """write a Python function for a function body, returning its name"""
+    name = f"function_{len(translation.definitions)}_{translation.temporary()[1:]}"
+    lines, translation.lines = translation.lines, []
+    translation.emit(0, f"def {name}(env):")
+    statement(body, translation, Context(1, in_function=True, in_loop=False))
+    translation.emit(1, "return None")
+    translation.definitions.append("\n".join(translation.lines))
+    translation.lines = lines
+    return name
+
+
+def translate_program(ast, translation):
+    translation.emit(0, "def program(env):")
+    context = Context(1, in_function=False, in_loop=False)
+    statements = ast["statements"]
+    for child in statements[:-1]:
+        statement(child, translation, context)
+    # a program's value is the value of its last statement
+    if statements and statements[-1]["tag"] in expression_translators:
+        translation.emit(1, f"return {expression(statements[-1], translation)}")
+    else:
+        if statements:
+            statement(statements[-1], translation, context)
+        translation.emit(1, "return None")
+    translation.definitions.append("\n".join(translation.lines))
+
+
+def transpile_program(ast):
+    """
+    The Python source for a program AST, with the constants it refers to.
+    Running the source defines program(env), which returns the program's value.
+    """
+    assert ast["tag"] == "program", f"Expected a program, not [{ast['tag']}]"
+    translation = Translation()
+    translate_program(ast, translation)
+    return translation.source(), translation
+
+
+def run_source(source, translation):
+    namespace = dict(runtime)
+    for index, constant in enumerate(translation.constants):
+        namespace[f"constant_{index}"] = constant
+    # what the function values made from each function literal share
+    for body, name in translation.bodies:
+        namespace[f"compiled_{name}"] = {}
+    exec(compile(source, "<transpiled>", "exec"), namespace)
+    for body, name in translation.bodies:
+        namespace[f"compiled_{name}"]["python"] = namespace[name]
+    return namespace
+
+
+def evaluated_program(ast):
+    """a Python function running a program AST with the tree evaluator"""
+    evaluator.validate(ast)
+
+    def program(env):
+        value, status = evaluator.evaluate(ast, env, validated=True)
+        if status == "exit":
+            raise Exit(value)
+        return value
+
+    return program
+
+
+def evaluated_body(body):
+    """a Python function running a function body with the tree evaluator"""
+    evaluator.validate(body)
+
+    def function(env):
+        value, status = evaluator.evaluate(body, env, validated=True)
+        if status == "tail_call":
+            return call(value[0], *value[1])
+        if status == "exit":
+            raise Exit(value)
+        if status in ["break", "continue"]:
+            raise Exception(f"'{status}' statement propagated out of function call.")
+        return value if status == "return" else None
+
+    return function
+
+
+def load_program(ast):
+    """the Python function for a program AST"""
+    try:
+        source, translation = transpile_program(ast)
+        return run_source(source, translation)["program"]
+    except (SyntaxError, RecursionError):
+        # nested too deeply for CPython
+        return evaluated_program(ast)
+
+
+def translated_body(body):
+    """the Python function for a function body translated on its own"""
+    try:
+        translation = Translation()
+        name = translate_function(body, translation)
+        return run_source(translation.source(), translation)[name]
+    except (SyntaxError, RecursionError):
+        return evaluated_body(body)
+
+
+def function_body(function):
+    """
+    The Python function for the body of a function value: the one it was made
+    with, or, for a value another engine made, translated the first time it
+    is called.
+    """
+    if type(function) is not Function:
+        return translated_body(function["body"])
+    if function.compiled is None:
+        function.compiled = {}
+    body = function.compiled.get("python")
+    if body is None:
+        body = function.compiled["python"] = translated_body(function["body"])
+    return body
+
+
+def evaluate(ast, environment):
+    """
+    Translate a program ast to Python and run it in environment, returning
+    (value, status) like evaluator.evaluate.
+    """
+    program = load_program(ast)
+    try:
+        return program(environment), None
+    except Exit as e:
+        return e.value, "exit"
+
+
+def same_as_evaluator(code, environment=None):
+    import evaluator
+
+    expected_environment = {} if environment is None else copy.deepcopy(environment)
+    environment = {} if environment is None else environment
+    expected = evaluator.evaluate(parse(tokenize(code)), expected_environment)
+    result = evaluate(parse(tokenize(code)), environment)
+    assert result == expected, f"{code}: got {result}, expected {expected}"
+    return result
+
+
+def test_expressions():
+    print("testing expressions...")
+    for code in [
+        "4", "4.2", '"x"', "null", "true", "1+2*3", "(3+2)*2", "8/4/2", "7%3", "--3",
+        '"a"+"b"', '"ab"*2', "[1,2]+[3]", '{"a":1}+{"b":2}', "1<2", "2>=3", "1==1", "1!=1",
+        "!0", "0 && x", "1 || x", "1 && 2", "0 || 0", "1 && 0", "1 + 0 == 1 || 2", "0 == 1 && 2",
+        "1.5 < 2", '"a" < "b"', "[1,[2,3]][1][0]", '{"a":{"b":4}}.a.b', "[]", "{}",
+        "head([1,2,3])", "tail([1,2,3])", "length(\"hello\")", 'keys({"a":1})',
+        "(1 + 2) * (3 + 4) - 5 % 3",
+    ]:
+        same_as_evaluator(code)
+    assert evaluate(parse(tokenize("x + y")), {"x": 1, "$parent": {"y": 2}}) == (3, None)
+
+
+def test_statements():
+    print("testing statements...")
+    for code in [
+        "",
+        "x=1; while(x<5) {x=x+1}; y=3",
+        "if(0) {x=1} else {x=2}",
+        "if(1) {x=1}",
+        "if(0) {x=1} else if (1) {x=3}",
+        "while(0) {}",
+        "x=0; while(1) {x=x+1; if(x>3){break}}; x",
+        "x=0; y=0; while(x<5) {x=x+1; if(x%2){continue}; y=y+x}; y",
+        "i=0; n=0; while(i<3) {i=i+1; j=0; while(1) {j=j+1; if(j>i){break}; n=n+1}}; n",
+        "a=[1,2,3]; a[1]=5; a",
+        'o={"a":1}; o.b=2; o["c"]=3; o',
+        "a=b=4",
+        "x=[0]; y = x[0] = 3; [x, y]",
+        "print 1+1",
+        "print",
+        "assert 1",
+        "exit 12",
+        "exit",
+        "if(1){exit 3}; print 4",
+    ]:
+        same_as_evaluator(code)
+
+
+def test_functions():
+    print("testing functions...")
+    for code in [
+        "function f(x) { if (x > 1) { return 123 }; return 2+2 }; f(7) + f(0)",
+        "function f() { return }; f()",
+        "function f() { 1 }; f()",
+        "function f() { }; f()",
+        "x = 1; function f() { extern x = 2 }; f(); x",
+        "x = 1; foo = function() { return x }; bar = function() { x = 2; return foo() }; bar()",
+        """
+        function makeCounter() {
+            count = 0;
+            return function() { extern count = count + 1; return count }
+        };
+        c1 = makeCounter(); c2 = makeCounter();
+        [c1(), c1(), c2(), c1()]
+        """,
+        "function f() { while(1) { return 5 } }; f()",
+        "function f() { exit 7 }; f(); print 1",
+        "function fib(n) { if (n < 2) { return n }; return fib(n-1) + fib(n-2) }; fib(15)",
+    ]:
+        same_as_evaluator(code)
+    # a function value is the same dict the tree evaluator makes
+    environment = {}
+    evaluate(parse(tokenize("function f(x) { 1 }")), environment)
+    assert environment["f"]["body"] == {"tag": "statement_list", "statements": [{"tag": "number", "value": 1}]}
+    assert environment["f"]["environment"] is environment
+    # values made from the same literal share its Python function
+    environment = {}
+    evaluate(parse(tokenize("function f() { return function() { 1 } }; a = f(); b = f()")), environment)
+    assert environment["a"].compiled is environment["b"].compiled
+    assert environment["a"].compiled["python"](environment) is None
+
+
+def test_function_values_from_other_engines():
+    print("testing function values from other engines...")
+    import evaluator
+
+    environment = {}
+    evaluator.evaluate(parse(tokenize("function twice(x) { return x * 2 }")), environment)
+    assert evaluate(parse(tokenize("twice(21)")), environment) == (42, None)
+    python = environment["twice"].compiled["python"]
+    assert evaluate(parse(tokenize("twice(2)")), environment) == (4, None)
+    assert environment["twice"].compiled["python"] is python
+
+
+def test_errors():
+    print("testing errors...")
+    for code, message in [
+        ("return 1", "'return' statement outside of function"),
+        ("break", "'break' statement outside of loop"),
+        ("if(true){ return 1 }", "'return' statement outside of function"),
+        ("function f() { break }; f()", "'break' statement propagated out of function call"),
+        ("function f() { continue }; while(1) { f() }", "'continue' statement propagated out of function call"),
+        ("y", "Unknown identifier: 'y'"),
+        ("1 - \"a\"", "Illegal types for -:number-string"),
+        ("1 / 0", "Division by zero"),
+        ("-\"a\"", "Illegal type for negate:string"),
+        ("assert 1 == 2, \"nope\"", "Assertion failed: (1==2) (nope)"),
+        ("assert 1 == 2", "Assertion failed: (1==2)"),
+        ("extern z = 1", "Extern assignment: 'z' not found in any outer scope"),
+        ("x = [1]; x[null] = 2", "Cannot use 'null' as index for assignment."),
+        ('import "no such file.t"', "ImportError: File not found 'no such file.t'"),
+    ]:
+        try:
+            evaluate(parse(tokenize(code)), {})
+            assert False, f"{code} should fail"
+        except Exception as e:
+            assert message in str(e), f"{code}: {e}"
+
+
+def test_import():
+    print("testing import...")
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "library.t")
+        with open(path, "w") as f:
+            f.write("function double(x) { return x + x }; y = oops")
+        environment = {}
+        try:
+            evaluate(parse(tokenize(f'import "{path}"')), environment)
+            assert False, "import should fail"
+        except Exception as e:
+            assert str(e) == f"Error during import of '{path}': Unknown identifier: 'oops'"
+        assert "double" in environment
+        with open(path, "w") as f:
+            f.write("function double(x) { return x + x }; 5")
+        same_as_evaluator(f'import "{path}"')
+        same_as_evaluator(f'import "{path}"; double(4)')
+        # importing an unchanged file again reuses its Python function
+        program = imported_programs[os.path.abspath(path)][1]
+        evaluate(parse(tokenize(f'import "{path}"')), {})
+        assert imported_programs[os.path.abspath(path)][1] is program
+        with open(path, "w") as f:
+            f.write("exit 3")
+        same_as_evaluator(f'import "{path}"; print 1')
+
+
+def test_deep_expressions():
+    print("testing deep expressions...")
+    chain = " + ".join(["a"] * 300)
+    same_as_evaluator(f"a = 0; a = 1; x = {chain}; x")
+    same_as_evaluator(f"a = 1; function f() {{ if (a) {{ return {chain} }} }}; y = f(); exit y")
+    environment = {}
+    evaluator.evaluate(parse(tokenize(f"a = 1; function f(b) {{ return {chain} + b }}")), environment)
+    assert evaluate(parse(tokenize("f(1)")), environment) == (301, None)
+
+
+def test_transpile_program():
+    print("testing transpile_program...")
+    source, translation = transpile_program(parse(tokenize("x = 1; while (x < 3) { x = x + 1 }")))
+    assert "def program(env):" in source
+    assert "    env['x'] = (1)" in source
+    assert "    while " in source
+    assert translation.constants == []
+
+
+if __name__ == "__main__":
+    test_expressions()
+    test_statements()
+    test_functions()
+    test_function_values_from_other_engines()
+    test_errors()
+    test_import()
+    test_deep_expressions()
+    test_transpile_program()
+    print("done.")
@@ -0,0 +1,151 @@
+from tokenizer import tokenize
+from parser import parse
+
+# Validation: check a tree once, so the tree evaluator can run it without
+# checking its nodes again.
+#
+# The AST is a tree of untyped dicts, so evaluator.py used to re-check what
+# it relied on every time it evaluated a node: that the tag has a handler,
+# the type of a literal's value, that an assignment has a target. validate()
+# makes those checks for the whole tree, with the same messages, and trust()
+# records the root in a table of trees that have passed, which the caller
+# keeps for as long as the trees can't change (evaluate() keeps one per run).
+# Nothing is written into the tree, so a copy of it isn't trusted by mistake.
+# evaluate() trusts the tree it is given, and the handlers read nodes without
+# asserting.
+
+# for each tag, the fields holding its children: "node" for one node,
+# "optional" for one that may be missing or None, "nodes" for a list of them
+# and "items" for the key and value nodes of an object
+node_fields = {
+    "number": [],
+    "boolean": [],
+    "string": [],
+    "null": [],
+    "identifier": [],
+    "list": [("items", "nodes")],
+    "object": [("items", "items")],
+    "negate": [("value", "node")],
+    "!": [("value", "node")],
+    "not": [("value", "node")],
+    "print": [("value", "optional")],
+    "assert": [("condition", "node"), ("explanation", "optional")],
+    "if": [("condition", "node"), ("then", "node"), ("else", "optional")],
+    "while": [("condition", "node"), ("do", "node")],
+    "statement_list": [("statements", "nodes")],
+    "program": [("statements", "nodes")],
+    "function": [("parameters", "nodes"), ("body", "node")],
+    "call": [("function", "node"), ("arguments", "nodes")],
+    "complex": [("base", "node"), ("index", "node")],
+    "assign": [("target", "node"), ("value", "node")],
+    "return": [("value", "optional")],
+    "exit": [("value", "optional")],
+    "break": [],
+    "continue": [],
+    "import": [("value", "node")],
+    "forget": [],
+}
+for tag in ["+", "-", "*", "/", "%", "&&", "and", "||", "or", "<", ">", "<=", ">=", "==", "!="]:
+    node_fields[tag] = [("left", "node"), ("right", "node")]
+
+
+def check_number(ast):
+    assert type(ast["value"]) in [float, int], f"unexpected type {type(ast["value"])}"
+
+
+def check_boolean(ast):
+    assert ast["value"] in [True, False], f"unexpected type {type(ast["value"])}"
+
+
+def check_string(ast):
+    assert type(ast["value"]) == str, f"unexpected type {type(ast["value"])}"
+
+
+def check_assign(ast):
+    assert "target" in ast
+    target = ast["target"]
+    assert target["tag"] in ["identifier", "complex"], f"Cannot assign to [{target['tag']}]"
+
+
+# checks of a node's own fields, before its children are validated
+node_checks = {
+    "number": check_number,
+    "boolean": check_boolean,
+    "string": check_string,
+    "assign": check_assign,
+}
+
+
+def validate(ast):
+    """
+    Check that ast and every node in it has a known tag and the fields the
+    evaluator reads, raising AssertionError at the first one that doesn't.
+    """
+    tag = ast["tag"]
+    assert tag in node_fields, f"Unknown tag [{tag}] in AST"
+    if tag in node_checks:
+        node_checks[tag](ast)
+    for field, shape in node_fields[tag]:
+        if shape == "node":
+            validate(ast[field])
+        elif shape == "optional":
+            if ast.get(field) is not None:
+                validate(ast[field])
+        elif shape == "nodes":
+            for item in ast[field]:
+                validate(item)
+        else:
+            for item in ast[field]:
+                validate(item["key"])
+                validate(item["value"])
+
+
+def trust(ast, trusted):
+    """
+    Validate ast unless it is in trusted already, a dict of validated trees by
+    id (holding the trees, so their ids aren't reused), and add it.
+    """
+    if trusted.get(id(ast)) is not ast:
+        validate(ast)
+        trusted[id(ast)] = ast
+    return ast
+
+
+def test_validate():
+    print("testing validate...")
+    validate(parse(tokenize('x = [1, "a", {"b": true}]; function f(y) { if (y) { return } else { exit 2 } }; x[0] = f(null)')))
+    for ast, message in [
+        ({"tag": "number", "value": "1"}, "unexpected type <class 'str'>"),
+        ({"tag": "boolean", "value": None}, "unexpected type <class 'NoneType'>"),
+        ({"tag": "list", "items": [{"tag": "string", "value": 1}]}, "unexpected type <class 'int'>"),
+        ({"tag": "+", "left": {"tag": "null"}, "right": {"tag": "goto"}}, "Unknown tag [goto] in AST"),
+        ({"tag": "assign", "target": {"tag": "number", "value": 1}, "value": {"tag": "null"}}, "Cannot assign to [number]"),
+    ]:
+        try:
+            validate(ast)
+            assert False, f"{ast} should be invalid"
+        except AssertionError as e:
+            assert str(e).startswith(message), str(e)
+
+
+def test_trust():
+    print("testing trust...")
+    ast = parse(tokenize("print 1"))
+    trusted = {}
+    assert trust(ast, trusted) is ast and trusted == {id(ast): ast}
+    assert ast == parse(tokenize("print 1"))
+    # a tree in the table isn't validated again
+    ast["statements"].append({"tag": "goto"})
+    trust(ast, trusted)
+    # but a copy of it is
+    try:
+        trust({**ast}, trusted)
+        assert False, "the copy should be validated"
+    except AssertionError as e:
+        assert str(e).startswith("Unknown tag [goto] in AST"), str(e)
+
+
+if __name__ == "__main__":
+    test_validate()
+    test_trust()
+    print("done.")
@@ -0,0 +1,911 @@
+import marshal
+import sys
+from array import array
+
+from tokenizer import tokenize
+from parser import parse
+import astcache
+from astcache import load_ast, load_compiled, source_digest
+import optimizer
+from evaluator import is_truthy, type_of, ast_to_string, evaluate_builtin_function, array_types, object_types, owned_item, Function, number_types, binary_operation
+from machine import lookup
+from compiler import number_operators
+import copy
+
+# A bytecode compiler and a stack machine to run it.
+#
+# compile_program(ast) lowers a program to a Code object: a flat list of
+# instructions, two numbers each (an opcode and its argument), plus the
+# constants and names the arguments refer to. if, while, break and continue
+# become jumps. A function literal becomes a constant Code object of its own.
+#
+# run(code, environment) executes it with an explicit stack of call frames, so
+# like machine.py it has no Python recursion limit. Values, environments and
+# function values are the same as in evaluator.py, and run() returns the same
+# (value, status).
+
+opcode_names = [
+    "LOAD_CONST",            # push constants[argument]
+    "LOAD_NAME",             # push the value of names[argument]
+    "STORE_NAME",            # store the top of the stack in names[argument], leaving it there
+    "FIND_EXTERN",           # push the nearest environment that has names[argument]
+    "STORE_EXTERN",          # scope, value -> value, storing value in scope[names[argument]]
+    "POP",                   # drop the top of the stack
+    "BINARY",                # left, right -> left <binary_tags[argument]> right
+    "NOT",                   # value -> not is_truthy(value)
+    "NEGATE",                # value -> -value
+    "TRUTH",                 # value -> is_truthy(value)
+    "JUMP",                  # continue at instruction argument
+    "POP_JUMP_IF_FALSE",     # pop a value and jump if it isn't truthy
+    "JUMP_IF_FALSE_OR_POP",  # jump, keeping the value, if it isn't truthy; otherwise pop it
+    "JUMP_IF_TRUE_OR_POP",   # jump, keeping the value, if it is truthy; otherwise pop it
+    "BUILD_LIST",            # argument values -> a list of them
+    "CHECK_KEY",             # check the top of the stack is a string object key
+    "BUILD_OBJECT",          # argument key, value pairs -> an object
+    "INDEX",                 # base, index -> base[index]; constants[argument] is the index AST
+    "CHECK_TARGET",          # check base, index (left on the stack) can be assigned to
+    "STORE_ITEM",            # base, index, value -> value, storing value in base[index]
+    "MAKE_FUNCTION",         # push a function value for the Code in constants[argument]
+    "CALL",                  # function, argument arguments -> the function's return value
+    "RETURN_VALUE",          # return the top of the stack from the current frame
+    "EXIT",                  # stop the program with the top of the stack as exit code
+    "PRINT",                 # print the top of the stack, replacing it with what was printed
+    "PRINT_EMPTY",           # print an empty line and push null
+    "ASSERT_FAIL",           # raise an assertion error for the condition AST constants[argument]
+    "ASSERT_FAIL_EXPLAINED", # the same, with the explanation popped from the stack
+    "RAISE",                 # raise an error with the message constants[argument]
+    "IMPORT",                # filename -> the value of running that file in this environment
+    "DELETE_NAME",           # remove names[argument] from the environment, if it is there
+]
+for opcode, opcode_name in enumerate(opcode_names):
+    globals()[opcode_name] = opcode
+
+binary_tags = ["+", "-", "*", "/", "%", "<", ">", "<=", ">=", "==", "!="]
+# for each of binary_tags, the Python operator for two numbers, if it is one
+number_operations = [number_operators.get(tag) for tag in binary_tags]
+
+# changes whenever the instruction set, the compiler or the AST changes
+bytecode_stamp = source_digest([sys.modules[__name__], optimizer]) + astcache.version_stamp
+
+
+class Code:
+    """
+    Compiled code for a program or a function body.
+    For a function, parameters and body are its AST, for the function values
+    made from it, and compiled is what those values share as theirs.
+    """
+
+    __slots__ = ("name", "instructions", "constants", "names", "parameters", "body", "compiled")
+
+    def __init__(self, name, parameters=None, body=None):
+        self.name = name
+        self.instructions = []
+        self.constants = []
+        self.names = []
+        self.parameters = parameters
+        self.body = body
+        self.compiled = {"vm": self}
+
+    def __repr__(self):
+        return f"<code {self.name}>"
+
+
+class CodeBuilder:
+    """
+    The code being compiled, with what the compiler needs to know about where it is.
+    """
+
+    __slots__ = ("code", "constant_indexes", "name_indexes", "in_function", "loops")
+
+    def __init__(self, code, in_function):
+        self.code = code
+        self.constant_indexes = {}
+        self.name_indexes = {}
+        self.in_function = in_function
+        # for each enclosing loop: (start, list of break jumps to patch)
+        self.loops = []
+
+    def emit(self, opcode, argument=0):
+        """add an instruction, returning its position"""
+        position = len(self.code.instructions)
+        self.code.instructions += [opcode, argument]
+        return position
+
+    def here(self):
+        return len(self.code.instructions)
+
+    def patch(self, position, target):
+        self.code.instructions[position + 1] = target
+
+    def constant(self, value):
+        # 1, 1.0 and true are equal as dict keys, so the type is part of the key
+        key = (type(value), value) if type(value) in [int, float, bool, str, type(None)] else id(value)
+        if key not in self.constant_indexes:
+            self.constant_indexes[key] = len(self.code.constants)
+            self.code.constants.append(value)
+        return self.constant_indexes[key]
+
+    def name(self, name):
+        if name not in self.name_indexes:
+            self.name_indexes[name] = len(self.code.names)
+            self.code.names.append(name)
+        return self.name_indexes[name]
+
+
+# COMPILER
+
+
+def compile_literal(ast, builder):
+    builder.emit(LOAD_CONST, builder.constant(ast["value"]))
+
+
+def compile_null(ast, builder):
+    builder.emit(LOAD_CONST, builder.constant(None))
+
+
+def compile_identifier(ast, builder):
+    builder.emit(LOAD_NAME, builder.name(ast["value"]))
+
+
+def compile_list(ast, builder):
+    for item in ast["items"]:
+        compile_node(item, builder)
+    builder.emit(BUILD_LIST, len(ast["items"]))
+
+
+def compile_object(ast, builder):
+    for item in ast["items"]:
+        compile_node(item["key"], builder)
+        builder.emit(CHECK_KEY)
+        compile_node(item["value"], builder)
+    builder.emit(BUILD_OBJECT, len(ast["items"]))
+
+
+def compile_binary(ast, builder):
+    compile_node(ast["left"], builder)
+    compile_node(ast["right"], builder)
+    builder.emit(BINARY, binary_tags.index(ast["tag"]))
+
+
+def compile_and(ast, builder):
+    compile_node(ast["left"], builder)
+    jump = builder.emit(JUMP_IF_FALSE_OR_POP)
+    compile_node(ast["right"], builder)
+    builder.emit(TRUTH)
+    builder.patch(jump, builder.here())
+
+
+def compile_or(ast, builder):
+    compile_node(ast["left"], builder)
+    jump = builder.emit(JUMP_IF_TRUE_OR_POP)
+    compile_node(ast["right"], builder)
+    builder.emit(TRUTH)
+    builder.patch(jump, builder.here())
+
+
+def compile_negation(ast, builder):
+    compile_node(ast["value"], builder)
+    builder.emit(NEGATE)
+
+
+def compile_not(ast, builder):
+    compile_node(ast["value"], builder)
+    builder.emit(NOT)
+
+
+def compile_print(ast, builder):
+    if ast["value"]:
+        compile_node(ast["value"], builder)
+        builder.emit(PRINT)
+    else:
+        builder.emit(PRINT_EMPTY)
+
+
+def compile_assert(ast, builder):
+    if ast["condition"]:
+        compile_node(ast["condition"], builder)
+        jump = builder.emit(POP_JUMP_IF_FALSE)
+        passed = builder.emit(JUMP)
+        builder.patch(jump, builder.here())
+        if "explanation" in ast and ast["explanation"]:
+            compile_node(ast["explanation"], builder)
+            builder.emit(ASSERT_FAIL_EXPLAINED, builder.constant(ast["condition"]))
+        else:
+            builder.emit(ASSERT_FAIL, builder.constant(ast["condition"]))
+        builder.patch(passed, builder.here())
+    builder.emit(LOAD_CONST, builder.constant(None))
+
+
+def compile_block(ast, builder):
+    """a statement list that leaves nothing on the stack"""
+    for statement in ast["statements"]:
+        compile_node(statement, builder)
+        builder.emit(POP)
+
+
+def compile_if(ast, builder):
+    compile_node(ast["condition"], builder)
+    jump = builder.emit(POP_JUMP_IF_FALSE)
+    compile_node(ast["then"], builder)
+    if "else" in ast:
+        done = builder.emit(JUMP)
+        builder.patch(jump, builder.here())
+        compile_node(ast["else"], builder)
+        builder.patch(done, builder.here())
+    else:
+        builder.patch(jump, builder.here())
+    builder.emit(LOAD_CONST, builder.constant(None))
+
+
+def compile_while(ast, builder):
+    start = builder.here()
+    compile_node(ast["condition"], builder)
+    jump = builder.emit(POP_JUMP_IF_FALSE)
+    builder.loops.append((start, []))
+    compile_node(ast["do"], builder)
+    builder.emit(JUMP, start)
+    start, breaks = builder.loops.pop()
+    for position in breaks + [jump]:
+        builder.patch(position, builder.here())
+    builder.emit(LOAD_CONST, builder.constant(None))
+
+
+def compile_break(ast, builder):
+    if builder.loops:
+        builder.loops[-1][1].append(builder.emit(JUMP))
+    else:
+        compile_misplaced(ast["tag"], builder)
+
+
+def compile_continue(ast, builder):
+    if builder.loops:
+        builder.emit(JUMP, builder.loops[-1][0])
+    else:
+        compile_misplaced(ast["tag"], builder)
+
+
+def compile_misplaced(tag, builder):
+    """break or continue outside of any loop, which is an error when it runs"""
+    if builder.in_function:
+        message = f"'{tag}' statement propagated out of function call."
+    else:
+        message = f"'{tag}' statement outside of loop."
+    builder.emit(RAISE, builder.constant(message))
+
+
+def compile_return(ast, builder):
+    if "value" in ast and ast["value"] is not None:
+        compile_node(ast["value"], builder)
+    else:
+        builder.emit(LOAD_CONST, builder.constant(None))
+    if builder.in_function:
+        builder.emit(RETURN_VALUE)
+    else:
+        builder.emit(RAISE, builder.constant("'return' statement outside of function."))
+
+
+def compile_exit(ast, builder):
+    if "value" in ast and ast["value"] is not None:
+        compile_node(ast["value"], builder)
+    else:
+        builder.emit(LOAD_CONST, builder.constant(0))
+    builder.emit(EXIT)
+
+
+def compile_function(ast, builder):
+    code = compile_function_body(ast["parameters"], ast["body"])
+    builder.emit(MAKE_FUNCTION, builder.constant(code))
+
+
+def compile_call(ast, builder):
+    compile_node(ast["function"], builder)
+    for argument in ast["arguments"]:
+        compile_node(argument, builder)
+    builder.emit(CALL, len(ast["arguments"]))
+
+
+def compile_complex(ast, builder):
+    compile_node(ast["base"], builder)
+    compile_node(ast["index"], builder)
+    builder.emit(INDEX, builder.constant(ast["index"]))
+
+
+def compile_assign(ast, builder):
+    target = ast["target"]
+    if target["tag"] == "identifier":
+        name = builder.name(target["value"])
+        if target.get("extern"):
+            # the scope is found before the value is evaluated, as in evaluator.py
+            builder.emit(FIND_EXTERN, name)
+            compile_node(ast["value"], builder)
+            builder.emit(STORE_EXTERN, name)
+        else:
+            compile_node(ast["value"], builder)
+            builder.emit(STORE_NAME, name)
+        return
+    assert target["tag"] == "complex", f"Cannot assign to [{target['tag']}]"
+    compile_node(target["base"], builder)
+    compile_node(target["index"], builder)
+    builder.emit(CHECK_TARGET)
+    compile_node(ast["value"], builder)
+    builder.emit(STORE_ITEM)
+
+
+def compile_forget(ast, builder):
+    for name in ast["names"]:
+        builder.emit(DELETE_NAME, builder.name(name))
+    builder.emit(LOAD_CONST, builder.constant(None))
+
+
+def compile_import(ast, builder):
+    compile_node(ast["value"], builder)
+    builder.emit(IMPORT)
+
+
+def compile_statement_list(ast, builder):
+    compile_block(ast, builder)
+
+
+compilers = {
+    "number": compile_literal,
+    "boolean": compile_literal,
+    "string": compile_literal,
+    "null": compile_null,
+    "list": compile_list,
+    "object": compile_object,
+    "identifier": compile_identifier,
+    "negate": compile_negation,
+    "&&": compile_and,
+    "and": compile_and,
+    "||": compile_or,
+    "or": compile_or,
+    "!": compile_not,
+    "not": compile_not,
+    "print": compile_print,
+    "assert": compile_assert,
+    "if": compile_if,
+    "while": compile_while,
+    "statement_list": compile_statement_list,
+    "function": compile_function,
+    "call": compile_call,
+    "complex": compile_complex,
+    "assign": compile_assign,
+    "return": compile_return,
+    "exit": compile_exit,
+    "break": compile_break,
+    "continue": compile_continue,
+    "import": compile_import,
+    "forget": compile_forget,
+}
+for tag in binary_tags:
+    compilers[tag] = compile_binary
+
+
+def compile_node(ast, builder):
+    compiler = compilers.get(ast["tag"])
+    assert compiler, f"Unknown tag [{ast['tag']}] in AST"
+    compiler(ast, builder)
+
+
+def compile_function_body(parameters, body):
+    code = Code("function", parameters, body)
+    builder = CodeBuilder(code, in_function=True)
+    compile_node(body, builder)
+    builder.emit(LOAD_CONST, builder.constant(None))
+    builder.emit(RETURN_VALUE)
+    return code
+
+
+def compile_program(ast):
+    """
+    Compile a program AST to a Code object, which returns the value of the
+    last statement.
+    """
+    assert ast["tag"] == "program", f"Expected a program, not [{ast['tag']}]"
+    code = Code("program")
+    builder = CodeBuilder(code, in_function=False)
+    builder.emit(LOAD_CONST, builder.constant(None))
+    for statement in ast["statements"]:
+        builder.emit(POP)
+        compile_node(statement, builder)
+    builder.emit(RETURN_VALUE)
+    return code
+
+
+# SERIALIZATION
+
+bytecode_version = 2
+
+
+def code_to_tuple(code):
+    """
+    Code as nested tuples and bytes, which marshal can store.
+    A tuple in the constants is a nested Code.
+    """
+    return (
+        code.name,
+        array("i", code.instructions).tobytes(),
+        tuple(code_to_tuple(c) if type(c) is Code else c for c in code.constants),
+        tuple(code.names),
+        code.parameters,
+        code.body,
+    )
+
+
+def code_from_tuple(data):
+    name, instructions, constants, names, parameters, body = data
+    code = Code(name, parameters, body)
+    code.instructions = array("i", instructions).tolist()
+    code.constants = [code_from_tuple(c) if type(c) is tuple else c for c in constants]
+    code.names = list(names)
+    return code
+
+
+def dumps(code):
+    return marshal.dumps((bytecode_version, code_to_tuple(code)))
+
+
+def loads(data):
+    version, code = marshal.loads(data)
+    assert version == bytecode_version, f"Bytecode version {version} is not {bytecode_version}"
+    return code_from_tuple(code)
+
+
+def load_code(path, hoist=False):
+    """
+    Compile the script at path, with its constants folded and propagated (and
+    its loop invariants hoisted, if hoist is True), or load its code from the
+    __pycache__ directory when the script hasn't changed since it was last
+    compiled the same way.
+    """
+    kind = "vm-hoisted" if hoist else "vm"
+    data = load_compiled(
+        path, kind, bytecode_stamp, lambda ast: code_to_tuple(compile_program(optimizer.optimize(ast, hoist=hoist)[0]))
+    )
+    return code_from_tuple(data)
+
+
+# DISASSEMBLER
+
+
+def describe_argument(code, opcode, argument):
+    if opcode in [LOAD_CONST, MAKE_FUNCTION, RAISE]:
+        return repr(code.constants[argument])
+    if opcode in [INDEX, ASSERT_FAIL, ASSERT_FAIL_EXPLAINED]:
+        return ast_to_string(code.constants[argument])
+    if opcode in [LOAD_NAME, STORE_NAME, FIND_EXTERN, STORE_EXTERN, DELETE_NAME]:
+        return code.names[argument]
+    if opcode == BINARY:
+        return binary_tags[argument]
+    return ""
+
+
+def disassemble(code):
+    """
+    A readable listing of code and of the functions defined in it.
+    """
+    lines = [f"{code.name}:"]
+    if code.parameters is not None:
+        lines[0] = f"{code.name}({', '.join(p['value'] for p in code.parameters)}):"
+    instructions = code.instructions
+    for position in range(0, len(instructions), 2):
+        opcode, argument = instructions[position], instructions[position + 1]
+        description = describe_argument(code, opcode, argument)
+        if description:
+            description = f" ({description})"
+        lines.append(f"{position:6} {opcode_names[opcode]:22} {argument}{description}")
+    for constant in code.constants:
+        if type(constant) is Code:
+            lines.append("")
+            lines.append(disassemble(constant))
+    return "\n".join(lines)
+
+
+# VIRTUAL MACHINE
+
+def function_code(function):
+    """
+    The Code for the body of a function value: the one it was made from, or,
+    for a value another engine made, compiled the first time it is called.
+    """
+    if type(function) is not Function:
+        return compile_function_body(function["parameters"], function["body"])
+    if function.compiled is None:
+        function.compiled = {}
+    code = function.compiled.get("vm")
+    if code is None:
+        code = function.compiled["vm"] = compile_function_body(function["parameters"], function["body"])
+    return code
+
+
+def check_target(base, index):
+    if index is None: raise Exception("Cannot use 'null' as index for assignment.")
+    assert type(index) in [int, float, str], f"Unknown index type [{index}]"
+    if isinstance(base, array_types):
+        assert isinstance(index, int), "List index must be integer"
+        assert 0 <= index < len(base), "List index out of range"
+    elif not isinstance(base, dict):
+        assert False, f"Cannot assign to base of type {type(base)}"
+
+
+def index_value(base, index, index_ast):
+    if index is None:
+        raise Exception(f"TypeError: Cannot index with 'null'. Base: {base}, Index AST: {ast_to_string(index_ast)}")
+    if type(index) in [int, float]:
+        assert int(index) == index
+        assert type(base) in array_types
+        if not (0 <= index < len(base)): raise IndexError("List index out of range")
+        return owned_item(base, index)
+    if type(index) == str:
+        assert type(base) in object_types
+        if index not in base: raise KeyError(f"Key '{index}' not found in object")
+        return owned_item(base, index)
+    assert False, f"Unknown index type [{index}]"
+
+
+def run(code, environment):
+    """
+    Run a program's code in environment, returning (value, status) like evaluator.evaluate.
+    """
+    # the suspended callers: (code, position, environment, stack, imported filename or None)
+    frames = []
+    importing = None
+    instructions = code.instructions
+    constants = code.constants
+    names = code.names
+    stack = []
+    position = 0
+    try:
+        while True:
+            opcode = instructions[position]
+            argument = instructions[position + 1]
+            position += 2
+            if opcode == LOAD_NAME:
+                name = names[argument]
+                if name in environment:
+                    stack.append(environment[name])
+                else:
+                    stack.append(lookup(name, environment))
+            elif opcode == LOAD_CONST:
+                stack.append(constants[argument])
+            elif opcode == BINARY:
+                right = stack.pop()
+                left = stack[-1]
+                number_operation = number_operations[argument]
+                if number_operation and type(left) in number_types and type(right) in number_types:
+                    stack[-1] = number_operation(left, right)
+                else:
+                    stack[-1] = binary_operation(binary_tags[argument], left, right)
+            elif opcode == STORE_NAME:
+                environment[names[argument]] = stack[-1]
+            elif opcode == POP:
+                stack.pop()
+            elif opcode == POP_JUMP_IF_FALSE:
+                if not is_truthy(stack.pop()):
+                    position = argument
+            elif opcode == JUMP:
+                position = argument
+            elif opcode == CALL:
+                arguments = stack[len(stack) - argument:]
+                del stack[len(stack) - argument:]
+                function = stack.pop()
+                if function.get("tag") == "builtin":
+                    stack.append(evaluate_builtin_function(function["name"], arguments)[0])
+                    continue
+                frames.append((code, position, environment, stack, importing))
+                environment = {
+                    name["value"]: value
+                    for name, value in zip(function["parameters"], arguments)
+                }
+                environment["$parent"] = function["environment"]
+                code = function_code(function)
+                instructions, constants, names = code.instructions, code.constants, code.names
+                stack = []
+                position = 0
+                importing = None
+            elif opcode == RETURN_VALUE:
+                value = stack.pop()
+                if not frames:
+                    return value, None
+                code, position, environment, stack, importing = frames.pop()
+                instructions, constants, names = code.instructions, code.constants, code.names
+                stack.append(value)
+            elif opcode == INDEX:
+                index = stack.pop()
+                stack[-1] = index_value(stack[-1], index, constants[argument])
+            elif opcode == NOT:
+                stack[-1] = not is_truthy(stack[-1])
+            elif opcode == NEGATE:
+                types = type_of(stack[-1])
+                if types != "number":
+                    raise Exception(f"Illegal type for negate:{types}")
+                stack[-1] = -stack[-1]
+            elif opcode == TRUTH:
+                stack[-1] = is_truthy(stack[-1])
+            elif opcode == JUMP_IF_FALSE_OR_POP:
+                if is_truthy(stack[-1]):
+                    stack.pop()
+                else:
+                    position = argument
+            elif opcode == JUMP_IF_TRUE_OR_POP:
+                if is_truthy(stack[-1]):
+                    position = argument
+                else:
+                    stack.pop()
+            elif opcode == PRINT:
+                value = stack[-1]
+                if type(value) is bool:
+                    value = "true" if value else "false"
+                print(str(value))
+                stack[-1] = str(value)
+            elif opcode == PRINT_EMPTY:
+                print()
+                stack.append(None)
+            elif opcode == BUILD_LIST:
+                items = stack[len(stack) - argument:]
+                del stack[len(stack) - argument:]
+                stack.append(items)
+            elif opcode == CHECK_KEY:
+                assert type(stack[-1]) is str, "Object key must be a string"
+            elif opcode == BUILD_OBJECT:
+                items = stack[len(stack) - 2 * argument:]
+                del stack[len(stack) - 2 * argument:]
+                stack.append(dict(zip(items[0::2], items[1::2])))
+            elif opcode == CHECK_TARGET:
+                check_target(stack[-2], stack[-1])
+            elif opcode == STORE_ITEM:
+                value = stack.pop()
+                index = stack.pop()
+                stack[-1][index] = value
+                stack[-1] = value
+            elif opcode == FIND_EXTERN:
+                name = names[argument]
+                scope = environment
+                while scope is not None and name not in scope:
+                    scope = scope.get("$parent")
+                assert scope is not None, f"Extern assignment: '{name}' not found in any outer scope"
+                stack.append(scope)
+            elif opcode == STORE_EXTERN:
+                value = stack.pop()
+                stack[-1][names[argument]] = value
+                stack[-1] = value
+            elif opcode == MAKE_FUNCTION:
+                function = constants[argument]
+                stack.append(Function(function.parameters, function.body, environment, function.compiled))
+            elif opcode == EXIT:
+                value = stack.pop()
+                assert isinstance(value, int), "Exit code must be an integer."
+                return value, "exit"
+            elif opcode == ASSERT_FAIL:
+                raise Exception(f"Assertion failed: {ast_to_string(constants[argument])}")
+            elif opcode == ASSERT_FAIL_EXPLAINED:
+                explanation = stack.pop()
+                raise Exception(f"Assertion failed: {ast_to_string(constants[argument])} ({explanation})")
+            elif opcode == RAISE:
+                raise Exception(constants[argument])
+            elif opcode == IMPORT:
+                filename = stack.pop()
+                assert isinstance(filename, str), "Import path must be a string."
+                try:
+                    imported_code = compile_program(load_ast(filename))
+                except FileNotFoundError:
+                    raise Exception(f"ImportError: File not found '{filename}'")
+                except Exception as e:
+                    raise Exception(f"Error during import of '{filename}': {e}")
+                # the imported program runs in this environment, in a frame of its own
+                frames.append((code, position, environment, stack, importing))
+                code = imported_code
+                instructions, constants, names = code.instructions, code.constants, code.names
+                stack = []
+                position = 0
+                importing = filename
+            elif opcode == DELETE_NAME:
+                environment.pop(names[argument], None)
+            else:
+                assert False, f"Unknown opcode [{opcode}]"
+    except Exception as e:
+        # wrap the error once for each import it happened in, innermost first
+        for filename in [importing] + [frame[4] for frame in reversed(frames)]:
+            if filename is not None:
+                e = Exception(f"Error during import of '{filename}': {e}")
+        raise e
+
+
+def evaluate(ast, environment):
+    """
+    Compile a program ast and run it in environment, returning (value, status)
+    like evaluator.evaluate.
+    """
+    return run(compile_program(ast), environment)
+
+
+def same_as_evaluator(code, environment=None):
+    import evaluator
+
+    expected_environment = {} if environment is None else copy.deepcopy(environment)
+    environment = {} if environment is None else environment
+    expected = evaluator.evaluate(parse(tokenize(code)), expected_environment)
+    result = evaluate(parse(tokenize(code)), environment)
+    assert result == expected, f"{code}: got {result}, expected {expected}"
+    return result
+
+
+def test_expressions():
+    print("testing expressions...")
+    for code in [
+        "4", "4.2", '"x"', "null", "true", "1+2*3", "(3+2)*2", "8/4/2", "7%3", "--3",
+        '"a"+"b"', '"ab"*2', "[1,2]+[3]", '{"a":1}+{"b":2}', "1<2", "2>=3", "1==1", "1!=1",
+        "!0", "0 && x", "1 || x", "1 && 2", "0 || 0", "1 && 0",
+        "[1,[2,3]][1][0]", '{"a":{"b":4}}.a.b', "[]", "{}",
+        "head([1,2,3])", "tail([1,2,3])", "length(\"hello\")", 'keys({"a":1})',
+    ]:
+        same_as_evaluator(code)
+    assert evaluate(parse(tokenize("x + y")), {"x": 1, "$parent": {"y": 2}}) == (3, None)
+
+
+def test_statements():
+    print("testing statements...")
+    for code in [
+        "",
+        "x=1; while(x<5) {x=x+1}; y=3",
+        "if(0) {x=1} else {x=2}",
+        "if(1) {x=1}",
+        "if(0) {x=1} else if (1) {x=3}",
+        "x=0; while(1) {x=x+1; if(x>3){break}}; x",
+        "x=0; y=0; while(x<5) {x=x+1; if(x%2){continue}; y=y+x}; y",
+        "i=0; n=0; while(i<3) {i=i+1; j=0; while(1) {j=j+1; if(j>i){break}; n=n+1}}; n",
+        "a=[1,2,3]; a[1]=5; a",
+        'o={"a":1}; o.b=2; o["c"]=3; o',
+        "a=b=4",
+        "print 1+1",
+        "print",
+        "assert 1",
+        "exit 12",
+        "exit",
+        "if(1){exit 3}; print 4",
+    ]:
+        same_as_evaluator(code)
+
+
+def test_functions():
+    print("testing functions...")
+    for code in [
+        "function f(x) { if (x > 1) { return 123 }; return 2+2 }; f(7) + f(0)",
+        "function f() { return }; f()",
+        "function f() { 1 }; f()",
+        "x = 1; function f() { extern x = 2 }; f(); x",
+        "x = 1; foo = function() { return x }; bar = function() { x = 2; return foo() }; bar()",
+        """
+        function makeCounter() {
+            count = 0;
+            return function() { extern count = count + 1; return count }
+        };
+        c1 = makeCounter(); c2 = makeCounter();
+        [c1(), c1(), c2(), c1()]
+        """,
+        "function f() { while(1) { return 5 } }; f()",
+        "function f() { exit 7 }; f(); print 1",
+        "function fib(n) { if (n < 2) { return n }; return fib(n-1) + fib(n-2) }; fib(15)",
+    ]:
+        same_as_evaluator(code)
+    # a function value is the same dict the tree evaluator makes
+    environment = {}
+    evaluate(parse(tokenize("function f(x) { 1 }")), environment)
+    assert environment["f"]["body"] == {"tag": "statement_list", "statements": [{"tag": "number", "value": 1}]}
+    assert environment["f"]["environment"] is environment
+    # its code comes with it, shared by the values made from one literal
+    evaluate(parse(tokenize("function g() { return function() { 1 } }; h = g(); k = g()")), environment)
+    assert environment["h"].compiled is environment["k"].compiled
+    assert environment["h"].compiled["vm"].body is environment["h"]["body"]
+    # a value made by another engine keeps the code it is compiled to when called
+    import evaluator
+
+    evaluator.evaluate(parse(tokenize("function twice(x) { return x * 2 }")), environment)
+    assert evaluate(parse(tokenize("twice(4) + twice(5)")), environment) == (18, None)
+    assert list(environment["twice"].compiled) == ["vm"]
+
+
+def test_errors():
+    print("testing errors...")
+    for code, message in [
+        ("return 1", "'return' statement outside of function"),
+        ("break", "'break' statement outside of loop"),
+        ("if(true){ return 1 }", "'return' statement outside of function"),
+        ("function f() { break }; f()", "'break' statement propagated out of function call"),
+        ("function f() { continue }; while(1) { f() }", "'continue' statement propagated out of function call"),
+        ("y", "Unknown identifier: 'y'"),
+        ("1 - \"a\"", "Illegal types for -:number-string"),
+        ("-\"a\"", "Illegal type for negate:string"),
+        ("assert 1 == 2, \"nope\"", "Assertion failed: (1==2) (nope)"),
+        ("assert 1 == 2", "Assertion failed: (1==2)"),
+        ("extern z = 1", "Extern assignment: 'z' not found in any outer scope"),
+        ("x = [1]; x[null] = 2", "Cannot use 'null' as index for assignment."),
+        ('import "no such file.t"', "ImportError: File not found 'no such file.t'"),
+    ]:
+        try:
+            evaluate(parse(tokenize(code)), {})
+            assert False, f"{code} should fail"
+        except Exception as e:
+            assert message in str(e), f"{code}: {e}"
+
+
+def test_import():
+    print("testing import...")
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "library.t")
+        with open(path, "w") as f:
+            f.write("function double(x) { return x + x }; y = oops")
+        environment = {}
+        try:
+            evaluate(parse(tokenize(f'import "{path}"')), environment)
+            assert False, "import should fail"
+        except Exception as e:
+            assert str(e) == f"Error during import of '{path}': Unknown identifier: 'oops'"
+        assert "double" in environment
+        with open(path, "w") as f:
+            f.write("function double(x) { return x + x }; 5")
+        same_as_evaluator(f'import "{path}"')
+        same_as_evaluator(f'import "{path}"; double(4)')
+
+
+def test_deep_recursion():
+    print("testing deep recursion...")
+    depth = sys.getrecursionlimit() * 10
+    code = f"""
+        function count(n) {{ if (n == 0) {{ return 0 }}; return 1 + count(n - 1) }};
+        count({depth})
+    """
+    assert evaluate(parse(tokenize(code)), {}) == (depth, None)
+
+
+def test_serialization():
+    print("testing serialization...")
+    import os
+    import tempfile
+
+    source = "function f(x) { if (x > 1) { return x * f(x - 1) }; return 1 }; print f(5); assert f(3) == 6"
+    code = compile_program(parse(tokenize(source)))
+    copied = loads(dumps(code))
+    assert disassemble(copied) == disassemble(code)
+    assert run(copied, {}) == run(code, {})
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "program.t")
+        with open(path, "w") as f:
+            f.write(source)
+        assert disassemble(load_code(path)) == disassemble(code)
+        assert os.path.exists(astcache.cache_path(path, "vm"))
+        assert disassemble(load_code(path)) == disassemble(code)
+        # code with its loop invariants hoisted is cached apart
+        with open(path, "w") as f:
+            f.write("i = 0; while (i < n * 2) { i = i + 1 }")
+        assert "$invariant_1" not in disassemble(load_code(path))
+        assert "$invariant_1" in disassemble(load_code(path, hoist=True))
+        assert "$invariant_1" not in disassemble(load_code(path))
+
+
+def test_disassemble():
+    print("testing disassemble...")
+    listing = disassemble(compile_program(parse(tokenize("x = 0; while (x < 3) { x = x + 1 }"))))
+    assert listing.splitlines()[:5] == [
+        "program:",
+        "     0 LOAD_CONST             0 (None)",
+        "     2 POP                    0",
+        "     4 LOAD_CONST             1 (0)",
+        "     6 STORE_NAME             0 (x)",
+    ]
+    assert "POP_JUMP_IF_FALSE" in listing and "(<)" in listing
+
+
+if __name__ == "__main__":
+    test_expressions()
+    test_statements()
+    test_functions()
+    test_errors()
+    test_import()
+    test_deep_recursion()
+    test_serialization()
+    test_disassemble()
+    print("done.")